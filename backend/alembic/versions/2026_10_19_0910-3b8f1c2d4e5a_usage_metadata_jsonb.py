@@ -0,0 +1,36 @@
+"""Usage metric metadata as JSONB
+
+Revision ID: 3b8f1c2d4e5a
+Revises: d67c6eb29b40
+Create Date: 2026-10-19 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '3b8f1c2d4e5a'
+down_revision = 'd67c6eb29b40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.alter_column('usage_metrics', 'metric_metadata',
+               existing_type=sa.String(),
+               type_=postgresql.JSONB(astext_type=sa.Text()),
+               existing_nullable=True,
+               postgresql_using='metric_metadata::jsonb')
+    op.create_index('ix_usage_metrics_metric_metadata', 'usage_metrics', ['metric_metadata'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'metric_metadata': 'jsonb_path_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_usage_metrics_metric_metadata', table_name='usage_metrics',
+                  postgresql_using='gin')
+    op.alter_column('usage_metrics', 'metric_metadata',
+               existing_type=postgresql.JSONB(astext_type=sa.Text()),
+               type_=sa.String(),
+               existing_nullable=True,
+               postgresql_using='metric_metadata::text')
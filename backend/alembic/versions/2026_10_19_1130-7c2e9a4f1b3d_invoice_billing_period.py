@@ -0,0 +1,31 @@
+"""Invoice billing period with one invoice per subscription period
+
+Also indexes usage_metrics by (tenant_id, period_start) for period usage totals.
+
+Revision ID: 7c2e9a4f1b3d
+Revises: 3b8f1c2d4e5a
+Create Date: 2026-10-19 11:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '7c2e9a4f1b3d'
+down_revision = '3b8f1c2d4e5a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('invoices', sa.Column('period_start', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('invoices', sa.Column('period_end', sa.DateTime(timezone=True), nullable=True))
+    op.create_unique_constraint('uq_invoices_subscription_period', 'invoices', ['subscription_id', 'period_start'])
+    op.create_index('ix_usage_metrics_tenant_period', 'usage_metrics', ['tenant_id', 'period_start'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_usage_metrics_tenant_period', table_name='usage_metrics')
+    op.drop_constraint('uq_invoices_subscription_period', 'invoices', type_='unique')
+    op.drop_column('invoices', 'period_end')
+    op.drop_column('invoices', 'period_start')
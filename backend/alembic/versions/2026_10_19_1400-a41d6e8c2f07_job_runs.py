@@ -0,0 +1,44 @@
+"""Job runs for checkpointed batch tasks
+
+Revision ID: a41d6e8c2f07
+Revises: 7c2e9a4f1b3d
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'a41d6e8c2f07'
+down_revision = '7c2e9a4f1b3d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('job_runs',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('job_name', sa.String(length=100), nullable=False),
+    sa.Column('run_key', sa.String(length=100), nullable=False),
+    sa.Column('status', sa.Enum('RUNNING', 'COMPLETED', 'FAILED', name='jobrunstatus'), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('fencing_token', sa.Integer(), nullable=True),
+    sa.Column('cursor', sa.String(length=255), nullable=True),
+    sa.Column('processed', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=True),
+    sa.Column('chunks', sa.Integer(), nullable=False),
+    sa.Column('counts', sa.JSON(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('started_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('job_name', 'run_key', name='uq_job_runs_job_name_run_key')
+    )
+    op.create_index(op.f('ix_job_runs_status'), 'job_runs', ['status'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_job_runs_status'), table_name='job_runs')
+    op.drop_table('job_runs')
+    sa.Enum(name='jobrunstatus').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,48 @@
+"""Dunning attempts queue for failed payment retries
+
+Revision ID: 5e9b2c7a1d48
+Revises: a41d6e8c2f07
+Create Date: 2026-10-19 15:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5e9b2c7a1d48'
+down_revision = 'a41d6e8c2f07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('dunning_attempts',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('tenant_id', sa.UUID(), nullable=False),
+    sa.Column('invoice_id', sa.UUID(), nullable=False),
+    sa.Column('subscription_id', sa.UUID(), nullable=True),
+    sa.Column('status', sa.Enum('SCHEDULED', 'SUCCEEDED', 'EXHAUSTED', 'CANCELED', name='dunningstatus'), nullable=False),
+    sa.Column('attempt_count', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('last_attempt_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['invoice_id'], ['invoices.id'], ),
+    sa.ForeignKeyConstraint(['subscription_id'], ['subscriptions.id'], ),
+    sa.ForeignKeyConstraint(['tenant_id'], ['tenants.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('invoice_id')
+    )
+    op.create_index(op.f('ix_dunning_attempts_tenant_id'), 'dunning_attempts', ['tenant_id'], unique=False)
+    op.create_index(op.f('ix_dunning_attempts_subscription_id'), 'dunning_attempts', ['subscription_id'], unique=False)
+    op.create_index('ix_dunning_attempts_next_attempt_at', 'dunning_attempts', ['next_attempt_at'], unique=False,
+                    postgresql_where=sa.text("status = 'SCHEDULED'"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_dunning_attempts_next_attempt_at', table_name='dunning_attempts')
+    op.drop_index(op.f('ix_dunning_attempts_subscription_id'), table_name='dunning_attempts')
+    op.drop_index(op.f('ix_dunning_attempts_tenant_id'), table_name='dunning_attempts')
+    op.drop_table('dunning_attempts')
+    sa.Enum(name='dunningstatus').drop(op.get_bind(), checkfirst=True)
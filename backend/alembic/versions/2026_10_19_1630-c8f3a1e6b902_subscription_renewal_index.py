@@ -0,0 +1,24 @@
+"""Partial index on active subscriptions by period end for the renewal tick
+
+Revision ID: c8f3a1e6b902
+Revises: 5e9b2c7a1d48
+Create Date: 2026-10-19 16:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'c8f3a1e6b902'
+down_revision = '5e9b2c7a1d48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_subscriptions_renewal_due', 'subscriptions', ['current_period_end'], unique=False,
+                    postgresql_where=sa.text("status = 'ACTIVE'"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_subscriptions_renewal_due', table_name='subscriptions')
@@ -0,0 +1,25 @@
+"""Stripe subscription item and price ids on subscriptions
+
+Revision ID: 3d7a9f1c5e24
+Revises: c8f3a1e6b902
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '3d7a9f1c5e24'
+down_revision = 'c8f3a1e6b902'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('subscriptions', sa.Column('stripe_subscription_item_id', sa.String(length=255), nullable=True))
+    op.add_column('subscriptions', sa.Column('stripe_price_id', sa.String(length=255), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('subscriptions', 'stripe_price_id')
+    op.drop_column('subscriptions', 'stripe_subscription_item_id')
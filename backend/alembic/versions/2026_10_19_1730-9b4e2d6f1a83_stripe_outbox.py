@@ -0,0 +1,48 @@
+"""Transactional outbox for Stripe side effects
+
+Revision ID: 9b4e2d6f1a83
+Revises: 3d7a9f1c5e24
+Create Date: 2026-10-19 17:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '9b4e2d6f1a83'
+down_revision = '3d7a9f1c5e24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('stripe_outbox',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('tenant_id', sa.UUID(), nullable=False),
+    sa.Column('subscription_id', sa.UUID(), nullable=True),
+    sa.Column('operation', sa.String(length=50), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('status', sa.Enum('PENDING', 'PROCESSING', 'SUCCEEDED', 'FAILED', name='operationstatus'), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('result', sa.JSON(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('completed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['subscription_id'], ['subscriptions.id'], ),
+    sa.ForeignKeyConstraint(['tenant_id'], ['tenants.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_stripe_outbox_tenant_id'), 'stripe_outbox', ['tenant_id'], unique=False)
+    op.create_index(op.f('ix_stripe_outbox_subscription_id'), 'stripe_outbox', ['subscription_id'], unique=False)
+    op.create_index('ix_stripe_outbox_next_attempt_at', 'stripe_outbox', ['next_attempt_at'], unique=False,
+                    postgresql_where=sa.text("status IN ('PENDING', 'PROCESSING')"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_stripe_outbox_next_attempt_at', table_name='stripe_outbox')
+    op.drop_index(op.f('ix_stripe_outbox_subscription_id'), table_name='stripe_outbox')
+    op.drop_index(op.f('ix_stripe_outbox_tenant_id'), table_name='stripe_outbox')
+    op.drop_table('stripe_outbox')
+    sa.Enum(name='operationstatus').drop(op.get_bind(), checkfirst=True)
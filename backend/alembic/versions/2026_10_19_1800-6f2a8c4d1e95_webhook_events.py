@@ -0,0 +1,45 @@
+"""Durable queue of received Stripe webhook events
+
+Revision ID: 6f2a8c4d1e95
+Revises: 9b4e2d6f1a83
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '6f2a8c4d1e95'
+down_revision = '9b4e2d6f1a83'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('webhook_events',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('stripe_event_id', sa.String(length=255), nullable=False),
+    sa.Column('event_type', sa.String(length=100), nullable=False),
+    sa.Column('ordering_key', sa.String(length=255), nullable=True),
+    sa.Column('event_created', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('status', sa.Enum('PENDING', 'PROCESSING', 'PROCESSED', 'DEAD_LETTER', name='webhookeventstatus'), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('received_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('processed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_webhook_events_stripe_event_id'), 'webhook_events', ['stripe_event_id'], unique=False)
+    op.create_index(op.f('ix_webhook_events_ordering_key'), 'webhook_events', ['ordering_key'], unique=False)
+    op.create_index('ix_webhook_events_next_attempt_at', 'webhook_events', ['next_attempt_at'], unique=False,
+                    postgresql_where=sa.text("status IN ('PENDING', 'PROCESSING')"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_webhook_events_next_attempt_at', table_name='webhook_events')
+    op.drop_index(op.f('ix_webhook_events_ordering_key'), table_name='webhook_events')
+    op.drop_index(op.f('ix_webhook_events_stripe_event_id'), table_name='webhook_events')
+    op.drop_table('webhook_events')
+    sa.Enum(name='webhookeventstatus').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,29 @@
+"""Unique webhook event ids and last-applied event watermarks
+
+Revision ID: 2c9e7b5a4f16
+Revises: 6f2a8c4d1e95
+Create Date: 2026-10-19 18:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '2c9e7b5a4f16'
+down_revision = '6f2a8c4d1e95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.drop_index(op.f('ix_webhook_events_stripe_event_id'), table_name='webhook_events')
+    op.create_index(op.f('ix_webhook_events_stripe_event_id'), 'webhook_events', ['stripe_event_id'], unique=True)
+    op.add_column('subscriptions', sa.Column('last_event_created', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('invoices', sa.Column('last_event_created', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('invoices', 'last_event_created')
+    op.drop_column('subscriptions', 'last_event_created')
+    op.drop_index(op.f('ix_webhook_events_stripe_event_id'), table_name='webhook_events')
+    op.create_index(op.f('ix_webhook_events_stripe_event_id'), 'webhook_events', ['stripe_event_id'], unique=False)
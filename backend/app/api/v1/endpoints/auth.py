@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from datetime import datetime, timedelta
+import logging
 import uuid
 
 from app.core.database import get_db
@@ -18,20 +19,32 @@ from app.schemas.user import (
     RegisterRequest,
     Token,
 )
-from app.services.stripe_service import StripeService
 from app.services.tenant_init_service import create_initial_tenant_data
+from app.tasks.billing import create_stripe_customer
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
+def _queue_stripe_customer(tenant_id: uuid.UUID) -> None:
+    """Runs after the response is sent; if the publish fails, the customer is created on first paid action"""
+    try:
+        create_stripe_customer.apply_async(args=[str(tenant_id)], retry=False)
+    except Exception as e:
+        logger.warning(f"Could not queue Stripe customer creation for tenant {tenant_id}: {e}")
+
+
 @router.post("/register", response_model=Token, status_code=status.HTTP_201_CREATED)
 async def register(
     request: RegisterRequest,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
 ):
     """
     Register a new tenant and owner user
-    Creates both tenant and first user (owner)
+    Creates both tenant and first user (owner). The Stripe customer is
+    created in the background, so signup does not wait on Stripe.
     """
     # Check if email already exists
     result = await db.execute(select(User).where(User.email == request.email))
@@ -60,19 +73,6 @@ async def register(
         trial_ends_at=datetime.utcnow() + timedelta(days=14),
     )
     
-    # Create Stripe customer for tenant
-    try:
-        stripe_customer = await StripeService.create_customer(
-            tenant=tenant,
-            email=request.email,
-            name=request.tenant_name,
-            metadata={"tenant_id": str(tenant.id), "tenant_slug": tenant.slug},
-        )
-        tenant.stripe_customer_id = stripe_customer.id
-    except Exception as e:
-        # Log error but continue (Stripe is optional for trial)
-        print(f"Failed to create Stripe customer: {e}")
-    
     db.add(tenant)
     
     # Create owner user
@@ -94,10 +94,11 @@ async def register(
         await create_initial_tenant_data(db, tenant)
     except Exception as e:
         # Log error but continue (user can still use the platform)
-        print(f"Failed to create initial tenant data: {e}")
+        logger.error(f"Failed to create initial tenant data: {e}")
     
     await db.commit()
     await db.refresh(user)
+    background_tasks.add_task(_queue_stripe_customer, tenant.id)
     
     # Create tokens
     access_token = create_access_token({"sub": str(user.id)})
@@ -9,6 +9,7 @@ from app.models.user import User
 from app.models.tenant import Tenant
 from app.models.invoice import Invoice
 from app.schemas.invoice import InvoiceResponse
+from app.services.fast_listing import InvoiceRow, select_invoices, fetch_rows, rows_response
 
 router = APIRouter()
 
@@ -21,14 +22,16 @@ async def get_invoices(
 ):
     """
     Get all invoices for current tenant
+    Served through the column-only read path (no ORM hydration)
     """
-    result = await db.execute(
-        select(Invoice)
+    invoices = await fetch_rows(
+        db,
+        InvoiceRow,
+        select_invoices()
         .where(Invoice.tenant_id == current_tenant.id)
-        .order_by(Invoice.created_at.desc())
+        .order_by(Invoice.created_at.desc()),
     )
-    invoices = result.scalars().all()
-    return invoices
+    return rows_response(invoices)
 
 
 @router.get("/{invoice_id}", response_model=InvoiceResponse)
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from typing import List
 from datetime import datetime
+import logging
 import uuid
 
 from app.core.database import get_db
@@ -11,15 +14,58 @@ from app.models.user import User
 from app.models.tenant import Tenant
 from app.models.subscription import Subscription, SubscriptionStatus
 from app.models.plan import Plan
+from app.models.stripe_operation import StripeOperation
 from app.schemas.subscription import (
     SubscriptionCreate,
     SubscriptionResponse,
     SubscriptionUpdate,
+    OperationResponse,
 )
-from app.services.stripe_service import StripeService
+from app.services.stripe_service import StripeService, from_timestamp, subscription_item
+from app.services.stripe_customers import ensure_stripe_customer
+from app.services.stripe_resilience import idempotency_key, is_unavailable
+from app.services.stripe_outbox import (
+    CANCEL_SUBSCRIPTION,
+    CREATE_SUBSCRIPTION,
+    UPDATE_SUBSCRIPTION,
+    change_locally,
+    enqueue_operation,
+)
+from app.tasks.billing import drain_stripe_outbox
+from app.services.fast_listing import (
+    SubscriptionRow,
+    select_subscriptions,
+    fetch_rows,
+    rows_response,
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+ASYNC_MODE = Query(
+    False,
+    alias="async",
+    description="Queue the Stripe call and return 202 with an operation to poll",
+)
+ACCEPTED = {status.HTTP_202_ACCEPTED: {"model": OperationResponse, "description": "Queued (async mode)"}}
+
+
+def _wake_outbox_drainer() -> None:
+    """Runs after the response is sent; if the publish fails, the beat sweep picks the operation up"""
+    try:
+        drain_stripe_outbox.apply_async(retry=False)
+    except Exception as e:
+        logger.warning(f"Could not wake the Stripe outbox drainer: {e}")
+
+
+def _accepted(operation: StripeOperation, background_tasks: BackgroundTasks) -> JSONResponse:
+    background_tasks.add_task(_wake_outbox_drainer)
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=jsonable_encoder(OperationResponse.model_validate(operation)),
+    )
+
 
 @router.get("", response_model=List[SubscriptionResponse])
 async def get_subscriptions(
@@ -29,14 +75,16 @@ async def get_subscriptions(
 ):
     """
     Get all subscriptions for current tenant
+    Served through the column-only read path (no ORM hydration)
     """
-    result = await db.execute(
-        select(Subscription)
+    subscriptions = await fetch_rows(
+        db,
+        SubscriptionRow,
+        select_subscriptions()
         .where(Subscription.tenant_id == current_tenant.id)
-        .order_by(Subscription.created_at.desc())
+        .order_by(Subscription.created_at.desc()),
     )
-    subscriptions = result.scalars().all()
-    return subscriptions
+    return rows_response(subscriptions)
 
 
 @router.get("/active", response_model=SubscriptionResponse)
@@ -67,21 +115,56 @@ async def get_active_subscription(
     return subscription
 
 
-@router.post("", response_model=SubscriptionResponse, status_code=status.HTTP_201_CREATED)
+@router.get("/operations/{operation_id}", response_model=OperationResponse)
+async def get_operation(
+    operation_id: uuid.UUID,
+    current_user: User = Depends(get_current_user),
+    current_tenant: Tenant = Depends(get_current_tenant),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Poll a Stripe operation queued by an async-mode subscription write
+    """
+    result = await db.execute(
+        select(StripeOperation).where(
+            StripeOperation.id == operation_id,
+            StripeOperation.tenant_id == current_tenant.id,
+        )
+    )
+    operation = result.scalar_one_or_none()
+    
+    if not operation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Operation not found",
+        )
+    
+    return operation
+
+
+@router.post("", response_model=SubscriptionResponse, status_code=status.HTTP_201_CREATED, responses=ACCEPTED)
 async def create_subscription(
     request: SubscriptionCreate,
+    background_tasks: BackgroundTasks,
+    async_mode: bool = ASYNC_MODE,
     current_user: User = Depends(get_current_user),
     current_tenant: Tenant = Depends(get_current_tenant),
     db: AsyncSession = Depends(get_db),
 ):
     """
     Create a new subscription for the current tenant
+    In async mode the subscription is stored as incomplete and created in
+    Stripe by the outbox drainer.
     """
-    # Check if tenant already has an active subscription
+    # Check if tenant already has an active subscription (or one being created)
     result = await db.execute(
         select(Subscription).where(
             Subscription.tenant_id == current_tenant.id,
-            Subscription.status.in_([SubscriptionStatus.ACTIVE, SubscriptionStatus.TRIALING])
+            Subscription.status.in_([
+                SubscriptionStatus.ACTIVE,
+                SubscriptionStatus.TRIALING,
+                SubscriptionStatus.INCOMPLETE,
+            ])
         )
     )
     existing = result.scalar_one_or_none()
@@ -112,22 +195,33 @@ async def create_subscription(
         current_period_end=datetime.utcnow(),  # Will be updated by Stripe
     )
     
+    if async_mode:
+        subscription.status = SubscriptionStatus.INCOMPLETE
+        db.add(subscription)
+        await db.flush()
+        operation = enqueue_operation(
+            db,
+            current_tenant.id,
+            CREATE_SUBSCRIPTION,
+            {
+                "price_id": plan.stripe_price_id,
+                "trial_days": plan.trial_days if plan.trial_days > 0 else None,
+                "payment_method_id": request.payment_method_id,
+            },
+            now=datetime.utcnow(),
+            subscription_id=subscription.id,
+        )
+        await db.commit()
+        return _accepted(operation, background_tasks)
+    
     # Create subscription in Stripe
     try:
-        if not current_tenant.stripe_customer_id:
-            # Create Stripe customer if doesn't exist
-            stripe_customer = await StripeService.create_customer(
-                tenant=current_tenant,
-                email=current_tenant.email,
-                name=current_tenant.name,
-                metadata={"tenant_id": str(current_tenant.id)},
-            )
-            current_tenant.stripe_customer_id = stripe_customer.id
-            await db.commit()
+        # Normally created at signup by a background task
+        customer_id = await ensure_stripe_customer(db, current_tenant)
         
         # Create Stripe subscription
         stripe_subscription = await StripeService.create_subscription(
-            customer_id=current_tenant.stripe_customer_id,
+            customer_id=customer_id,
             price_id=plan.stripe_price_id,
             trial_days=plan.trial_days if plan.trial_days > 0 else None,
             payment_method_id=request.payment_method_id,
@@ -135,23 +229,27 @@ async def create_subscription(
                 "tenant_id": str(current_tenant.id),
                 "subscription_id": str(subscription.id),
             },
+            idempotency_key=idempotency_key("subscription.create", subscription.id),
         )
         
         subscription.stripe_subscription_id = stripe_subscription.id
-        subscription.stripe_customer_id = current_tenant.stripe_customer_id
-        subscription.current_period_start = datetime.fromtimestamp(
-            stripe_subscription.current_period_start
-        )
-        subscription.current_period_end = datetime.fromtimestamp(
-            stripe_subscription.current_period_end
-        )
+        subscription.stripe_customer_id = customer_id
+        subscription.stripe_subscription_item_id, subscription.stripe_price_id = subscription_item(stripe_subscription)
+        subscription.current_period_start = from_timestamp(stripe_subscription.current_period_start)
+        subscription.current_period_end = from_timestamp(stripe_subscription.current_period_end)
         
         if stripe_subscription.trial_start:
-            subscription.trial_start = datetime.fromtimestamp(stripe_subscription.trial_start)
+            subscription.trial_start = from_timestamp(stripe_subscription.trial_start)
         if stripe_subscription.trial_end:
-            subscription.trial_end = datetime.fromtimestamp(stripe_subscription.trial_end)
+            subscription.trial_end = from_timestamp(stripe_subscription.trial_end)
         
     except Exception as e:
+        if is_unavailable(e):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Payment provider unavailable, please retry shortly",
+                headers={"Retry-After": "30"},
+            )
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create subscription: {str(e)}",
@@ -164,10 +262,12 @@ async def create_subscription(
     return subscription
 
 
-@router.patch("/{subscription_id}", response_model=SubscriptionResponse)
+@router.patch("/{subscription_id}", response_model=SubscriptionResponse, responses=ACCEPTED)
 async def update_subscription(
     subscription_id: str,
     request: SubscriptionUpdate,
+    background_tasks: BackgroundTasks,
+    async_mode: bool = ASYNC_MODE,
     current_user: User = Depends(get_current_user),
     current_tenant: Tenant = Depends(get_current_tenant),
     db: AsyncSession = Depends(get_db),
@@ -192,6 +292,7 @@ async def update_subscription(
     # Update in Stripe
     try:
         update_params = {}
+        changes = {}
         
         if request.plan_id:
             # Get new plan
@@ -205,34 +306,56 @@ async def update_subscription(
                 )
             
             update_params["price_id"] = new_plan.stripe_price_id
-            subscription.plan_id = new_plan.id
+            changes["plan_id"] = new_plan.id
         
         if request.cancel_at_period_end is not None:
             update_params["cancel_at_period_end"] = request.cancel_at_period_end
-            subscription.cancel_at_period_end = request.cancel_at_period_end
+            changes["cancel_at_period_end"] = request.cancel_at_period_end
         
-        if subscription.stripe_subscription_id and update_params:
-            await StripeService.update_subscription(
-                subscription.stripe_subscription_id,
-                **update_params,
+        if async_mode:
+            # Undone by the drainer if Stripe never takes the change
+            change_locally(subscription, update_params, **changes)
+            operation = enqueue_operation(
+                db, current_tenant.id, UPDATE_SUBSCRIPTION, update_params,
+                now=datetime.utcnow(), subscription_id=subscription.id,
             )
+        else:
+            for field, value in changes.items():
+                setattr(subscription, field, value)
+            if subscription.stripe_subscription_id and update_params:
+                stripe_subscription = await StripeService.update_subscription(
+                    subscription.stripe_subscription_id,
+                    item_id=subscription.stripe_subscription_item_id,
+                    **update_params,
+                )
+                subscription.stripe_subscription_item_id, subscription.stripe_price_id = subscription_item(stripe_subscription)
     
     except Exception as e:
+        if is_unavailable(e):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Payment provider unavailable, please retry shortly",
+                headers={"Retry-After": "30"},
+            )
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to update subscription: {str(e)}",
         )
     
     await db.commit()
+    if async_mode:
+        return _accepted(operation, background_tasks)
     await db.refresh(subscription)
     
     return subscription
 
 
-@router.delete("/{subscription_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete("/{subscription_id}", status_code=status.HTTP_204_NO_CONTENT, responses=ACCEPTED)
 async def cancel_subscription(
     subscription_id: str,
+    background_tasks: BackgroundTasks,
     immediately: bool = False,
+    async_mode: bool = ASYNC_MODE,
     current_user: User = Depends(get_current_user),
     current_tenant: Tenant = Depends(get_current_tenant),
     db: AsyncSession = Depends(get_db),
@@ -256,24 +379,42 @@ async def cancel_subscription(
     
     # Cancel in Stripe
     try:
-        if subscription.stripe_subscription_id:
-            await StripeService.cancel_subscription(
-                subscription.stripe_subscription_id,
-                immediately=immediately,
-            )
-        
+        now = datetime.utcnow()
         if immediately:
-            subscription.status = SubscriptionStatus.CANCELED
-            subscription.ended_at = datetime.utcnow()
+            changes = {"status": SubscriptionStatus.CANCELED, "ended_at": now}
         else:
-            subscription.cancel_at_period_end = True
+            changes = {"cancel_at_period_end": True}
+        changes["canceled_at"] = now
         
-        subscription.canceled_at = datetime.utcnow()
+        if async_mode:
+            payload = {"immediately": immediately}
+            # Undone by the drainer if Stripe never takes the cancel
+            change_locally(subscription, payload, **changes)
+            operation = enqueue_operation(
+                db, current_tenant.id, CANCEL_SUBSCRIPTION, payload,
+                now=now, subscription_id=subscription.id,
+            )
+        else:
+            if subscription.stripe_subscription_id:
+                await StripeService.cancel_subscription(
+                    subscription.stripe_subscription_id,
+                    immediately=immediately,
+                )
+            for field, value in changes.items():
+                setattr(subscription, field, value)
         
     except Exception as e:
+        if is_unavailable(e):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Payment provider unavailable, please retry shortly",
+                headers={"Retry-After": "30"},
+            )
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to cancel subscription: {str(e)}",
         )
     
     await db.commit()
+    if async_mode:
+        return _accepted(operation, background_tasks)
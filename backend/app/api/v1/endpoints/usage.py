@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from typing import List
+from sqlalchemy import JSON, select, func, and_, type_coerce
+from sqlalchemy.dialects.postgresql import JSONB
+from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
+import asyncio
+import json
 import uuid
 
 from app.core.database import get_db
@@ -14,11 +17,82 @@ from app.schemas.usage_metric import (
     UsageMetricCreate,
     UsageMetricResponse,
     UsageSummary,
+    UsageBreakdown,
     TenantUsageStats,
 )
+from app.services.usage_archive import archived_breakdown, archived_totals, dimension_text
+from app.services.fast_listing import (
+    UsageMetricRow,
+    select_usage_metrics,
+    fetch_rows,
+    rows_response,
+)
 
 router = APIRouter()
 
+METADATA_QUERY = Query(
+    None,
+    description='JSON object of metadata dimensions to match, e.g. {"region": "eu-west-1"}',
+)
+
+
+def parse_metadata_filter(metadata: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Parse the ?metadata= containment filter (flat JSON object of scalars)"""
+    if not metadata:
+        return None
+    
+    try:
+        filters = json.loads(metadata)
+    except ValueError:
+        filters = None
+    
+    if not isinstance(filters, dict) or not filters or any(
+        isinstance(value, (dict, list)) for value in filters.values()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="metadata must be a JSON object of scalar values",
+        )
+    
+    return filters
+
+
+def metadata_contains(db: AsyncSession, filters: Dict[str, Any]):
+    """
+    SQL filter: metric_metadata contains all given key/value pairs
+    Uses JSONB @> (GIN indexed) on PostgreSQL, JSON path extraction elsewhere.
+    A null value matches only a key that is present and null, as with @>.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return type_coerce(UsageMetric.metric_metadata, JSONB).contains(filters)
+    
+    clauses = []
+    for key, value in filters.items():
+        element = UsageMetric.metric_metadata[key]
+        if value is None:
+            # Same path format SQLAlchemy renders for metric_metadata[key]
+            clauses.append(func.json_type(UsageMetric.metric_metadata, f'$."{key}"') == "null")
+        elif isinstance(value, bool):
+            clauses.append(element.as_boolean() == value)
+        elif isinstance(value, int):
+            clauses.append(element.as_integer() == value)
+        elif isinstance(value, float):
+            clauses.append(element.as_float() == value)
+        else:
+            clauses.append(element.as_string() == str(value))
+    return and_(*clauses)
+
+
+def metadata_value(db: AsyncSession, key: str):
+    """
+    SQL expression: JSON value of one metadata key
+    Groups and decodes the same way on PostgreSQL and SQLite.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return UsageMetric.metric_metadata[key]
+    # SQLite's JSON_EXTRACT turns true/false into 1/0; -> (3.38+) keeps the JSON text
+    return type_coerce(UsageMetric.metric_metadata.op("->")(f'$."{key}"'), JSON)
+
 
 @router.post("", response_model=UsageMetricResponse, status_code=status.HTTP_201_CREATED)
 async def record_usage(
@@ -39,7 +113,7 @@ async def record_usage(
         unit=request.unit,
         period_start=request.period_start,
         period_end=request.period_end,
-        metadata=request.metadata,
+        metric_metadata=request.metric_metadata,
     )
     
     db.add(metric)
@@ -54,14 +128,16 @@ async def get_usage_metrics(
     metric_type: MetricType = None,
     start_date: datetime = None,
     end_date: datetime = None,
+    metadata: Optional[str] = METADATA_QUERY,
     current_user: User = Depends(get_current_user),
     current_tenant: Tenant = Depends(get_current_tenant),
     db: AsyncSession = Depends(get_db),
 ):
     """
     Get usage metrics for current tenant
+    Served through the column-only read path (no ORM hydration)
     """
-    query = select(UsageMetric).where(UsageMetric.tenant_id == current_tenant.id)
+    query = select_usage_metrics().where(UsageMetric.tenant_id == current_tenant.id)
     
     if metric_type:
         query = query.where(UsageMetric.metric_type == metric_type)
@@ -72,85 +148,174 @@ async def get_usage_metrics(
     if end_date:
         query = query.where(UsageMetric.period_end <= end_date)
     
-    query = query.order_by(UsageMetric.recorded_at.desc())
+    filters = parse_metadata_filter(metadata)
+    if filters:
+        query = query.where(metadata_contains(db, filters))
     
-    result = await db.execute(query)
-    metrics = result.scalars().all()
+    query = query.order_by(UsageMetric.recorded_at.desc())
     
-    return metrics
+    metrics = await fetch_rows(db, UsageMetricRow, query)
+    return rows_response(metrics)
 
 
 @router.get("/summary", response_model=List[UsageSummary])
 async def get_usage_summary(
     days: int = 30,
+    metadata: Optional[str] = METADATA_QUERY,
     current_user: User = Depends(get_current_user),
     current_tenant: Tenant = Depends(get_current_tenant),
     db: AsyncSession = Depends(get_db),
 ):
     """
     Get usage summary for the last N days
+    Includes archived (closed month) usage transparently, metadata filters included
     """
     start_date = datetime.utcnow() - timedelta(days=days)
     end_date = datetime.utcnow()
+    filters = parse_metadata_filter(metadata)
     
-    # Aggregate usage by metric type
-    summaries = []
+    # Aggregate live usage by metric type in one grouped query
+    query = (
+        select(
+            UsageMetric.metric_type,
+            UsageMetric.unit,
+            func.sum(UsageMetric.value).label("total_usage"),
+        )
+        .where(
+            UsageMetric.tenant_id == current_tenant.id,
+            UsageMetric.period_start >= start_date,
+        )
+        .group_by(UsageMetric.metric_type, UsageMetric.unit)
+    )
+    if filters:
+        query = query.where(metadata_contains(db, filters))
+    
+    result = await db.execute(query)
+    totals = {(row.metric_type, row.unit): int(row.total_usage or 0) for row in result}
     
+    # Union with closed months that were moved to the columnar archive
+    archived = await asyncio.to_thread(archived_totals, current_tenant.id, start_date, filters=filters)
+    for key, value in archived.items():
+        totals[key] = totals.get(key, 0) + value
+    
+    summaries = []
     for metric_type in MetricType:
-        result = await db.execute(
-            select(
-                UsageMetric.metric_type,
-                func.sum(UsageMetric.value).label("total_usage"),
-                UsageMetric.unit,
-            )
-            .where(
-                UsageMetric.tenant_id == current_tenant.id,
-                UsageMetric.metric_type == metric_type,
-                UsageMetric.period_start >= start_date,
-            )
-            .group_by(UsageMetric.metric_type, UsageMetric.unit)
-        )
-        
-        row = result.first()
-        if row and row.total_usage:
-            summaries.append(
-                UsageSummary(
-                    metric_type=row.metric_type,
-                    total_usage=int(row.total_usage),
-                    unit=row.unit,
-                    period_start=start_date,
-                    period_end=end_date,
+        for (total_type, unit), total_usage in totals.items():
+            if total_type == metric_type and total_usage:
+                summaries.append(
+                    UsageSummary(
+                        metric_type=metric_type,
+                        total_usage=total_usage,
+                        unit=unit,
+                        period_start=start_date,
+                        period_end=end_date,
+                    )
                 )
-            )
     
     return summaries
 
 
+@router.get("/breakdown", response_model=List[UsageBreakdown])
+async def get_usage_breakdown(
+    dimension: str = Query(..., min_length=1, max_length=100, description="Metadata key to group by"),
+    days: int = 30,
+    metric_type: MetricType = None,
+    metadata: Optional[str] = METADATA_QUERY,
+    current_user: User = Depends(get_current_user),
+    current_tenant: Tenant = Depends(get_current_tenant),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Get usage for the last N days grouped by one metadata dimension
+    e.g. ?dimension=region returns totals per region, computed in SQL and
+    over the archived months. Values are returned as text ("1", "true").
+    """
+    start_date = datetime.utcnow() - timedelta(days=days)
+    end_date = datetime.utcnow()
+    
+    dimension_value = metadata_value(db, dimension).label("value")
+    query = (
+        select(
+            dimension_value,
+            UsageMetric.metric_type,
+            UsageMetric.unit,
+            func.sum(UsageMetric.value).label("total_usage"),
+        )
+        .where(
+            UsageMetric.tenant_id == current_tenant.id,
+            UsageMetric.period_start >= start_date,
+        )
+        .group_by(dimension_value, UsageMetric.metric_type, UsageMetric.unit)
+    )
+    
+    if metric_type:
+        query = query.where(UsageMetric.metric_type == metric_type)
+    
+    filters = parse_metadata_filter(metadata)
+    if filters:
+        query = query.where(metadata_contains(db, filters))
+    
+    result = await db.execute(query)
+    totals: Dict[tuple, int] = {}
+    for row in result:
+        key = (dimension_text(row.value), row.metric_type, row.unit)
+        totals[key] = totals.get(key, 0) + int(row.total_usage or 0)
+    
+    archived = await asyncio.to_thread(
+        archived_breakdown, current_tenant.id, dimension, start_date,
+        metric_type=metric_type, filters=filters,
+    )
+    for key, value in archived.items():
+        totals[key] = totals.get(key, 0) + value
+    
+    return [
+        UsageBreakdown(
+            dimension=dimension,
+            value=value,
+            metric_type=row_type,
+            total_usage=total_usage,
+            unit=unit,
+            period_start=start_date,
+            period_end=end_date,
+        )
+        for (value, row_type, unit), total_usage in sorted(totals.items(), key=lambda item: -item[1])
+    ]
+
+
 @router.get("/stats", response_model=TenantUsageStats)
 async def get_usage_stats(
     days: int = 30,
+    metadata: Optional[str] = METADATA_QUERY,
     current_user: User = Depends(get_current_user),
     current_tenant: Tenant = Depends(get_current_tenant),
     db: AsyncSession = Depends(get_db),
 ):
     """
     Get comprehensive usage statistics
+    Includes archived (closed month) usage transparently, metadata filters included
     """
     start_date = datetime.utcnow() - timedelta(days=days)
     end_date = datetime.utcnow()
+    filters = parse_metadata_filter(metadata)
     
     # Helper function to get metric sum
     async def get_metric_sum(metric_type: MetricType) -> int:
-        result = await db.execute(
-            select(func.sum(UsageMetric.value))
-            .where(
-                UsageMetric.tenant_id == current_tenant.id,
-                UsageMetric.metric_type == metric_type,
-                UsageMetric.period_start >= start_date,
-            )
+        query = select(func.sum(UsageMetric.value)).where(
+            UsageMetric.tenant_id == current_tenant.id,
+            UsageMetric.metric_type == metric_type,
+            UsageMetric.period_start >= start_date,
         )
+        if filters:
+            query = query.where(metadata_contains(db, filters))
+        
+        result = await db.execute(query)
         total = result.scalar()
-        return int(total) if total else 0
+        total = int(total) if total else 0
+        
+        archived = await asyncio.to_thread(
+            archived_totals, current_tenant.id, start_date, metric_type=metric_type, filters=filters,
+        )
+        return total + sum(archived.values())
     
     # Get totals for each metric type
     api_calls = await get_metric_sum(MetricType.API_CALLS)
@@ -0,0 +1,57 @@
+"""
+Application clock for time-dependent task code
+Billing and notification tasks read the current time through utcnow(), so
+simulations and tests can drive them with a FakeClock instead of waiting
+for real time to pass.
+"""
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Iterator
+
+
+class Clock:
+    """Wall clock (naive UTC, like the rest of the schema)"""
+
+    def now(self) -> datetime:
+        return datetime.utcnow()
+
+
+class FakeClock(Clock):
+    """Clock that only moves when told to"""
+
+    def __init__(self, start: datetime):
+        self.current = start
+
+    def now(self) -> datetime:
+        return self.current
+
+    def advance(self, delta: timedelta) -> datetime:
+        self.current += delta
+        return self.current
+
+    def set(self, moment: datetime) -> None:
+        self.current = moment
+
+
+_clock: Clock = Clock()
+
+
+def utcnow() -> datetime:
+    """Current time of the installed clock"""
+    return _clock.now()
+
+
+def set_clock(clock: Clock) -> Clock:
+    """Install `clock` process-wide; returns the previous one"""
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
+
+
+@contextmanager
+def use_clock(clock: Clock) -> Iterator[Clock]:
+    previous = set_clock(clock)
+    try:
+        yield clock
+    finally:
+        set_clock(previous)
@@ -25,6 +25,34 @@ class Settings(BaseSettings):
     STRIPE_SECRET_KEY: str = ""
     STRIPE_PUBLISHABLE_KEY: str = ""
     STRIPE_WEBHOOK_SECRET: str = ""
+    STRIPE_WEBHOOK_TOLERANCE_SECONDS: int = 300  # Oldest signature timestamp accepted; 0 disables the check
+    STRIPE_API_BASE: str = ""  # Empty for api.stripe.com; set to point at a local fake Stripe server
+    STRIPE_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    STRIPE_READ_TIMEOUT_SECONDS: float = 30.0
+    STRIPE_MAX_CONCURRENCY: int = 16  # Threads making Stripe calls per process
+    STRIPE_MAX_RETRIES: int = 3  # Retries of transient errors (connection, 409, 429, 5xx)
+    STRIPE_RETRY_BASE_DELAY_SECONDS: float = 0.25  # Backoff doubles per retry, with full jitter
+    STRIPE_RETRY_MAX_DELAY_SECONDS: float = 4.0
+    STRIPE_RETRY_DEADLINE_SECONDS: float = 10.0  # No retry starts later than this after the first attempt
+    STRIPE_BREAKER_WINDOW_SECONDS: float = 30.0
+    STRIPE_BREAKER_MIN_CALLS: int = 10  # Calls in the window before the error rate is judged
+    STRIPE_BREAKER_ERROR_RATE: float = 0.5  # Transient error share that opens the breaker
+    STRIPE_BREAKER_COOLDOWN_SECONDS: float = 30.0  # Open time before a probe call is let through
+    STRIPE_ITEM_CACHE_SIZE: int = 10000  # Subscription item ids cached per process for legacy rows
+    OUTBOX_BATCH_SIZE: int = 100  # Stripe operations claimed per drain batch
+    OUTBOX_CONCURRENCY: int = 8  # Stripe operations in flight per drainer
+    OUTBOX_LEASE_SECONDS: int = 120  # A claimed operation is claimable again after this
+    OUTBOX_MAX_ATTEMPTS: int = 8
+    OUTBOX_RETRY_BASE_SECONDS: int = 5  # Doubled per failed attempt
+    OUTBOX_RETRY_MAX_SECONDS: int = 900
+    WEBHOOK_BATCH_SIZE: int = 100  # Stripe events claimed and applied per transaction
+    WEBHOOK_LEASE_SECONDS: int = 120  # A claimed event is claimable again after this
+    WEBHOOK_MAX_ATTEMPTS: int = 8  # Then the event is dead-lettered
+    WEBHOOK_RETRY_BASE_SECONDS: int = 5  # Doubled per failed attempt
+    WEBHOOK_RETRY_MAX_SECONDS: int = 900
+    WEBHOOK_DEDUPE_CACHE_SIZE: int = 10000  # Recent event ids kept per process to skip redeliveries
+    RECONCILE_PAGE_SIZE: int = 100  # Stripe list page size (max 100); one DB chunk per page
+    RECONCILE_INVOICE_LOOKBACK_DAYS: int = 35  # Invoices created in this window are reconciled
     
     # CORS
     CORS_ORIGINS: Union[List[str], str] = ["http://localhost:3000", "http://localhost:5173"]
@@ -39,6 +67,26 @@ class Settings(BaseSettings):
     # Celery
     CELERY_BROKER_URL: str = "redis://localhost:6379/0"
     CELERY_RESULT_BACKEND: str = "redis://localhost:6379/0"
+    LEADER_LEASE_TTL_SECONDS: int = 60  # Periodic task lease; renewed every TTL/3
+    QUEUE_METRICS_SAMPLES: int = 500  # Recent wait/runtime samples kept per queue
+    
+    # Billing runs
+    INVOICE_CHUNK_SIZE: int = 1000  # Subscriptions per generate_invoice_chunk task
+    INVOICE_DUE_DAYS: int = 14
+    OVERAGE_PRICE_PER_1000_API_CALLS: float = 0.50  # USD, above Plan.max_api_calls
+    OVERAGE_PRICE_PER_GB_STORAGE: float = 0.25  # USD, peak GB above Plan.max_storage_gb
+    RENEWAL_SLICE_SIZE: int = 200  # Subscriptions billed per slice by the minute tick
+    RENEWAL_MAX_SLICES: int = 10  # Slices per tick; leftovers roll to the next tick
+    BATCH_CHUNK_SIZE: int = 500  # Rows per checkpointed chunk in batch tasks
+    BATCH_MAX_ATTEMPTS: int = 3  # Resumes of an unfinished run before it is skipped
+    
+    # Dunning (failed payment retries)
+    DUNNING_MAX_ATTEMPTS: int = 4
+    DUNNING_BASE_DELAY_HOURS: int = 24  # Doubles after each failed retry
+    DUNNING_MAX_DELAY_HOURS: int = 168
+    DUNNING_BATCH_SIZE: int = 100  # Attempts popped per batch
+    DUNNING_LEASE_SECONDS: int = 900  # A claimed attempt is claimable again after this; outlasts a batch
+    DUNNING_MAX_BATCHES: int = 20  # Per process_failed_payments run
     
     # Email
     SMTP_HOST: str = ""
@@ -47,6 +95,10 @@ class Settings(BaseSettings):
     SMTP_PASSWORD: str = ""
     EMAIL_FROM: str = "noreply@example.com"
     
+    # Usage archive (closed months exported to columnar files)
+    USAGE_ARCHIVE_DIR: str = "data/usage_archive"
+    USAGE_ARCHIVE_AFTER_MONTHS: int = 3
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
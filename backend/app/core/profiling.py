@@ -0,0 +1,87 @@
+"""
+Lightweight instrumentation for billing runs
+Stage timers, per-connection query counting and peak memory tracking,
+used by the invoice dry run report.
+"""
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, Optional
+import time
+import tracemalloc
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class StageTimer:
+    """Accumulates wall time per named stage across repeated calls"""
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - started
+
+    def as_dict(self) -> Dict[str, float]:
+        return {name: round(seconds, 4) for name, seconds in self.seconds.items()}
+
+
+@contextmanager
+def timed(timer: Optional[StageTimer], name: str) -> Iterator[None]:
+    """timer.stage(name), or nothing when no timer is passed"""
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+class QueryCounter:
+    """Counts statements sent to the database on the sessions it watches"""
+
+    def __init__(self):
+        self.count = 0
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        self.count += 1
+
+    @asynccontextmanager
+    async def watch(self, db: AsyncSession) -> AsyncIterator[None]:
+        # Listen on the session's own connection so other work on the engine is not counted
+        conn = (await db.connection()).sync_connection
+        event.listen(conn, "before_cursor_execute", self._before_cursor_execute)
+        try:
+            yield
+        finally:
+            event.remove(conn, "before_cursor_execute", self._before_cursor_execute)
+
+
+class PeakMemory:
+    """
+    Peak Python heap allocation inside the block, via tracemalloc
+    Tracing slows allocation-heavy code, so timings taken inside are pessimistic.
+    """
+
+    def __init__(self):
+        self.peak_bytes = 0
+        self._started = False
+
+    def __enter__(self) -> "PeakMemory":
+        self._started = not tracemalloc.is_tracing()
+        if self._started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.peak_bytes = tracemalloc.get_traced_memory()[1]
+        if self._started:
+            tracemalloc.stop()
+
+    @property
+    def peak_mb(self) -> float:
+        return round(self.peak_bytes / (1024 * 1024), 2)
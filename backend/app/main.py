@@ -4,10 +4,15 @@ from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
 import logging
 
+import redis
+
 from app.core.config import settings
 from app.api.v1.router import api_router
 from app.api.v1 import invoice_pdf
 from app.middleware.tenant import TenantMiddleware
+from app.tasks.celery_app import celery_app
+from app.tasks.monitoring import queue_stats
+from app.services.stripe_resilience import stripe_stats
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -64,6 +69,25 @@ async def health_check():
     return {"status": "healthy", "version": settings.APP_VERSION}
 
 
+@app.get("/health/queues", tags=["Health"])
+def queue_health():
+    """Backlog and recent wait/runtime per Celery queue, for scaling each worker pool"""
+    try:
+        return {"queues": queue_stats(celery_app)}
+    except redis.RedisError as e:
+        logger.warning(f"Queue metrics unavailable: {e}")
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"detail": "Queue metrics unavailable"},
+        )
+
+
+@app.get("/health/stripe", tags=["Health"])
+async def stripe_health():
+    """Circuit breaker state and Stripe call/retry/failure counters for this process"""
+    return stripe_stats()
+
+
 # Include API router
 app.include_router(api_router, prefix="/api/v1")
 app.include_router(invoice_pdf.router, prefix="/api/v1", tags=["invoices"])
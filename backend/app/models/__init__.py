@@ -9,6 +9,10 @@ from app.models.subscription import Subscription, SubscriptionStatus
 from app.models.invoice import Invoice, InvoiceStatus
 from app.models.payment import Payment, PaymentStatus, PaymentMethod
 from app.models.usage_metric import UsageMetric, MetricType
+from app.models.job_run import JobRun, JobRunStatus
+from app.models.dunning_attempt import DunningAttempt, DunningStatus
+from app.models.stripe_operation import StripeOperation, OperationStatus
+from app.models.webhook_event import WebhookEvent, WebhookEventStatus
 
 __all__ = [
     "Base",
@@ -27,4 +31,12 @@ __all__ = [
     "PaymentMethod",
     "UsageMetric",
     "MetricType",
+    "JobRun",
+    "JobRunStatus",
+    "DunningAttempt",
+    "DunningStatus",
+    "StripeOperation",
+    "OperationStatus",
+    "WebhookEvent",
+    "WebhookEventStatus",
 ]
@@ -7,6 +7,8 @@ from app.models.subscription import Subscription
 from app.models.invoice import Invoice
 from app.models.payment import Payment
 from app.models.usage_metric import UsageMetric
+from app.models.job_run import JobRun
+from app.models.dunning_attempt import DunningAttempt
 
 __all__ = [
     "Base",
@@ -17,4 +19,6 @@ __all__ = [
     "Invoice",
     "Payment",
     "UsageMetric",
+    "JobRun",
+    "DunningAttempt",
 ]
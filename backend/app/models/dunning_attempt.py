@@ -0,0 +1,58 @@
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, Text, Index, Enum as SQLEnum
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+import uuid
+import enum
+
+from app.core.database import Base
+from app.models.guid import GUID
+
+
+class DunningStatus(str, enum.Enum):
+    """Dunning schedule status"""
+    SCHEDULED = "scheduled"
+    SUCCEEDED = "succeeded"
+    EXHAUSTED = "exhausted"
+    CANCELED = "canceled"
+
+
+class DunningAttempt(Base):
+    """
+    Dunning attempt model - retry schedule for one failed invoice payment
+    Works as a due-time queue: workers pop SCHEDULED rows whose
+    next_attempt_at has passed.
+    """
+    __tablename__ = "dunning_attempts"
+
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    tenant_id = Column(GUID(), ForeignKey("tenants.id"), nullable=False, index=True)
+    invoice_id = Column(GUID(), ForeignKey("invoices.id"), unique=True, nullable=False)
+    subscription_id = Column(GUID(), ForeignKey("subscriptions.id"), nullable=True, index=True)
+    
+    # Schedule
+    status = Column(SQLEnum(DunningStatus), default=DunningStatus.SCHEDULED, nullable=False)
+    attempt_count = Column(Integer, default=0, nullable=False)  # Retries made so far
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Last retry
+    last_attempt_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), nullable=True)
+    
+    # Relationships
+    invoice = relationship("Invoice")
+    
+    __table_args__ = (
+        # Only scheduled rows are ever popped; keep the queue index to those
+        Index(
+            "ix_dunning_attempts_next_attempt_at",
+            next_attempt_at,
+            postgresql_where=status == DunningStatus.SCHEDULED,
+        ),
+    )
+    
+    def __repr__(self):
+        return f"<DunningAttempt invoice={self.invoice_id} #{self.attempt_count} ({self.status})>"
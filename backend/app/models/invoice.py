@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Numeric, Enum as SQLEnum
+from sqlalchemy import Column, String, DateTime, ForeignKey, Numeric, UniqueConstraint, Enum as SQLEnum
 from sqlalchemy.dialects.postgresql import JSON
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -33,6 +33,8 @@ class Invoice(Base):
     
     # Stripe
     stripe_invoice_id = Column(String(255), unique=True, nullable=True)
+    # `created` of the newest Stripe event applied; older events are no-ops
+    last_event_created = Column(DateTime(timezone=True), nullable=True)
     
     # Status
     status = Column(SQLEnum(InvoiceStatus), default=InvoiceStatus.DRAFT, nullable=False, index=True)
@@ -56,6 +58,10 @@ class Invoice(Base):
     due_date = Column(DateTime(timezone=True), nullable=True)
     paid_at = Column(DateTime(timezone=True), nullable=True)
     
+    # Billing period covered (set by the invoice engine; one invoice per subscription period)
+    period_start = Column(DateTime(timezone=True), nullable=True)
+    period_end = Column(DateTime(timezone=True), nullable=True)
+    
     # PDF
     invoice_pdf_url = Column(String(500), nullable=True)
     
@@ -68,5 +74,9 @@ class Invoice(Base):
     subscription = relationship("Subscription", back_populates="invoices")
     payments = relationship("Payment", back_populates="invoice")
     
+    __table_args__ = (
+        UniqueConstraint("subscription_id", "period_start", name="uq_invoices_subscription_period"),
+    )
+    
     def __repr__(self):
         return f"<Invoice {self.invoice_number} - ${self.total} ({self.status})>"
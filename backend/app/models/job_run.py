@@ -0,0 +1,63 @@
+from sqlalchemy import Column, String, DateTime, Integer, Text, JSON, UniqueConstraint, Enum as SQLEnum
+from sqlalchemy.sql import func
+from typing import Optional
+import uuid
+import enum
+
+from app.core.database import Base
+from app.models.guid import GUID
+
+
+class JobRunStatus(str, enum.Enum):
+    """Batch job run status"""
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class JobRun(Base):
+    """
+    Job run model - checkpoint and progress of one run of a batch task
+    A run that stops early (time limit, eviction) resumes from its cursor.
+    """
+    __tablename__ = "job_runs"
+
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    
+    # Identity: one row per logical run, e.g. ("generate_monthly_invoices", "2026-10-19")
+    job_name = Column(String(100), nullable=False)
+    run_key = Column(String(100), nullable=False)
+    
+    # Status
+    status = Column(SQLEnum(JobRunStatus), default=JobRunStatus.RUNNING, nullable=False, index=True)
+    attempts = Column(Integer, default=1, nullable=False)  # Starts + resumes
+    fencing_token = Column(Integer, nullable=True)  # Leader lease token of the current holder
+    
+    # Checkpoint
+    cursor = Column(String(255), nullable=True)  # Last processed key (keyset pagination)
+    processed = Column(Integer, default=0, nullable=False)
+    total = Column(Integer, nullable=True)
+    chunks = Column(Integer, default=0, nullable=False)
+    counts = Column(JSON, nullable=True)
+    # Example: {"generated": 980, "existing": 20}
+    
+    last_error = Column(Text, nullable=True)
+    
+    # Timestamps
+    started_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    
+    __table_args__ = (
+        UniqueConstraint("job_name", "run_key", name="uq_job_runs_job_name_run_key"),
+    )
+    
+    def __repr__(self):
+        return f"<JobRun {self.job_name}:{self.run_key} ({self.status}) {self.processed}/{self.total}>"
+    
+    @property
+    def progress(self) -> Optional[float]:
+        """Fraction of the run done, when the total is known"""
+        if not self.total:
+            return None
+        return min(self.processed / self.total, 1.0)
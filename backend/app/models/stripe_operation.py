@@ -0,0 +1,60 @@
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, Text, JSON, Index, Enum as SQLEnum
+from sqlalchemy.sql import func
+import uuid
+import enum
+
+from app.core.database import Base
+from app.models.guid import GUID
+
+
+class OperationStatus(str, enum.Enum):
+    """Outbox operation status"""
+    PENDING = "pending"
+    PROCESSING = "processing"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class StripeOperation(Base):
+    """
+    Stripe operation model - transactional outbox of Stripe side effects
+    Written in the same transaction as the local state change it mirrors,
+    then sent to Stripe by the outbox drainer. Its id is the operation id
+    clients poll, and the seed of the Stripe idempotency key.
+    """
+    __tablename__ = "stripe_outbox"
+
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    tenant_id = Column(GUID(), ForeignKey("tenants.id"), nullable=False, index=True)
+    subscription_id = Column(GUID(), ForeignKey("subscriptions.id"), nullable=True, index=True)
+    
+    # What to do, e.g. "subscription.create" with {"price_id": ...}
+    operation = Column(String(50), nullable=False)
+    payload = Column(JSON, nullable=False, default=dict)
+    
+    # Delivery
+    status = Column(SQLEnum(OperationStatus), default=OperationStatus.PENDING, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    # Due time while PENDING; lease expiry while PROCESSING
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Outcome
+    result = Column(JSON, nullable=True)
+    last_error = Column(Text, nullable=True)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), nullable=True)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    
+    __table_args__ = (
+        # Only unfinished rows are ever claimed
+        Index(
+            "ix_stripe_outbox_next_attempt_at",
+            next_attempt_at,
+            postgresql_where=status.in_([OperationStatus.PENDING, OperationStatus.PROCESSING]),
+        ),
+    )
+    
+    def __repr__(self):
+        return f"<StripeOperation {self.operation} {self.id} ({self.status})>"
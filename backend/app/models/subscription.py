@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Enum as SQLEnum
+from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Index, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import uuid
@@ -33,6 +33,11 @@ class Subscription(Base):
     # Stripe
     stripe_subscription_id = Column(String(255), unique=True, nullable=True)
     stripe_customer_id = Column(String(255), nullable=True)
+    # Single-item subscriptions: the item is modified in place on plan changes
+    stripe_subscription_item_id = Column(String(255), nullable=True)
+    stripe_price_id = Column(String(255), nullable=True)
+    # `created` of the newest Stripe event applied; older events are no-ops
+    last_event_created = Column(DateTime(timezone=True), nullable=True)
     
     # Status
     status = Column(SQLEnum(SubscriptionStatus), default=SubscriptionStatus.TRIALING, nullable=False, index=True)
@@ -59,6 +64,16 @@ class Subscription(Base):
     plan = relationship("Plan", back_populates="subscriptions")
     invoices = relationship("Invoice", back_populates="subscription")
     
+    __table_args__ = (
+        # Renewal queue: active subscriptions ordered by when their period ends
+        Index(
+            "ix_subscriptions_renewal_due",
+            current_period_end,
+            postgresql_where=status == SubscriptionStatus.ACTIVE,
+            sqlite_where=status == SubscriptionStatus.ACTIVE,
+        ),
+    )
+    
     def __repr__(self):
         return f"<Subscription {self.id} - {self.status}>"
     
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, Enum as SQLEnum
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, Index, JSON, Enum as SQLEnum
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import uuid
@@ -38,8 +39,9 @@ class UsageMetric(Base):
     period_start = Column(DateTime(timezone=True), nullable=False, index=True)
     period_end = Column(DateTime(timezone=True), nullable=False, index=True)
     
-    # Additional data
-    metric_metadata = Column(String, nullable=True)  # JSON for additional context
+    # Additional data (JSONB on PostgreSQL, JSON elsewhere)
+    metric_metadata = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=True)
+    # Example: {"endpoint": "/v1/orders", "region": "eu-west-1", "api_key": "key_123"}
     
     # Timestamps
     recorded_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -48,5 +50,17 @@ class UsageMetric(Base):
     # Relationships
     tenant = relationship("Tenant", back_populates="usage_metrics")
     
+    __table_args__ = (
+        # Per-tenant period scans (invoice engine, usage summaries)
+        Index("ix_usage_metrics_tenant_period", tenant_id, period_start),
+        # GIN index for containment (@>) filters on dimensions
+        Index(
+            "ix_usage_metrics_metric_metadata",
+            metric_metadata,
+            postgresql_using="gin",
+            postgresql_ops={"metric_metadata": "jsonb_path_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
+    
     def __repr__(self):
         return f"<UsageMetric {self.metric_type}: {self.value} {self.unit}>"
@@ -0,0 +1,58 @@
+from sqlalchemy import Column, String, DateTime, Integer, Text, Index, Enum as SQLEnum
+from sqlalchemy.sql import func
+import uuid
+import enum
+
+from app.core.database import Base
+from app.models.guid import GUID
+
+
+class WebhookEventStatus(str, enum.Enum):
+    """Webhook event processing status"""
+    PENDING = "pending"
+    PROCESSING = "processing"
+    PROCESSED = "processed"
+    DEAD_LETTER = "dead_letter"
+
+
+class WebhookEvent(Base):
+    """
+    Webhook event model - Stripe events as received, awaiting processing
+    The webhook endpoint stores the verified raw event and acknowledges;
+    consumers apply it later, in order per `ordering_key`.
+    """
+    __tablename__ = "webhook_events"
+
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    # Unique: a redelivered event is stored once
+    stripe_event_id = Column(String(255), nullable=False, unique=True, index=True)
+    event_type = Column(String(100), nullable=False)
+    # Stripe subscription the event concerns; events sharing one apply in order
+    ordering_key = Column(String(255), nullable=True, index=True)
+    # Stripe's `created` for the event
+    event_created = Column(DateTime(timezone=True), nullable=False)
+    # The request body, exactly as Stripe signed it
+    payload = Column(Text, nullable=False)
+    
+    # Processing
+    status = Column(SQLEnum(WebhookEventStatus), default=WebhookEventStatus.PENDING, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    # Due time while PENDING; lease expiry while PROCESSING
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    
+    # Timestamps
+    received_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+    
+    __table_args__ = (
+        # Only unfinished rows are ever claimed
+        Index(
+            "ix_webhook_events_next_attempt_at",
+            next_attempt_at,
+            postgresql_where=status.in_([WebhookEventStatus.PENDING, WebhookEventStatus.PROCESSING]),
+        ),
+    )
+    
+    def __repr__(self):
+        return f"<WebhookEvent {self.event_type} {self.stripe_event_id} ({self.status})>"
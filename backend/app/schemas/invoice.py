@@ -39,6 +39,8 @@ class InvoiceResponse(InvoiceBase):
     stripe_invoice_id: Optional[str]
     invoice_pdf_url: Optional[str]
     paid_at: Optional[datetime]
+    period_start: Optional[datetime] = None
+    period_end: Optional[datetime] = None
     created_at: datetime
     updated_at: Optional[datetime]
     
@@ -2,6 +2,7 @@ from pydantic import BaseModel, UUID4
 from datetime import datetime
 from typing import Optional
 from app.models.subscription import SubscriptionStatus
+from app.models.stripe_operation import OperationStatus
 
 
 # Subscription Schemas
@@ -39,3 +40,19 @@ class SubscriptionResponse(SubscriptionBase):
 class SubscriptionWithPlan(SubscriptionResponse):
     """Subscription response with nested plan details"""
     plan: dict  # PlanResponse
+
+
+class OperationResponse(BaseModel):
+    """Queued Stripe side effect of a subscription write made in async mode"""
+    id: UUID4
+    operation: str
+    status: OperationStatus
+    subscription_id: Optional[UUID4]
+    attempts: int
+    result: Optional[dict]
+    last_error: Optional[str]
+    created_at: datetime
+    completed_at: Optional[datetime]
+    
+    class Config:
+        from_attributes = True
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, UUID4, Field
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Dict, Any
 from app.models.usage_metric import MetricType
 
 
@@ -15,7 +15,7 @@ class UsageMetricBase(BaseModel):
 class UsageMetricCreate(UsageMetricBase):
     period_start: datetime
     period_end: datetime
-    metric_metadata: Optional[str] = None
+    metric_metadata: Optional[Dict[str, Any]] = None
 
 
 class UsageMetricResponse(UsageMetricBase):
@@ -23,7 +23,7 @@ class UsageMetricResponse(UsageMetricBase):
     tenant_id: UUID4
     period_start: datetime
     period_end: datetime
-    metric_metadata: Optional[str]
+    metric_metadata: Optional[Dict[str, Any]]
     recorded_at: datetime
     created_at: datetime
     
@@ -41,6 +41,17 @@ class UsageSummary(BaseModel):
     period_end: datetime
 
 
+class UsageBreakdown(BaseModel):
+    """Usage aggregated by one metadata dimension (e.g. region)"""
+    dimension: str
+    value: Optional[str]  # Metadata value as text; None when missing or null
+    metric_type: MetricType
+    total_usage: int
+    unit: str
+    period_start: datetime
+    period_end: datetime
+
+
 class TenantUsageStats(BaseModel):
     """Overall usage statistics for a tenant"""
     tenant_id: UUID4
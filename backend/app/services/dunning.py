@@ -0,0 +1,203 @@
+"""
+Dunning: scheduled retries of failed invoice payments
+
+Each failed invoice gets one row in `dunning_attempts`, which doubles as a
+due-time queue ordered by `next_attempt_at` (partial index on SCHEDULED
+rows). Workers claim only rows that are due, in bounded batches, with
+FOR UPDATE SKIP LOCKED, so the cost of a run follows the number of retries
+due now rather than the number of delinquent accounts.
+
+A batch runs in the outbox's three short steps: claim and lease the rows
+(DUNNING_LEASE_SECONDS) and commit; charge each invoice with no session
+open; record each outcome in its own transaction. A worker that dies
+leaves its rows due again once the lease runs out, and the re-run reuses
+the attempt's idempotency key.
+
+Retries back off exponentially: DUNNING_BASE_DELAY_HOURS, then doubled
+after each failure up to DUNNING_MAX_DELAY_HOURS. After
+DUNNING_MAX_ATTEMPTS the invoice is marked uncollectible and the
+subscription unpaid. Intended for accounts with Stripe's automatic
+retries turned off, so payments are not retried twice.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import logging
+import uuid
+
+import stripe
+from sqlalchemy import select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.models.dunning_attempt import DunningAttempt, DunningStatus
+from app.models.invoice import Invoice, InvoiceStatus
+from app.models.subscription import Subscription, SubscriptionStatus
+from app.services.stripe_resilience import idempotency_key
+from app.services.stripe_service import StripeService
+
+logger = logging.getLogger(__name__)
+
+
+def retry_delay(attempt: int) -> timedelta:
+    """Delay before retry number `attempt` (1-based)"""
+    hours = settings.DUNNING_BASE_DELAY_HOURS * 2 ** (attempt - 1)
+    return timedelta(hours=min(hours, settings.DUNNING_MAX_DELAY_HOURS))
+
+
+async def schedule_dunning(db: AsyncSession, invoice: Invoice, now: datetime) -> bool:
+    """
+    Queue the first retry for a failed invoice
+    Repeated payment_failed events (including those caused by our own
+    retries) leave an existing schedule alone. Does not commit.
+    """
+    dialect = db.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    result = await db.execute(
+        insert(DunningAttempt.__table__)
+        .values(
+            id=uuid.uuid4(),
+            tenant_id=invoice.tenant_id,
+            invoice_id=invoice.id,
+            subscription_id=invoice.subscription_id,
+            status=DunningStatus.SCHEDULED,
+            attempt_count=0,
+            next_attempt_at=now + retry_delay(1),
+        )
+        .on_conflict_do_nothing(index_elements=["invoice_id"])
+    )
+    return result.rowcount == 1
+
+
+async def cancel_dunning(db: AsyncSession, invoice_id) -> None:
+    """Stop retrying an invoice that got paid another way. Does not commit."""
+    await db.execute(
+        update(DunningAttempt)
+        .where(
+            DunningAttempt.invoice_id == invoice_id,
+            DunningAttempt.status == DunningStatus.SCHEDULED,
+        )
+        .values(status=DunningStatus.CANCELED, next_attempt_at=None)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def claim_due_attempts(
+    db: AsyncSession,
+    now: datetime,
+    limit: int,
+) -> List[Tuple[DunningAttempt, Invoice]]:
+    """Lease up to `limit` due attempts, skipping rows another worker holds. Does not commit."""
+    result = await db.execute(
+        select(DunningAttempt, Invoice)
+        .join(Invoice, DunningAttempt.invoice_id == Invoice.id)
+        .where(
+            DunningAttempt.status == DunningStatus.SCHEDULED,
+            DunningAttempt.next_attempt_at <= now,
+        )
+        .order_by(DunningAttempt.next_attempt_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True, of=DunningAttempt)
+    )
+    claimed = [tuple(row) for row in result.all()]
+    for attempt, _ in claimed:
+        # Stays SCHEDULED, so it is due again if this worker never records it
+        attempt.next_attempt_at = now + timedelta(seconds=settings.DUNNING_LEASE_SECONDS)
+    return claimed
+
+
+async def _collect(invoice: Invoice, attempt: DunningAttempt) -> Optional[str]:
+    """Retry the charge; returns the failure reason, or None if it was paid"""
+    try:
+        # One key per dunning attempt: a re-run of the same attempt is not a second charge
+        paid = await StripeService.pay_invoice(
+            invoice.stripe_invoice_id,
+            idempotency_key=idempotency_key("invoice.pay", invoice.id, attempt.attempt_count),
+        )
+    except stripe.error.StripeError as e:
+        return e.user_message or str(e)
+    if paid.status != "paid":
+        return f"Invoice {paid.status} after retry"
+    return None
+
+
+async def _record(
+    session_factory: async_sessionmaker,
+    claimed: DunningAttempt,
+    error: Optional[str],
+    now: datetime,
+) -> Optional[str]:
+    """
+    Write one retry's outcome: recovered, rescheduled or exhausted
+    None if the attempt moved on meanwhile (canceled by invoice.paid, or
+    recorded by a worker that claimed it after the lease ran out).
+    """
+    async with session_factory() as db:
+        result = await db.execute(
+            select(DunningAttempt, Invoice)
+            .join(Invoice, DunningAttempt.invoice_id == Invoice.id)
+            .where(DunningAttempt.id == claimed.id)
+            .with_for_update(of=DunningAttempt)
+        )
+        attempt, invoice = result.one()
+        if attempt.status != DunningStatus.SCHEDULED or attempt.attempt_count != claimed.attempt_count:
+            return None
+
+        attempt.attempt_count += 1
+        attempt.last_attempt_at = now
+        attempt.last_error = error
+
+        if error is None:
+            attempt.status = DunningStatus.SUCCEEDED
+            attempt.next_attempt_at = None
+            invoice.status = InvoiceStatus.PAID
+            invoice.amount_paid = invoice.total
+            invoice.amount_due = 0
+            invoice.paid_at = now
+            outcome, from_status, to_status = "recovered", SubscriptionStatus.PAST_DUE, SubscriptionStatus.ACTIVE
+
+        elif attempt.attempt_count >= settings.DUNNING_MAX_ATTEMPTS:
+            attempt.status = DunningStatus.EXHAUSTED
+            attempt.next_attempt_at = None
+            invoice.status = InvoiceStatus.UNCOLLECTIBLE
+            outcome, from_status, to_status = "exhausted", SubscriptionStatus.PAST_DUE, SubscriptionStatus.UNPAID
+            logger.warning(f"Dunning exhausted for invoice {invoice.invoice_number}: {error}")
+
+        else:
+            attempt.next_attempt_at = now + retry_delay(attempt.attempt_count + 1)
+            outcome, from_status, to_status = "rescheduled", None, None
+
+        if from_status is not None and attempt.subscription_id is not None:
+            await db.execute(
+                update(Subscription)
+                .where(Subscription.id == attempt.subscription_id, Subscription.status == from_status)
+                .values(status=to_status)
+                .execution_options(synchronize_session=False)
+            )
+        await db.commit()
+    return outcome
+
+
+async def process_due_attempts(session_factory: async_sessionmaker, now: datetime, limit: int) -> Dict[str, int]:
+    """Retry one batch of due payments and reschedule the failures"""
+    stats = {"attempted": 0, "recovered": 0, "rescheduled": 0, "exhausted": 0, "canceled": 0}
+
+    async with session_factory() as db:
+        due = []
+        for attempt, invoice in await claim_due_attempts(db, now, limit):
+            if invoice.status == InvoiceStatus.PAID or not invoice.stripe_invoice_id:
+                attempt.status = DunningStatus.CANCELED
+                attempt.next_attempt_at = None
+                stats["canceled"] += 1
+            else:
+                due.append((attempt, invoice))
+        await db.commit()
+
+    for attempt, invoice in due:
+        stats["attempted"] += 1
+        error = await _collect(invoice, attempt)
+        outcome = await _record(session_factory, attempt, error, now)
+        if outcome is not None:
+            stats[outcome] += 1
+
+    return stats
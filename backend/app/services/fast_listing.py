@@ -0,0 +1,124 @@
+"""
+Lightweight read path for listing endpoints
+
+Listing queries select only the response columns with SQLAlchemy Core,
+keep each row in a slotted dataclass and serialize the list straight to
+JSON bytes with orjson. No ORM identity map, no instance state tracking
+and no Pydantic re-validation through from_attributes.
+"""
+from dataclasses import dataclass, fields
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Type, TypeVar
+import uuid
+
+import orjson
+from fastapi import Response
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.usage_metric import UsageMetric, MetricType
+from app.models.invoice import Invoice, InvoiceStatus
+from app.models.subscription import Subscription, SubscriptionStatus
+
+RowT = TypeVar("RowT")
+
+
+@dataclass(slots=True)
+class UsageMetricRow:
+    """Row shape of UsageMetricResponse"""
+    id: uuid.UUID
+    tenant_id: uuid.UUID
+    metric_type: MetricType
+    metric_name: str
+    value: int
+    unit: str
+    period_start: datetime
+    period_end: datetime
+    metric_metadata: Optional[Dict[str, Any]]
+    recorded_at: datetime
+    created_at: datetime
+
+
+@dataclass(slots=True)
+class InvoiceRow:
+    """Row shape of InvoiceResponse"""
+    id: uuid.UUID
+    tenant_id: uuid.UUID
+    subscription_id: Optional[uuid.UUID]
+    invoice_number: str
+    status: InvoiceStatus
+    subtotal: Decimal
+    tax: Decimal
+    total: Decimal
+    amount_paid: Decimal
+    amount_due: Decimal
+    currency: str
+    line_items: Optional[List[Dict[str, Any]]]
+    stripe_invoice_id: Optional[str]
+    invoice_pdf_url: Optional[str]
+    invoice_date: datetime
+    due_date: Optional[datetime]
+    paid_at: Optional[datetime]
+    period_start: Optional[datetime]
+    period_end: Optional[datetime]
+    created_at: datetime
+    updated_at: Optional[datetime]
+
+
+@dataclass(slots=True)
+class SubscriptionRow:
+    """Row shape of SubscriptionResponse"""
+    id: uuid.UUID
+    tenant_id: uuid.UUID
+    plan_id: uuid.UUID
+    status: SubscriptionStatus
+    stripe_subscription_id: Optional[str]
+    trial_start: Optional[datetime]
+    trial_end: Optional[datetime]
+    current_period_start: datetime
+    current_period_end: datetime
+    cancel_at_period_end: bool
+    canceled_at: Optional[datetime]
+    created_at: datetime
+    updated_at: Optional[datetime]
+
+
+def row_select(row_cls: Type, model) -> Select:
+    """Core select of exactly the columns a row dataclass needs, in field order"""
+    return select(*(getattr(model, f.name) for f in fields(row_cls)))
+
+
+def select_usage_metrics() -> Select:
+    return row_select(UsageMetricRow, UsageMetric)
+
+
+def select_invoices() -> Select:
+    return row_select(InvoiceRow, Invoice)
+
+
+def select_subscriptions() -> Select:
+    return row_select(SubscriptionRow, Subscription)
+
+
+async def fetch_rows(db: AsyncSession, row_cls: Type[RowT], query: Select) -> List[RowT]:
+    """Execute a row_select() query and build row dataclasses positionally"""
+    result = await db.execute(query)
+    return [row_cls(*row) for row in result.tuples()]
+
+
+def _default(value: Any) -> Any:
+    # Decimal is rendered as a string, matching Pydantic's JSON output
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dump_rows(rows: Sequence[Any]) -> bytes:
+    """Serialize row dataclasses to JSON bytes"""
+    return orjson.dumps(rows, default=_default, option=orjson.OPT_UTC_Z)
+
+
+def rows_response(rows: Sequence[Any]) -> Response:
+    """JSON response that bypasses response_model validation"""
+    return Response(content=dump_rows(rows), media_type="application/json")
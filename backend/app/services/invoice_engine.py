@@ -0,0 +1,329 @@
+"""
+Bulk invoice engine for due subscriptions
+
+Bills a batch of subscriptions whose period has ended in a fixed number of
+round trips: one grouped usage query, one multi-row INSERT of invoices and
+one executemany UPDATE that advances the billing periods. The caller owns
+the transaction, so invoices and period changes commit together.
+
+Idempotency comes from the (subscription_id, period_start) unique
+constraint: a rerun of the same period hits ON CONFLICT DO NOTHING and is
+reported as existing instead of billing twice.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import math
+import uuid
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import and_, bindparam, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.profiling import StageTimer, timed
+from app.models.invoice import Invoice, InvoiceStatus
+from app.models.plan import Plan, BillingInterval
+from app.models.subscription import Subscription, SubscriptionStatus
+from app.models.usage_metric import UsageMetric, MetricType
+from app.services.usage_archive import archive_cutoff, archived_period_usage
+
+CENT = Decimal("0.01")
+
+
+@dataclass(slots=True)
+class PeriodUsage:
+    """Usage of one subscription over its billing period"""
+    api_calls: int = 0
+    storage_gb: int = 0  # Peak recorded value
+
+
+@dataclass(slots=True)
+class BillingResult:
+    """Outcome of billing one batch"""
+    subscriptions: int = 0
+    generated: int = 0
+    existing: int = 0
+    ended: int = 0
+    amount: Decimal = field(default_factory=lambda: Decimal("0"))
+    by_plan: Dict[str, Dict[str, Any]] = field(default_factory=dict)  # Generated invoices per plan slug
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "subscriptions": self.subscriptions,
+            "generated": self.generated,
+            "existing": self.existing,
+            "ended": self.ended,
+            "amount": str(self.amount),
+            "by_plan": {
+                slug: {"invoices": totals["invoices"], "amount": str(totals["amount"])}
+                for slug, totals in self.by_plan.items()
+            },
+        }
+
+
+def invoice_number(subscription_id: uuid.UUID, period_start: datetime) -> str:
+    """Deterministic number, so a retried period maps to the same invoice"""
+    return f"INV-{period_start:%Y%m%d}-{subscription_id.hex[:16].upper()}"
+
+
+def next_period_end(plan: Plan, period_end: datetime) -> datetime:
+    if plan.billing_interval == BillingInterval.YEARLY:
+        return period_end + relativedelta(years=1)
+    return period_end + relativedelta(months=1)
+
+
+def build_line_items(plan: Plan, usage: PeriodUsage) -> Tuple[List[Dict[str, Any]], Decimal]:
+    """
+    Line items for one period: the plan price plus metered overage
+    Amounts in line items are cents (as stored by Stripe); the subtotal is in dollars.
+    """
+    subtotal = Decimal(plan.price)
+    line_items = [{
+        "description": f"{plan.name} plan",
+        "amount": int(subtotal * 100),
+        "quantity": 1,
+    }]
+
+    extra_calls = usage.api_calls - plan.max_api_calls
+    if extra_calls > 0 and settings.OVERAGE_PRICE_PER_1000_API_CALLS:
+        blocks = math.ceil(extra_calls / 1000)
+        unit_price = Decimal(str(settings.OVERAGE_PRICE_PER_1000_API_CALLS))
+        amount = (unit_price * blocks).quantize(CENT, ROUND_HALF_UP)
+        line_items.append({
+            "description": f"API calls over {plan.max_api_calls} (per 1,000)",
+            "amount": int(amount * 100),
+            "quantity": blocks,
+        })
+        subtotal += amount
+
+    extra_gb = usage.storage_gb - plan.max_storage_gb
+    if extra_gb > 0 and settings.OVERAGE_PRICE_PER_GB_STORAGE:
+        unit_price = Decimal(str(settings.OVERAGE_PRICE_PER_GB_STORAGE))
+        amount = (unit_price * extra_gb).quantize(CENT, ROUND_HALF_UP)
+        line_items.append({
+            "description": f"Storage over {plan.max_storage_gb} GB",
+            "amount": int(amount * 100),
+            "quantity": extra_gb,
+        })
+        subtotal += amount
+
+    return line_items, subtotal.quantize(CENT, ROUND_HALF_UP)
+
+
+async def load_period_usage(
+    db: AsyncSession,
+    subscription_ids: Sequence[uuid.UUID],
+) -> Dict[uuid.UUID, PeriodUsage]:
+    """
+    Aggregate billable usage for every subscription's current period in one query
+    Periods that reach back past the archive cutoff (yearly plans, lagging
+    periods) also add the closed months from the usage archive.
+    """
+    if not subscription_ids:
+        return {}
+
+    result = await db.execute(
+        select(
+            Subscription.id,
+            UsageMetric.metric_type,
+            func.sum(UsageMetric.value),
+            func.max(UsageMetric.value),
+        )
+        .join(
+            UsageMetric,
+            and_(
+                UsageMetric.tenant_id == Subscription.tenant_id,
+                UsageMetric.period_start >= Subscription.current_period_start,
+                UsageMetric.period_start < Subscription.current_period_end,
+            ),
+        )
+        .where(
+            Subscription.id.in_(subscription_ids),
+            UsageMetric.metric_type.in_([MetricType.API_CALLS, MetricType.STORAGE]),
+        )
+        .group_by(Subscription.id, UsageMetric.metric_type)
+    )
+
+    usage: Dict[uuid.UUID, PeriodUsage] = {}
+    for subscription_id, metric_type, total, peak in result.all():
+        entry = usage.setdefault(subscription_id, PeriodUsage())
+        if metric_type == MetricType.API_CALLS:
+            entry.api_calls = int(total or 0)
+        else:
+            entry.storage_gb = int(peak or 0)
+
+    await _add_archived_usage(db, subscription_ids, usage)
+    return usage
+
+
+async def _add_archived_usage(
+    db: AsyncSession,
+    subscription_ids: Sequence[uuid.UUID],
+    usage: Dict[uuid.UUID, PeriodUsage],
+) -> None:
+    cutoff = archive_cutoff()
+    result = await db.execute(
+        select(
+            Subscription.id,
+            Subscription.tenant_id,
+            Subscription.current_period_start,
+            Subscription.current_period_end,
+        )
+        .where(
+            Subscription.id.in_(subscription_ids),
+            Subscription.current_period_start < cutoff,
+        )
+    )
+    periods = result.all()
+    if not periods:
+        return
+
+    # Rows archived but not yet deleted (the archiver died before its commit)
+    # are still live and already counted above
+    result = await db.execute(
+        select(UsageMetric.id).where(
+            UsageMetric.tenant_id.in_({period.tenant_id for period in periods}),
+            UsageMetric.period_start < cutoff,
+        )
+    )
+    live_ids = set(result.scalars().all())
+
+    def read_archive():
+        return [
+            (period.id, archived_period_usage(
+                period.tenant_id, period.current_period_start, period.current_period_end, live_ids,
+            ))
+            for period in periods
+        ]
+
+    for subscription_id, archived in await asyncio.to_thread(read_archive):
+        entry = usage.setdefault(subscription_id, PeriodUsage())
+        calls, _ = archived.get(MetricType.API_CALLS, (0, 0))
+        _, peak = archived.get(MetricType.STORAGE, (0, 0))
+        entry.api_calls += calls
+        entry.storage_gb = max(entry.storage_gb, peak)
+
+
+def _insert_ignoring_duplicates(db: AsyncSession):
+    dialect = db.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    # Core insert on the table: skips ORM bulk-insert bookkeeping for plain rows
+    return insert(Invoice.__table__).on_conflict_do_nothing()
+
+
+async def bill_subscriptions(
+    db: AsyncSession,
+    due: Sequence[Tuple[Subscription, Plan]],
+    run_at: datetime,
+    timer: Optional[StageTimer] = None,
+) -> BillingResult:
+    """
+    Invoice the ended period of each (subscription, plan) and roll the period forward
+    Subscriptions flagged cancel_at_period_end get their final invoice and are ended.
+    A subscription several periods behind advances one period per call.
+    Does not commit. Stages are timed into `timer` when one is passed.
+    """
+    stats = BillingResult(subscriptions=len(due))
+    if not due:
+        return stats
+
+    with timed(timer, "usage"):
+        usage = await load_period_usage(db, [subscription.id for subscription, _ in due])
+
+    with timed(timer, "rating"):
+        rows = _invoice_rows(due, usage)
+
+    invoices = Invoice.__table__
+    with timed(timer, "insert"):
+        result = await db.execute(
+            _insert_ignoring_duplicates(db).returning(invoices.c.subscription_id, invoices.c.total),
+            rows,
+        )
+        inserted = result.all()
+    stats.generated = len(inserted)
+    stats.existing = len(rows) - stats.generated
+    stats.amount = sum((total for _, total in inserted), Decimal("0"))
+
+    plan_slugs = {subscription.id: plan.slug for subscription, plan in due}
+    for subscription_id, total in inserted:
+        totals = stats.by_plan.setdefault(plan_slugs[subscription_id], {"invoices": 0, "amount": Decimal("0")})
+        totals["invoices"] += 1
+        totals["amount"] += total
+
+    with timed(timer, "advance"):
+        stats.ended = await _advance_periods(db, due)
+
+    return stats
+
+
+def _invoice_rows(
+    due: Sequence[Tuple[Subscription, Plan]],
+    usage: Dict[uuid.UUID, PeriodUsage],
+) -> List[Dict[str, Any]]:
+    rows = []
+    for subscription, plan in due:
+        line_items, subtotal = build_line_items(plan, usage.get(subscription.id, PeriodUsage()))
+        invoice_date = subscription.current_period_end
+        rows.append({
+            "id": uuid.uuid4(),
+            "tenant_id": subscription.tenant_id,
+            "subscription_id": subscription.id,
+            "invoice_number": invoice_number(subscription.id, subscription.current_period_start),
+            "status": InvoiceStatus.OPEN,
+            "subtotal": subtotal,
+            "tax": Decimal("0"),
+            "total": subtotal,
+            "amount_paid": Decimal("0"),
+            "amount_due": subtotal,
+            "currency": "usd",
+            "line_items": line_items,
+            "invoice_date": invoice_date,
+            "due_date": invoice_date + timedelta(days=settings.INVOICE_DUE_DAYS),
+            "period_start": subscription.current_period_start,
+            "period_end": subscription.current_period_end,
+        })
+    return rows
+
+
+async def _advance_periods(db: AsyncSession, due: Sequence[Tuple[Subscription, Plan]]) -> int:
+    """Roll each billed period forward; returns how many subscriptions ended"""
+    # Already-invoiced periods are rolled forward too, so a half-finished
+    # earlier run cannot leave a subscription stuck on a billed period.
+    # Matching on the old period start makes a concurrent advance a no-op.
+    ended = 0
+    renewals = []
+    for subscription, plan in due:
+        ends = subscription.cancel_at_period_end
+        ended += ends
+        renewals.append({
+            "b_id": subscription.id,
+            "b_period_start": subscription.current_period_start,
+            "new_start": subscription.current_period_end,
+            "new_end": (
+                subscription.current_period_end if ends
+                else next_period_end(plan, subscription.current_period_end)
+            ),
+            "new_status": SubscriptionStatus.CANCELED if ends else subscription.status,
+            "new_ended_at": subscription.current_period_end if ends else subscription.ended_at,
+        })
+
+    table = Subscription.__table__
+    await db.execute(
+        update(table)
+        .where(
+            table.c.id == bindparam("b_id"),
+            table.c.current_period_start == bindparam("b_period_start"),
+        )
+        .values(
+            current_period_start=bindparam("new_start"),
+            current_period_end=bindparam("new_end"),
+            status=bindparam("new_status"),
+            ended_at=bindparam("new_ended_at"),
+        ),
+        renewals,
+    )
+    return ended
@@ -0,0 +1,46 @@
+"""
+Stripe customers for tenants, kept off the signup path
+
+Registration commits the tenant without calling Stripe and queues
+`create_stripe_customer`. Anything that needs the customer before that
+task has run (e.g. a paid subscription) calls `ensure_stripe_customer`,
+which creates it on demand under a row lock on the tenant, so concurrent
+callers create one customer. The outbox creates it without the lock; the
+idempotency key derived from the tenant id, with parameters built from
+the tenant alone, makes that race replay the first customer.
+"""
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.tenant import Tenant
+from app.services.stripe_service import StripeService
+
+
+async def ensure_stripe_customer(db: AsyncSession, tenant: Tenant) -> str:
+    """
+    Stripe customer id of `tenant`, creating the customer if it has none
+    Commits when it creates one, which also releases the tenant lock.
+    """
+    if tenant.stripe_customer_id:
+        return tenant.stripe_customer_id
+
+    # Re-read under the lock: another request may have just created it
+    result = await db.execute(
+        select(Tenant)
+        .where(Tenant.id == tenant.id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )
+    tenant = result.scalar_one()
+    if tenant.stripe_customer_id:
+        await db.commit()
+        return tenant.stripe_customer_id
+
+    try:
+        customer = await StripeService.create_customer(tenant)
+    except Exception:
+        await db.rollback()
+        raise
+    tenant.stripe_customer_id = customer["id"]
+    await db.commit()
+    return tenant.stripe_customer_id
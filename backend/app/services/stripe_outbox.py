@@ -0,0 +1,365 @@
+"""
+Transactional outbox for Stripe side effects
+
+Subscription writes in async mode change local state and insert a
+`stripe_outbox` row in one transaction, then return. Updates and cancels
+record what they replaced (`change_locally`), so an operation that fails
+for good puts the local row back the way Stripe still has it. The drainer sends
+the rows to Stripe later, so no request holds a pooled connection or an
+open transaction while Stripe is slow.
+
+Draining runs in three short steps per batch:
+
+1. Claim: due rows are locked with FOR UPDATE SKIP LOCKED, marked
+   PROCESSING with a lease (OUTBOX_LEASE_SECONDS), and committed. A row
+   whose drainer died is claimed again once its lease runs out. A row is
+   never claimed while an older unfinished row exists for the same
+   subscription, so operations on one subscription apply in order.
+2. Send: each operation calls Stripe with no session open, at most
+   OUTBOX_CONCURRENCY at a time. The idempotency key is derived from the
+   operation id, so a re-claimed row cannot act twice.
+3. Apply: the Stripe result is written to the local rows and the
+   operation completed in one transaction.
+
+Errors where Stripe is unavailable are retried with exponential backoff
+up to OUTBOX_MAX_ATTEMPTS; anything else, including an error while
+applying the result, fails the operation. A row whose lease runs out on
+its last attempt is failed at the next claim rather than sent again.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+import asyncio
+import enum
+import logging
+import uuid
+
+from sqlalchemy import exists, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import aliased
+
+from app.core.config import settings
+from app.models.stripe_operation import OperationStatus, StripeOperation
+from app.models.subscription import Subscription, SubscriptionStatus
+from app.models.tenant import Tenant
+from app.services.stripe_reconciliation import subscription_values
+from app.services.stripe_resilience import idempotency_key, is_unavailable
+from app.services.stripe_service import StripeService, from_timestamp, subscription_item
+
+logger = logging.getLogger(__name__)
+
+CREATE_SUBSCRIPTION = "subscription.create"
+UPDATE_SUBSCRIPTION = "subscription.update"
+CANCEL_SUBSCRIPTION = "subscription.cancel"
+
+UNFINISHED = [OperationStatus.PENDING, OperationStatus.PROCESSING]
+
+
+def enqueue_operation(
+    db: AsyncSession,
+    tenant_id: uuid.UUID,
+    operation: str,
+    payload: Dict[str, Any],
+    now: datetime,
+    subscription_id: Optional[uuid.UUID] = None,
+) -> StripeOperation:
+    """Add an outbox row to the caller's transaction. Does not commit."""
+    op = StripeOperation(
+        id=uuid.uuid4(),
+        tenant_id=tenant_id,
+        subscription_id=subscription_id,
+        operation=operation,
+        payload=payload,
+        status=OperationStatus.PENDING,
+        attempts=0,
+        next_attempt_at=now,
+        created_at=now,
+    )
+    db.add(op)
+    return op
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        # Naive values are UTC; aware ones come back from PostgreSQL
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+
+_DECODE: Dict[str, Callable[[Any], Any]] = {
+    "plan_id": uuid.UUID,
+    "status": SubscriptionStatus,
+    "canceled_at": datetime.fromisoformat,
+    "ended_at": datetime.fromisoformat,
+}
+
+
+def change_locally(subscription: Subscription, payload: Dict[str, Any], **values: Any) -> None:
+    """
+    Set `values` on the subscription ahead of Stripe
+    Each field's previous and new value go into the operation payload
+    under "revert", for `_revert_local_change`.
+    """
+    revert = payload.setdefault("revert", {})
+    for field, value in values.items():
+        revert[field] = [_encode(getattr(subscription, field)), _encode(value)]
+        setattr(subscription, field, value)
+
+
+def retry_delay(attempt: int) -> timedelta:
+    """Delay after failed attempt number `attempt` (1-based)"""
+    seconds = settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempt - 1)
+    return timedelta(seconds=min(seconds, settings.OUTBOX_RETRY_MAX_SECONDS))
+
+
+async def claim_operations(db: AsyncSession, now: datetime, limit: int) -> List[StripeOperation]:
+    """Lease up to `limit` due operations, oldest first, one per subscription. Does not commit."""
+    earlier = aliased(StripeOperation)
+    blocked = exists().where(
+        earlier.subscription_id == StripeOperation.subscription_id,
+        earlier.created_at < StripeOperation.created_at,
+        earlier.status.in_(UNFINISHED),
+    )
+    result = await db.execute(
+        select(StripeOperation)
+        .where(
+            StripeOperation.status.in_(UNFINISHED),
+            StripeOperation.next_attempt_at <= now,
+            ~blocked,
+        )
+        .order_by(StripeOperation.created_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True, of=StripeOperation)
+    )
+    operations = []
+    for op in result.scalars().all():
+        if op.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            # Leased on its last attempt and never recorded: give up, and stop blocking its subscription
+            op.status = OperationStatus.FAILED
+            op.next_attempt_at = None
+            op.completed_at = now
+            op.last_error = op.last_error or f"Lease expired after {op.attempts} attempts"
+            handler = HANDLERS[op.operation]
+            if handler.fail is not None:
+                await handler.fail(db, op)
+            logger.error(f"Stripe operation {op.operation} {op.id} failed: {op.last_error}")
+            continue
+        operations.append(op)
+    for op in operations:
+        op.status = OperationStatus.PROCESSING
+        op.attempts += 1
+        op.next_attempt_at = now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+    return operations
+
+
+# Handlers. `send` loads what it needs in its own session and calls Stripe
+# with none open; `apply` writes the outcome inside the completing
+# transaction; `fail` runs there when the operation is given up.
+
+async def _load(session_factory: async_sessionmaker, op: StripeOperation):
+    async with session_factory() as db:
+        result = await db.execute(
+            select(Subscription, Tenant)
+            .join(Tenant, Subscription.tenant_id == Tenant.id)
+            .where(Subscription.id == op.subscription_id)
+        )
+        return result.one()
+
+
+async def _send_create(op: StripeOperation, session_factory: async_sessionmaker) -> Any:
+    subscription, tenant = await _load(session_factory, op)
+    customer_id = tenant.stripe_customer_id
+    if not customer_id:
+        # Signup's task has not run yet. No lock here (no session is open);
+        # the tenant-derived idempotency key makes a race create one customer.
+        customer = await StripeService.create_customer(tenant)
+        customer_id = customer["id"]
+    return await StripeService.create_subscription(
+        customer_id=customer_id,
+        price_id=op.payload["price_id"],
+        trial_days=op.payload.get("trial_days"),
+        payment_method_id=op.payload.get("payment_method_id"),
+        metadata={"tenant_id": str(tenant.id), "subscription_id": str(subscription.id)},
+        idempotency_key=idempotency_key(op.operation, op.id),
+    )
+
+
+async def _apply_create(db: AsyncSession, op: StripeOperation, remote: Any) -> Dict[str, Any]:
+    subscription = await db.get(Subscription, op.subscription_id)
+    tenant = await db.get(Tenant, op.tenant_id)
+    if not tenant.stripe_customer_id:
+        tenant.stripe_customer_id = remote["customer"]
+
+    values = subscription_values(remote, subscription)
+    # Cancel flags stay as they are: a later queued update may have changed them
+    for field in ("status", "current_period_start", "current_period_end",
+                  "stripe_subscription_item_id", "stripe_price_id"):
+        setattr(subscription, field, values[field])
+    subscription.stripe_subscription_id = remote["id"]
+    subscription.stripe_customer_id = remote["customer"]
+    for field in ("trial_start", "trial_end"):
+        setattr(subscription, field, from_timestamp(remote.get(field)))
+    return {"stripe_subscription_id": remote["id"], "status": remote["status"]}
+
+
+async def _fail_create(db: AsyncSession, op: StripeOperation) -> None:
+    await db.execute(
+        update(Subscription)
+        .where(Subscription.id == op.subscription_id)
+        .values(status=SubscriptionStatus.INCOMPLETE_EXPIRED)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def _revert_local_change(db: AsyncSession, op: StripeOperation) -> None:
+    """Undo the request's local change, field by field, unless a later request replaced it"""
+    revert = op.payload.get("revert")
+    if not revert:
+        return
+    subscription = await db.get(Subscription, op.subscription_id)
+    if subscription is None:
+        return
+    for field, (previous, applied) in revert.items():
+        if _encode(getattr(subscription, field)) == applied:
+            decode = _DECODE.get(field)
+            setattr(subscription, field, decode(previous) if decode and previous is not None else previous)
+
+
+async def _send_update(op: StripeOperation, session_factory: async_sessionmaker) -> Any:
+    subscription, _ = await _load(session_factory, op)
+    if not subscription.stripe_subscription_id:
+        # Never reached Stripe: the local change is all there is
+        return None
+    return await StripeService.update_subscription(
+        subscription.stripe_subscription_id,
+        price_id=op.payload.get("price_id"),
+        cancel_at_period_end=op.payload.get("cancel_at_period_end"),
+        item_id=subscription.stripe_subscription_item_id,
+        idempotency_key=idempotency_key(op.operation, op.id),
+    )
+
+
+async def _apply_update(db: AsyncSession, op: StripeOperation, remote: Any) -> Dict[str, Any]:
+    if remote is None:
+        return {"stripe": "skipped"}
+    subscription = await db.get(Subscription, op.subscription_id)
+    subscription.stripe_subscription_item_id, subscription.stripe_price_id = subscription_item(remote)
+    return {"stripe_subscription_id": remote["id"], "status": remote["status"]}
+
+
+async def _send_cancel(op: StripeOperation, session_factory: async_sessionmaker) -> Any:
+    subscription, _ = await _load(session_factory, op)
+    if not subscription.stripe_subscription_id:
+        return None
+    return await StripeService.cancel_subscription(
+        subscription.stripe_subscription_id,
+        immediately=op.payload.get("immediately", False),
+        idempotency_key=idempotency_key(op.operation, op.id),
+    )
+
+
+async def _apply_cancel(db: AsyncSession, op: StripeOperation, remote: Any) -> Dict[str, Any]:
+    if remote is None:
+        return {"stripe": "skipped"}
+    return {"stripe_subscription_id": remote["id"], "status": remote["status"]}
+
+
+class Handler(NamedTuple):
+    send: Callable[[StripeOperation, async_sessionmaker], Awaitable[Any]]
+    apply: Callable[[AsyncSession, StripeOperation, Any], Awaitable[Dict[str, Any]]]
+    fail: Optional[Callable[[AsyncSession, StripeOperation], Awaitable[None]]] = None
+
+
+HANDLERS: Dict[str, Handler] = {
+    CREATE_SUBSCRIPTION: Handler(_send_create, _apply_create, _fail_create),
+    UPDATE_SUBSCRIPTION: Handler(_send_update, _apply_update, _revert_local_change),
+    CANCEL_SUBSCRIPTION: Handler(_send_cancel, _apply_cancel, _revert_local_change),
+}
+
+
+async def _record_error(
+    session_factory: async_sessionmaker,
+    op: StripeOperation,
+    handler: Handler,
+    error: Exception,
+    now: datetime,
+) -> str:
+    """Reschedule or fail an operation after a failed send or apply: retried or failed"""
+    retry = is_unavailable(error) and op.attempts < settings.OUTBOX_MAX_ATTEMPTS
+    async with session_factory() as db:
+        values = {"last_error": str(error)}
+        if retry:
+            values.update(status=OperationStatus.PENDING, next_attempt_at=now + retry_delay(op.attempts))
+        else:
+            values.update(status=OperationStatus.FAILED, next_attempt_at=None, completed_at=now)
+            if handler.fail is not None:
+                await handler.fail(db, op)
+        await db.execute(
+            update(StripeOperation)
+            .where(StripeOperation.id == op.id)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+    if retry:
+        logger.info(f"Retrying {op.operation} {op.id} after attempt {op.attempts}: {error}")
+        return "retried"
+    logger.error(f"Stripe operation {op.operation} {op.id} failed: {error}")
+    return "failed"
+
+
+async def deliver_operation(session_factory: async_sessionmaker, op: StripeOperation, now: datetime) -> str:
+    """Send one claimed operation and record the outcome: succeeded, retried or failed"""
+    handler = HANDLERS[op.operation]
+    try:
+        remote = await handler.send(op, session_factory)
+    except Exception as e:
+        return await _record_error(session_factory, op, handler, e, now)
+
+    try:
+        async with session_factory() as db:
+            result = await handler.apply(db, op, remote)
+            await db.execute(
+                update(StripeOperation)
+                .where(StripeOperation.id == op.id)
+                .values(
+                    status=OperationStatus.SUCCEEDED,
+                    result=result,
+                    last_error=None,
+                    next_attempt_at=None,
+                    completed_at=now,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+    except Exception as e:
+        # e.g. the subscription was deleted meanwhile; the session rolled back on exit
+        return await _record_error(session_factory, op, handler, e, now)
+    return "succeeded"
+
+
+async def drain_outbox(session_factory: async_sessionmaker, now: datetime, limit: int) -> Dict[str, int]:
+    """Claim and deliver one batch, OUTBOX_CONCURRENCY operations at a time"""
+    async with session_factory() as db:
+        operations = await claim_operations(db, now, limit)
+        await db.commit()
+
+    stats = {"claimed": len(operations), "succeeded": 0, "retried": 0, "failed": 0}
+    semaphore = asyncio.Semaphore(settings.OUTBOX_CONCURRENCY)
+
+    async def deliver(op: StripeOperation) -> None:
+        async with semaphore:
+            outcome = await deliver_operation(session_factory, op, now)
+        stats[outcome] += 1
+
+    # One operation's unexpected error must not abandon the rest of the batch
+    results = await asyncio.gather(*(deliver(op) for op in operations), return_exceptions=True)
+    for op, result in zip(operations, results):
+        if isinstance(result, Exception):
+            logger.error(f"Delivering Stripe operation {op.operation} {op.id} failed: {result}", exc_info=result)
+    return stats
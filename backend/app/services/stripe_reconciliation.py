@@ -0,0 +1,184 @@
+"""
+Stripe -> database reconciliation
+
+Webhooks can be dropped, leaving subscriptions and invoices in the
+database behind Stripe. This job pages through Stripe with
+`starting_after` cursors and treats each page as one chunk: the page's
+rows are read in one `IN (...)` query, indexed by Stripe id in a dict,
+diffed in memory, and the drifted rows are fixed with one executemany
+UPDATE before the page commits.
+
+Subscriptions are listed with `expand=["data.latest_invoice"]`, so each
+subscription's latest invoice is reconciled from the same page without a
+retrieve per invoice. A second pass lists invoices created within
+RECONCILE_INVOICE_LOOKBACK_DAYS to catch older ones.
+"""
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Callable, Dict, Optional, Tuple
+import time
+
+from stripe.stripe_object import StripeObject
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.invoice import Invoice, InvoiceStatus
+from app.models.subscription import Subscription, SubscriptionStatus
+from app.services.stripe_service import StripeService, from_timestamp, subscription_item
+
+SUBSCRIPTION_STATUSES = {status.value: status for status in SubscriptionStatus}
+INVOICE_STATUSES = {status.value: status for status in InvoiceStatus}
+
+
+def _comparable(value: Any) -> Any:
+    """Naive UTC for datetimes (PostgreSQL returns aware ones), the value otherwise"""
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _cents(value: Optional[int]) -> Decimal:
+    return (Decimal(value or 0) / 100).quantize(Decimal("0.01"))
+
+
+def subscription_values(remote: StripeObject, current: Any) -> Dict[str, Any]:
+    """Columns of a Subscription row as Stripe has them"""
+    item_id, price_id = subscription_item(remote)
+    return {
+        # Statuses we do not model (e.g. paused) leave ours unchanged
+        "status": SUBSCRIPTION_STATUSES.get(remote["status"], current.status),
+        "current_period_start": from_timestamp(remote["current_period_start"]),
+        "current_period_end": from_timestamp(remote["current_period_end"]),
+        "cancel_at_period_end": bool(remote.get("cancel_at_period_end")),
+        "canceled_at": from_timestamp(remote.get("canceled_at")),
+        "ended_at": from_timestamp(remote.get("ended_at")),
+        # Backfills rows created before these ids were stored
+        "stripe_subscription_item_id": item_id or current.stripe_subscription_item_id,
+        "stripe_price_id": price_id or current.stripe_price_id,
+    }
+
+
+def invoice_values(remote: StripeObject, current: Any) -> Dict[str, Any]:
+    """Columns of an Invoice row as Stripe has them"""
+    transitions = remote.get("status_transitions") or {}
+    return {
+        "status": INVOICE_STATUSES.get(remote["status"], current.status),
+        "total": _cents(remote.get("total")),
+        "amount_paid": _cents(remote.get("amount_paid")),
+        "amount_due": _cents(remote.get("amount_due")),
+        "paid_at": from_timestamp(transitions.get("paid_at")),
+    }
+
+
+# model -> (column holding the Stripe id, remote -> column values)
+TARGETS: Dict[type, Tuple[Any, Callable[[StripeObject, Any], Dict[str, Any]]]] = {
+    Subscription: (Subscription.stripe_subscription_id, subscription_values),
+    Invoice: (Invoice.stripe_invoice_id, invoice_values),
+}
+
+FIELDS = {
+    Subscription: (
+        "status", "current_period_start", "current_period_end", "cancel_at_period_end", "canceled_at", "ended_at",
+        "stripe_subscription_item_id", "stripe_price_id",
+    ),
+    Invoice: ("status", "total", "amount_paid", "amount_due", "paid_at"),
+}
+
+
+def _new_counts() -> Dict[str, int]:
+    return {"fetched": 0, "matched": 0, "missing": 0, "corrected": 0}
+
+
+async def reconcile_chunk(
+    db: AsyncSession,
+    model: type,
+    remote_objects: Dict[str, StripeObject],
+    counts: Dict[str, int],
+) -> None:
+    """Diff one page of Stripe objects against their rows and fix drift. Does not commit."""
+    counts["fetched"] += len(remote_objects)
+    if not remote_objects:
+        return
+
+    stripe_id, to_values = TARGETS[model]
+    fields = FIELDS[model]
+    result = await db.execute(
+        select(model.id, stripe_id.label("stripe_id"), *(getattr(model, f) for f in fields))
+        .where(stripe_id.in_(list(remote_objects)))
+    )
+    current = {row.stripe_id: row for row in result.all()}
+
+    corrections = []
+    for key, remote in remote_objects.items():
+        row = current.get(key)
+        if row is None:
+            # Created outside this app, or the create never got recorded
+            counts["missing"] += 1
+            continue
+
+        counts["matched"] += 1
+        desired = to_values(remote, row)
+        if any(_comparable(getattr(row, f)) != desired[f] for f in fields):
+            corrections.append({"b_id": row.id, **{f"v_{f}": value for f, value in desired.items()}})
+
+    if corrections:
+        table = model.__table__
+        await db.execute(
+            update(table)
+            .where(table.c.id == bindparam("b_id"))
+            .values({f: bindparam(f"v_{f}") for f in fields}),
+            corrections,
+        )
+        counts["corrected"] += len(corrections)
+
+
+async def reconcile_with_stripe(db: AsyncSession, now: datetime) -> Dict[str, Any]:
+    """
+    Page through Stripe subscriptions and recent invoices and correct drifted rows
+    Commits once per page. Returns per-model counts, Stripe pages fetched
+    (one API call each) and throughput.
+    """
+    started = time.perf_counter()
+    stats = {"subscriptions": _new_counts(), "invoices": _new_counts(), "pages": 0}
+
+    cursor = None
+    while True:
+        page = await StripeService.list_subscriptions(
+            starting_after=cursor,
+            limit=settings.RECONCILE_PAGE_SIZE,
+            expand=["data.latest_invoice"],
+        )
+        stats["pages"] += 1
+        await reconcile_chunk(db, Subscription, {s.id: s for s in page.data}, stats["subscriptions"])
+        latest = {
+            s.latest_invoice.id: s.latest_invoice
+            for s in page.data
+            if isinstance(s.get("latest_invoice"), StripeObject)
+        }
+        await reconcile_chunk(db, Invoice, latest, stats["invoices"])
+        await db.commit()
+        if not page.has_more or not page.data:
+            break
+        cursor = page.data[-1].id
+
+    since = int((now - timedelta(days=settings.RECONCILE_INVOICE_LOOKBACK_DAYS)).replace(tzinfo=timezone.utc).timestamp())
+    cursor = None
+    while True:
+        page = await StripeService.list_invoices(
+            starting_after=cursor,
+            limit=settings.RECONCILE_PAGE_SIZE,
+            created_gte=since,
+        )
+        stats["pages"] += 1
+        await reconcile_chunk(db, Invoice, {i.id: i for i in page.data}, stats["invoices"])
+        await db.commit()
+        if not page.has_more or not page.data:
+            break
+        cursor = page.data[-1].id
+
+    seconds = time.perf_counter() - started
+    fetched = stats["subscriptions"]["fetched"] + stats["invoices"]["fetched"]
+    stats["seconds"] = round(seconds, 3)
+    stats["objects_per_second"] = round(fetched / seconds, 1) if seconds else 0
+    return stats
@@ -0,0 +1,225 @@
+"""
+Call policy for Stripe: idempotency keys, retries and a circuit breaker
+
+Every StripeService call goes through `call_stripe`:
+
+- Mutating calls carry an idempotency key. Callers derive it from our own
+  ids (`idempotency_key("subscription.create", subscription.id)`), so a
+  request retried by us, by Celery or by the client is applied once;
+  otherwise one key is drawn per call and reused across its retries.
+- Only errors Stripe says are transient (connection failures, 429, 409
+  and 5xx, or an explicit `Stripe-Should-Retry` header) are retried, with
+  full-jitter exponential backoff, and never past
+  STRIPE_RETRY_DEADLINE_SECONDS from the first attempt.
+- A per-process breaker watches the transient error rate over a sliding
+  window. Once it trips, calls fail fast with CircuitOpenError until a
+  single probe after the cooldown succeeds.
+
+Counters for calls, retries, failures and short circuits, and the breaker
+state, are kept per process and served by GET /health/stripe.
+"""
+from collections import Counter, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+import asyncio
+import logging
+import random
+import threading
+import time
+import uuid
+
+import stripe
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Fixed namespace: the same ids always produce the same key
+IDEMPOTENCY_NAMESPACE = uuid.UUID("5b0e8f44-3c1d-4f3e-9a57-2f6c1d8e7a90")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(stripe.error.APIConnectionError):
+    """Raised without calling Stripe while the breaker is open"""
+
+
+def idempotency_key(operation: str, *ids: Any) -> str:
+    """Deterministic key for `operation` on our own ids"""
+    return str(uuid.uuid5(IDEMPOTENCY_NAMESPACE, ":".join([operation, *(str(i) for i in ids)])))
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether Stripe may succeed if the same request is sent again"""
+    if isinstance(error, CircuitOpenError) or not isinstance(error, stripe.error.StripeError):
+        return False
+    advice = (error.headers or {}).get("stripe-should-retry")
+    if advice is not None:
+        return advice == "true"
+    if isinstance(error, stripe.error.APIConnectionError):
+        return True
+    return error.http_status in (409, 429) or (error.http_status or 0) >= 500
+
+
+def is_unavailable(error: Exception) -> bool:
+    """Stripe is down or shedding load, as opposed to rejecting the request"""
+    return isinstance(error, CircuitOpenError) or is_retryable(error)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full jitter: uniform in [0, min(max, base * 2^attempt)]"""
+    ceiling = min(settings.STRIPE_RETRY_MAX_DELAY_SECONDS, settings.STRIPE_RETRY_BASE_DELAY_SECONDS * 2 ** attempt)
+    return random.uniform(0, ceiling)
+
+
+class CircuitBreaker:
+    """
+    Error-rate breaker over a sliding time window
+    Opens when at least `min_calls` outcomes in the window include an
+    `error_rate` share of transient failures. After `cooldown` seconds one
+    probe is let through: success closes the breaker, failure reopens it.
+    """
+
+    def __init__(
+        self,
+        window: float,
+        min_calls: int,
+        error_rate: float,
+        cooldown: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go to Stripe now"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self.clock() - self.opened_at >= self.cooldown:
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record(self, ok: bool) -> None:
+        """Record the outcome of a call that `allow` let through"""
+        with self._lock:
+            now = self.clock()
+            if self.state == HALF_OPEN:
+                self._probing = False
+                self._outcomes.clear()
+                if ok:
+                    self._set_state(CLOSED)
+                else:
+                    self._open(now)
+                return
+
+            self._outcomes.append((now, ok))
+            while self._outcomes and self._outcomes[0][0] < now - self.window:
+                self._outcomes.popleft()
+            failures = sum(1 for _, success in self._outcomes if not success)
+            if (
+                self.state == CLOSED
+                and len(self._outcomes) >= self.min_calls
+                and failures / len(self._outcomes) >= self.error_rate
+            ):
+                self._open(now)
+
+    def release(self) -> None:
+        """Give up a call that ended without an outcome (e.g. cancelled)"""
+        with self._lock:
+            self._probing = False
+
+    def _open(self, now: float) -> None:
+        self.opened_at = now
+        self.times_opened += 1
+        self._outcomes.clear()
+        self._set_state(OPEN)
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            logger.warning(f"Stripe circuit breaker {self.state} -> {state}")
+            self.state = state
+
+
+breaker = CircuitBreaker(
+    window=settings.STRIPE_BREAKER_WINDOW_SECONDS,
+    min_calls=settings.STRIPE_BREAKER_MIN_CALLS,
+    error_rate=settings.STRIPE_BREAKER_ERROR_RATE,
+    cooldown=settings.STRIPE_BREAKER_COOLDOWN_SECONDS,
+)
+
+# (operation, counter) -> count
+metrics: Counter = Counter()
+
+
+async def call_stripe(
+    operation: str,
+    send: Callable[..., Awaitable[T]],
+    *args: Any,
+    idempotency_key: Optional[str] = None,
+    mutating: bool = True,
+    **kwargs: Any,
+) -> T:
+    """
+    Await `send(*args, **kwargs)` under the retry and breaker policy
+    Mutating calls are sent with `idempotency_key`, or one drawn for this
+    call, so retries cannot apply them twice.
+    """
+    if mutating:
+        kwargs["idempotency_key"] = idempotency_key or str(uuid.uuid4())
+    deadline = time.monotonic() + settings.STRIPE_RETRY_DEADLINE_SECONDS
+    attempt = 0
+
+    while True:
+        if not breaker.allow():
+            metrics[(operation, "short_circuited")] += 1
+            raise CircuitOpenError(f"Stripe circuit open, {operation} not attempted")
+
+        metrics[(operation, "calls")] += 1
+        try:
+            result = await send(*args, **kwargs)
+        except stripe.error.StripeError as e:
+            retryable = is_retryable(e)
+            # Declines and invalid requests say nothing about Stripe's health
+            breaker.record(not retryable)
+            delay = backoff_delay(attempt)
+            if not retryable or attempt >= settings.STRIPE_MAX_RETRIES or time.monotonic() + delay > deadline:
+                metrics[(operation, "failures")] += 1
+                raise
+            metrics[(operation, "retries")] += 1
+            attempt += 1
+            logger.info(f"Retrying Stripe {operation} in {delay:.2f}s (attempt {attempt}): {e}")
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            breaker.release()
+            raise
+
+        breaker.record(True)
+        return result
+
+
+def stripe_stats() -> Dict[str, Any]:
+    """Breaker state and per-operation counters for this process"""
+    operations: Dict[str, Dict[str, int]] = {}
+    for (operation, counter), value in metrics.items():
+        operations.setdefault(operation, {})[counter] = value
+    return {
+        "breaker": {"state": breaker.state, "times_opened": breaker.times_opened},
+        "operations": operations,
+    }
@@ -1,29 +1,100 @@
+import asyncio
+import functools
 import stripe
-from typing import Optional, Dict, Any
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from stripe.http_client import RequestsClient
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple, TypeVar
+from datetime import datetime
 from decimal import Decimal
 
 from app.core.config import settings
 from app.models.tenant import Tenant
+from app.services.stripe_resilience import call_stripe, idempotency_key as make_idempotency_key
+
+T = TypeVar("T")
 
 # Configure Stripe
 stripe.api_key = settings.STRIPE_SECRET_KEY
+if settings.STRIPE_API_BASE:
+    stripe.api_base = settings.STRIPE_API_BASE
+
+# The SDK (7.x) is synchronous. Calls run on a bounded thread pool so a slow
+# Stripe response never blocks the event loop; each pool thread keeps its own
+# keep-alive requests session (RequestsClient is thread-local).
+# Retries are ours (stripe_resilience), not the SDK's
+stripe.max_network_retries = 0
+stripe.default_http_client = RequestsClient(
+    timeout=(settings.STRIPE_CONNECT_TIMEOUT_SECONDS, settings.STRIPE_READ_TIMEOUT_SECONDS),
+)
+_executor = ThreadPoolExecutor(max_workers=settings.STRIPE_MAX_CONCURRENCY, thread_name_prefix="stripe")
+
+
+async def _offload(call: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking SDK call on the Stripe pool and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(call, *args, **kwargs))
+
+
+async def _call(
+    operation: str,
+    call: Callable[..., T],
+    *args: Any,
+    idempotency_key: Optional[str] = None,
+    mutating: bool = True,
+    **kwargs: Any,
+) -> T:
+    """Offload an SDK call under the retry and circuit breaker policy"""
+    return await call_stripe(
+        operation, _offload, call, *args,
+        idempotency_key=idempotency_key, mutating=mutating, **kwargs,
+    )
+
+
+# Stripe subscription id -> its item id, for rows stored before the item id
+# was persisted; bounded LRU, per process
+_item_ids: "OrderedDict[str, str]" = OrderedDict()
+
+
+def from_timestamp(value: Optional[int]) -> Optional[datetime]:
+    """Naive UTC datetime of a Stripe timestamp, like the rest of our columns"""
+    return datetime.utcfromtimestamp(value) if value else None
+
+
+def subscription_item(subscription: Mapping[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    """(item id, price id) of a single-item Stripe subscription, Nones if not expanded"""
+    items = (subscription.get("items") or {}).get("data") or []
+    if not items:
+        return None, None
+    price = items[0].get("price")
+    return items[0].get("id"), price.get("id") if isinstance(price, Mapping) else price
+
+
+def remember_item(subscription: Mapping[str, Any]) -> None:
+    """Cache the item id of a Stripe subscription payload"""
+    item_id, _ = subscription_item(subscription)
+    if item_id and subscription.get("id"):
+        _item_ids[subscription["id"]] = item_id
+        _item_ids.move_to_end(subscription["id"])
+        while len(_item_ids) > settings.STRIPE_ITEM_CACHE_SIZE:
+            _item_ids.popitem(last=False)
 
 
 class StripeService:
     """Service for Stripe payment processing"""
     
     @staticmethod
-    async def create_customer(
-        tenant: Tenant,
-        email: str,
-        name: str,
-        metadata: Optional[Dict[str, Any]] = None,
-    ) -> stripe.Customer:
-        """Create a Stripe customer"""
+    async def create_customer(tenant: Tenant) -> stripe.Customer:
+        """
+        Create the Stripe customer of `tenant`
+        Every parameter comes from the tenant: callers that race share the
+        tenant-derived idempotency key, which Stripe only replays for an
+        identical request.
+        """
         customer_data = {
-            "email": email,
-            "name": name,
-            "metadata": metadata or {},
+            "email": tenant.email,
+            "name": tenant.name,
+            "metadata": {"tenant_id": str(tenant.id), "tenant_slug": tenant.slug} if tenant.id else {},
         }
         
         if tenant.address_line1:
@@ -36,7 +107,12 @@ class StripeService:
                 "country": tenant.country,
             }
         
-        customer = stripe.Customer.create(**customer_data)
+        customer = await _call(
+            "customer.create",
+            stripe.Customer.create,
+            idempotency_key=make_idempotency_key("customer.create", tenant.id) if tenant.id else None,
+            **customer_data,
+        )
         return customer
     
     @staticmethod
@@ -44,9 +120,13 @@ class StripeService:
         name: str,
         description: Optional[str] = None,
         metadata: Optional[Dict[str, Any]] = None,
+        idempotency_key: Optional[str] = None,
     ) -> stripe.Product:
         """Create a Stripe product"""
-        product = stripe.Product.create(
+        product = await _call(
+            "product.create",
+            stripe.Product.create,
+            idempotency_key=idempotency_key,
             name=name,
             description=description,
             metadata=metadata or {},
@@ -60,12 +140,16 @@ class StripeService:
         currency: str = "usd",
         interval: str = "month",  # "month" or "year"
         metadata: Optional[Dict[str, Any]] = None,
+        idempotency_key: Optional[str] = None,
     ) -> stripe.Price:
         """Create a Stripe price"""
         # Convert to cents
         amount_cents = int(amount * 100)
         
-        price = stripe.Price.create(
+        price = await _call(
+            "price.create",
+            stripe.Price.create,
+            idempotency_key=idempotency_key,
             product=product_id,
             unit_amount=amount_cents,
             currency=currency,
@@ -81,6 +165,7 @@ class StripeService:
         trial_days: Optional[int] = None,
         payment_method_id: Optional[str] = None,
         metadata: Optional[Dict[str, Any]] = None,
+        idempotency_key: Optional[str] = None,
     ) -> stripe.Subscription:
         """Create a Stripe subscription"""
         subscription_data = {
@@ -97,7 +182,13 @@ class StripeService:
         if payment_method_id:
             subscription_data["default_payment_method"] = payment_method_id
         
-        subscription = stripe.Subscription.create(**subscription_data)
+        subscription = await _call(
+            "subscription.create",
+            stripe.Subscription.create,
+            idempotency_key=idempotency_key,
+            **subscription_data,
+        )
+        remember_item(subscription)
         return subscription
     
     @staticmethod
@@ -105,37 +196,59 @@ class StripeService:
         subscription_id: str,
         price_id: Optional[str] = None,
         cancel_at_period_end: Optional[bool] = None,
+        item_id: Optional[str] = None,
+        idempotency_key: Optional[str] = None,
     ) -> stripe.Subscription:
-        """Update a Stripe subscription"""
+        """
+        Update a Stripe subscription
+        A plan change needs the subscription item id: pass the stored one.
+        Legacy rows without it fall back to the process cache, then to a
+        retrieve, so a plan change is normally a single modify call.
+        """
         update_data = {}
         
         if price_id:
-            # Get current subscription to update items
-            subscription = stripe.Subscription.retrieve(subscription_id)
-            update_data["items"] = [
-                {
-                    "id": subscription["items"]["data"][0].id,
-                    "price": price_id,
-                }
-            ]
+            item_id = item_id or _item_ids.get(subscription_id)
+            if item_id is None:
+                subscription = await _call(
+                    "subscription.retrieve", stripe.Subscription.retrieve, subscription_id, mutating=False,
+                )
+                item_id, _ = subscription_item(subscription)
+            update_data["items"] = [{"id": item_id, "price": price_id}]
         
         if cancel_at_period_end is not None:
             update_data["cancel_at_period_end"] = cancel_at_period_end
         
-        subscription = stripe.Subscription.modify(subscription_id, **update_data)
+        subscription = await _call(
+            "subscription.modify",
+            stripe.Subscription.modify,
+            subscription_id,
+            idempotency_key=idempotency_key,
+            **update_data,
+        )
+        remember_item(subscription)
         return subscription
     
     @staticmethod
     async def cancel_subscription(
         subscription_id: str,
         immediately: bool = False,
+        idempotency_key: Optional[str] = None,
     ) -> stripe.Subscription:
         """Cancel a Stripe subscription"""
         if immediately:
-            subscription = stripe.Subscription.delete(subscription_id)
+            subscription = await _call(
+                "subscription.delete",
+                stripe.Subscription.delete,
+                subscription_id,
+                idempotency_key=idempotency_key,
+            )
         else:
-            subscription = stripe.Subscription.modify(
+            subscription = await _call(
+                "subscription.modify",
+                stripe.Subscription.modify,
                 subscription_id,
+                idempotency_key=idempotency_key,
                 cancel_at_period_end=True,
             )
         return subscription
@@ -143,7 +256,9 @@ class StripeService:
     @staticmethod
     async def retrieve_subscription(subscription_id: str) -> stripe.Subscription:
         """Retrieve a Stripe subscription"""
-        subscription = stripe.Subscription.retrieve(subscription_id)
+        subscription = await _call(
+            "subscription.retrieve", stripe.Subscription.retrieve, subscription_id, mutating=False,
+        )
         return subscription
     
     @staticmethod
@@ -153,6 +268,7 @@ class StripeService:
         customer_id: Optional[str] = None,
         payment_method_id: Optional[str] = None,
         metadata: Optional[Dict[str, Any]] = None,
+        idempotency_key: Optional[str] = None,
     ) -> stripe.PaymentIntent:
         """Create a Stripe payment intent"""
         amount_cents = int(amount * 100)
@@ -170,15 +286,53 @@ class StripeService:
             payment_intent_data["payment_method"] = payment_method_id
             payment_intent_data["confirm"] = True
         
-        payment_intent = stripe.PaymentIntent.create(**payment_intent_data)
+        payment_intent = await _call(
+            "payment_intent.create",
+            stripe.PaymentIntent.create,
+            idempotency_key=idempotency_key,
+            **payment_intent_data,
+        )
         return payment_intent
     
     @staticmethod
     async def retrieve_invoice(invoice_id: str) -> stripe.Invoice:
         """Retrieve a Stripe invoice"""
-        invoice = stripe.Invoice.retrieve(invoice_id)
+        invoice = await _call("invoice.retrieve", stripe.Invoice.retrieve, invoice_id, mutating=False)
         return invoice
     
+    @staticmethod
+    async def pay_invoice(invoice_id: str, idempotency_key: Optional[str] = None) -> stripe.Invoice:
+        """Attempt to collect an open Stripe invoice now"""
+        invoice = await _call("invoice.pay", stripe.Invoice.pay, invoice_id, idempotency_key=idempotency_key)
+        return invoice
+    
+    @staticmethod
+    async def list_subscriptions(
+        starting_after: Optional[str] = None,
+        limit: int = 100,
+        expand: Optional[List[str]] = None,
+    ) -> stripe.ListObject:
+        """One page of subscriptions in any status, newest first"""
+        params = {"limit": limit, "status": "all", "expand": expand or []}
+        if starting_after:
+            params["starting_after"] = starting_after
+        return await _call("subscription.list", stripe.Subscription.list, mutating=False, **params)
+    
+    @staticmethod
+    async def list_invoices(
+        starting_after: Optional[str] = None,
+        limit: int = 100,
+        created_gte: Optional[int] = None,
+        expand: Optional[List[str]] = None,
+    ) -> stripe.ListObject:
+        """One page of invoices, newest first, optionally created since a unix time"""
+        params = {"limit": limit, "expand": expand or []}
+        if starting_after:
+            params["starting_after"] = starting_after
+        if created_gte is not None:
+            params["created"] = {"gte": created_gte}
+        return await _call("invoice.list", stripe.Invoice.list, mutating=False, **params)
+    
     @staticmethod
     async def create_checkout_session(
         customer_id: str,
@@ -187,6 +341,7 @@ class StripeService:
         cancel_url: str,
         trial_days: Optional[int] = None,
         metadata: Optional[Dict[str, Any]] = None,
+        idempotency_key: Optional[str] = None,
     ) -> stripe.checkout.Session:
         """Create a Stripe checkout session"""
         session_data = {
@@ -203,7 +358,12 @@ class StripeService:
                 "trial_period_days": trial_days,
             }
         
-        session = stripe.checkout.Session.create(**session_data)
+        session = await _call(
+            "checkout_session.create",
+            stripe.checkout.Session.create,
+            idempotency_key=idempotency_key,
+            **session_data,
+        )
         return session
     
     @staticmethod
@@ -0,0 +1,439 @@
+"""
+Durable processing of Stripe webhook events
+
+The webhook endpoint only verifies the signature, stores the raw event in
+`webhook_events` and acknowledges, so a burst of deliveries never waits on
+our database work and Stripe has no reason to time out and redeliver.
+Consumers (app.tasks.webhooks) apply the stored events afterwards, with
+the same claim/lease scheme as the Stripe outbox:
+
+- Due events are claimed with FOR UPDATE SKIP LOCKED and leased for
+  WEBHOOK_LEASE_SECONDS; a consumer that dies leaves them to the next.
+- An event is only claimed together with every unfinished earlier event
+  for the same Stripe subscription (`ordering_key`). One held by another
+  consumer, being claimed by one right now, or waiting to be retried
+  holds the rest back, so one subscription's events apply in Stripe's
+  order even with many consumers.
+- A batch is applied in one transaction (`apply_events`): events are
+  grouped by the row they update, only the newest per row is applied,
+  and each kind of row is loaded with one IN query. If the batch fails,
+  its events are applied one at a time, so only the failing one is
+  retried with exponential backoff; after WEBHOOK_MAX_ATTEMPTS it is
+  dead-lettered and stops blocking its subscription.
+
+Stripe delivers at least once and out of order. Event ids are unique in
+`webhook_events`, with a per-process LRU in front, so a redelivery is
+stored and applied once. Subscriptions and invoices keep the `created` of
+the newest event applied (`last_event_created`); older events are skipped.
+
+Handlers are registered per event type with `handles`.
+
+The endpoint never builds the SDK's StripeObject tree: `verify_signature`
+checks the HMAC over the raw body, and `event_header` takes only what
+dedupe and routing need from one orjson parse. Handlers get the stored
+body parsed again, with orjson, when their batch is applied.
+"""
+from datetime import datetime, timedelta
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+import hashlib
+import hmac
+import logging
+import time
+import uuid
+
+import orjson
+
+from sqlalchemy import exists, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import InstrumentedAttribute, aliased
+
+from app.core.config import settings
+from app.models.invoice import Invoice, InvoiceStatus
+from app.models.subscription import Subscription, SubscriptionStatus
+from app.models.webhook_event import WebhookEvent, WebhookEventStatus
+from app.services.dunning import cancel_dunning, schedule_dunning
+from app.services.stripe_service import from_timestamp, subscription_item
+
+logger = logging.getLogger(__name__)
+
+UNFINISHED = [WebhookEventStatus.PENDING, WebhookEventStatus.PROCESSING]
+
+# Recently stored event ids, most recent last
+_seen_events: "OrderedDict[str, None]" = OrderedDict()
+
+
+class Handler(NamedTuple):
+    # Stripe id column of the model the event updates, e.g. Invoice.stripe_invoice_id
+    target: InstrumentedAttribute
+    # Writes the event into the loaded row; runs inside the batch transaction
+    apply: Callable[[AsyncSession, Any, dict, datetime], Awaitable[None]]
+
+
+HANDLERS: Dict[str, Handler] = {}
+
+
+def handles(event_type: str, target: InstrumentedAttribute):
+    """Register the decorated function as the handler of `event_type`"""
+    def register(apply):
+        HANDLERS[event_type] = Handler(target, apply)
+        return apply
+    return register
+
+
+# Handlers get the row the event's object maps to, already loaded, and
+# change it in place. Events for unknown rows, and events older than the
+# row's watermark, never reach them.
+
+def _apply_subscription_state(subscription: Subscription, data: dict) -> None:
+    subscription.status = SubscriptionStatus(data["status"])
+    subscription.current_period_start = from_timestamp(data["current_period_start"])
+    subscription.current_period_end = from_timestamp(data["current_period_end"])
+    item_id, price_id = subscription_item(data)
+    if item_id:
+        subscription.stripe_subscription_item_id = item_id
+        subscription.stripe_price_id = price_id
+
+
+@handles("customer.subscription.created", target=Subscription.stripe_subscription_id)
+async def handle_subscription_created(db: AsyncSession, subscription: Subscription, data: dict, created: datetime):
+    """Handle subscription.created event"""
+    _apply_subscription_state(subscription, data)
+
+
+@handles("customer.subscription.updated", target=Subscription.stripe_subscription_id)
+async def handle_subscription_updated(db: AsyncSession, subscription: Subscription, data: dict, created: datetime):
+    """Handle subscription.updated event"""
+    _apply_subscription_state(subscription, data)
+    subscription.cancel_at_period_end = data.get("cancel_at_period_end", False)
+    if data.get("canceled_at"):
+        subscription.canceled_at = from_timestamp(data["canceled_at"])
+
+
+@handles("customer.subscription.deleted", target=Subscription.stripe_subscription_id)
+async def handle_subscription_deleted(db: AsyncSession, subscription: Subscription, data: dict, created: datetime):
+    """Handle subscription.deleted event"""
+    subscription.status = SubscriptionStatus.CANCELED
+    subscription.ended_at = datetime.utcnow()
+
+
+@handles("invoice.paid", target=Invoice.stripe_invoice_id)
+async def handle_invoice_paid(db: AsyncSession, invoice: Invoice, data: dict, created: datetime):
+    """Handle invoice.paid event"""
+    invoice.status = InvoiceStatus.PAID
+    invoice.amount_paid = invoice.total
+    invoice.paid_at = datetime.utcnow()
+    await cancel_dunning(db, invoice.id)
+
+
+@handles("invoice.payment_failed", target=Invoice.stripe_invoice_id)
+async def handle_invoice_payment_failed(db: AsyncSession, invoice: Invoice, data: dict, created: datetime):
+    """Handle invoice.payment_failed event"""
+    # The invoice stays open while dunning retries it. Once paid, or given
+    # up after the last retry, a late failure (often of that retry) changes nothing.
+    if invoice.status in (InvoiceStatus.PAID, InvoiceStatus.UNCOLLECTIBLE):
+        return
+    invoice.status = InvoiceStatus.OPEN
+    await schedule_dunning(db, invoice, datetime.utcnow())
+
+
+class EventHeader(NamedTuple):
+    """What ingestion needs from an event: dedupe, routing and ordering"""
+    id: str
+    type: str
+    created: Optional[int]
+    ordering_key: Optional[str]
+
+
+def verify_signature(
+    payload: bytes,
+    header: str,
+    secret: str,
+    tolerance: Optional[int] = None,
+    now: Optional[float] = None,
+) -> None:
+    """
+    Check a Stripe-Signature header against the raw body; raises ValueError
+    Stripe's scheme (HMAC-SHA256 of "{t}.{body}", any v1 may match, t no
+    older than the tolerance) without parsing the body.
+    """
+    timestamp, signatures = b"", []
+    for part in header.encode().split(b","):
+        key, _, value = part.strip().partition(b"=")
+        if key == b"t":
+            timestamp = value
+        elif key == b"v1":
+            signatures.append(value)
+    if not timestamp.isdigit() or not signatures:
+        raise ValueError("Invalid signature")
+
+    expected = hmac.new(secret.encode(), timestamp + b"." + payload, hashlib.sha256).hexdigest().encode()
+    if not any(hmac.compare_digest(expected, signature) for signature in signatures):
+        raise ValueError("Invalid signature")
+
+    tolerance = settings.STRIPE_WEBHOOK_TOLERANCE_SECONDS if tolerance is None else tolerance
+    if tolerance and int(timestamp) < (time.time() if now is None else now) - tolerance:
+        raise ValueError("Signature timestamp outside the tolerance")
+
+
+def ordering_key(event: Dict[str, Any]) -> Optional[str]:
+    """Stripe subscription whose events must apply in order with this one"""
+    obj = event["data"]["object"]
+    if obj.get("object") == "subscription" or event["type"].startswith("customer.subscription."):
+        return obj.get("id")
+    subscription = obj.get("subscription")
+    return subscription if isinstance(subscription, str) else None
+
+
+def event_header(payload: bytes) -> EventHeader:
+    """Id, type, created and ordering key of a raw event; raises ValueError"""
+    try:
+        event = orjson.loads(payload)
+        return EventHeader(event["id"], event["type"], event.get("created"), ordering_key(event))
+    except (orjson.JSONDecodeError, KeyError, TypeError, AttributeError):
+        raise ValueError("Invalid payload")
+
+
+def seen_event(event_id: str) -> bool:
+    """Whether this process recently stored (or skipped) the event"""
+    if event_id in _seen_events:
+        _seen_events.move_to_end(event_id)
+        return True
+    return False
+
+
+def remember_event(event_id: str) -> None:
+    """Note an event as handled; call once its row is committed"""
+    _seen_events[event_id] = None
+    _seen_events.move_to_end(event_id)
+    while len(_seen_events) > settings.WEBHOOK_DEDUPE_CACHE_SIZE:
+        _seen_events.popitem(last=False)
+
+
+async def record_event(db: AsyncSession, header: EventHeader, payload: bytes, now: datetime) -> bool:
+    """
+    Queue a verified event for the consumers; False if it needs no processing
+    Events nobody handles are not stored. Redeliveries are skipped from the
+    in-process cache when possible, else by the unique event id. Does not commit.
+    """
+    if header.type not in HANDLERS or seen_event(header.id):
+        return False
+    dialect = db.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    result = await db.execute(
+        insert(WebhookEvent.__table__)
+        .values(
+            id=uuid.uuid4(),
+            stripe_event_id=header.id,
+            event_type=header.type,
+            ordering_key=header.ordering_key,
+            event_created=from_timestamp(header.created) or now,
+            payload=payload.decode(),
+            status=WebhookEventStatus.PENDING,
+            attempts=0,
+            next_attempt_at=now,
+            received_at=now,
+        )
+        .on_conflict_do_nothing(index_elements=["stripe_event_id"])
+    )
+    return result.rowcount == 1
+
+
+def retry_delay(attempt: int) -> timedelta:
+    """Delay after failed attempt number `attempt` (1-based)"""
+    seconds = settings.WEBHOOK_RETRY_BASE_SECONDS * 2 ** (attempt - 1)
+    return timedelta(seconds=min(seconds, settings.WEBHOOK_RETRY_MAX_SECONDS))
+
+
+async def claim_events(db: AsyncSession, now: datetime, limit: int) -> List[WebhookEvent]:
+    """Lease up to `limit` due events, oldest first. Does not commit."""
+    earlier = aliased(WebhookEvent)
+    # (created, received, id) totally orders events; Stripe's created has one-second resolution
+    position = tuple_(WebhookEvent.event_created, WebhookEvent.received_at, WebhookEvent.id)
+    # Earlier due events are claimed in the same batch; held or backing-off ones block
+    blocked = exists().where(
+        earlier.ordering_key == WebhookEvent.ordering_key,
+        tuple_(earlier.event_created, earlier.received_at, earlier.id) < position,
+        earlier.status.in_(UNFINISHED),
+        earlier.next_attempt_at > now,
+    )
+    result = await db.execute(
+        select(WebhookEvent)
+        .where(
+            WebhookEvent.status.in_(UNFINISHED),
+            WebhookEvent.next_attempt_at <= now,
+            ~blocked,
+        )
+        .order_by(WebhookEvent.event_created, WebhookEvent.received_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True, of=WebhookEvent)
+    )
+    events = await _without_gaps(db, list(result.scalars().all()))
+    for event in events:
+        event.status = WebhookEventStatus.PROCESSING
+        event.attempts += 1
+        event.next_attempt_at = now + timedelta(seconds=settings.WEBHOOK_LEASE_SECONDS)
+    return events
+
+
+def _position(row) -> tuple:
+    return (row.event_created, row.received_at, row.id)
+
+
+async def _without_gaps(db: AsyncSession, events: List[WebhookEvent]) -> List[WebhookEvent]:
+    """
+    Drop events that have an unfinished earlier event outside this claim
+    SKIP LOCKED hides rows another consumer is claiming but has not yet
+    committed; they still read as due, so `claim_events`' filter lets
+    their successors through. Plain reads see those rows without waiting.
+    """
+    keys = {event.ordering_key for event in events if event.ordering_key is not None}
+    if not keys:
+        return events
+    result = await db.execute(
+        select(WebhookEvent.ordering_key, WebhookEvent.event_created, WebhookEvent.received_at, WebhookEvent.id)
+        .where(
+            WebhookEvent.ordering_key.in_(keys),
+            WebhookEvent.status.in_(UNFINISHED),
+            WebhookEvent.id.notin_([event.id for event in events]),
+        )
+    )
+    # ordering key -> position of its first unfinished event outside the claim
+    first_outside: Dict[str, tuple] = {}
+    for key, *position in result:
+        position = tuple(position)
+        if key not in first_outside or position < first_outside[key]:
+            first_outside[key] = position
+    return [
+        event for event in events
+        if event.ordering_key not in first_outside or _position(event) < first_outside[event.ordering_key]
+    ]
+
+
+def _in_order(rows: List[WebhookEvent]) -> List[WebhookEvent]:
+    return sorted(rows, key=lambda row: (row.event_created, row.received_at))
+
+
+async def apply_events(db: AsyncSession, rows: List[WebhookEvent]) -> int:
+    """
+    Apply claimed events in the caller's transaction; returns how many were superseded
+    Only the newest event per target row is applied. Targets are loaded
+    with one IN query per model, and the changes flush together at commit.
+    Does not commit.
+    """
+    # (model, Stripe id) -> newest event for that row
+    latest: Dict[Tuple[type, str], Tuple[WebhookEvent, dict]] = {}
+    columns: Dict[type, InstrumentedAttribute] = {}
+    for row in _in_order(rows):
+        handler = HANDLERS.get(row.event_type)
+        if handler is None:
+            continue
+        data = orjson.loads(row.payload)["data"]["object"]
+        model = handler.target.class_
+        columns[model] = handler.target
+        latest[(model, data["id"])] = (row, data)
+
+    targets: Dict[Tuple[type, str], Any] = {}
+    for model, column in columns.items():
+        ids = [stripe_id for key_model, stripe_id in latest if key_model is model]
+        result = await db.execute(select(model).where(column.in_(ids)))
+        for obj in result.scalars():
+            targets[(model, getattr(obj, column.key))] = obj
+
+    for key, (row, data) in latest.items():
+        obj = targets.get(key)
+        created = row.event_created
+        if obj is None or (obj.last_event_created is not None and obj.last_event_created > created):
+            continue
+        await HANDLERS[row.event_type].apply(db, obj, data, created)
+        obj.last_event_created = created
+    return len(rows) - len(latest)
+
+
+async def _finish(db: AsyncSession, rows: List[WebhookEvent], now: datetime) -> None:
+    await db.execute(
+        update(WebhookEvent)
+        .where(WebhookEvent.id.in_([row.id for row in rows]))
+        .values(
+            status=WebhookEventStatus.PROCESSED,
+            last_error=None,
+            next_attempt_at=None,
+            processed_at=now,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def _set_status(session_factory: async_sessionmaker, row: WebhookEvent, **values: Any) -> None:
+    async with session_factory() as db:
+        await db.execute(
+            update(WebhookEvent)
+            .where(WebhookEvent.id == row.id)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+
+async def process_event(session_factory: async_sessionmaker, row: WebhookEvent, now: datetime) -> str:
+    """Apply one claimed event on its own and record the outcome: processed, retried or dead"""
+    async with session_factory() as db:
+        try:
+            await apply_events(db, [row])
+            await _finish(db, [row], now)
+            await db.commit()
+            return "processed"
+        except Exception as e:
+            await db.rollback()
+            error = e
+
+    retry = row.attempts < settings.WEBHOOK_MAX_ATTEMPTS
+    values = {"last_error": f"{type(error).__name__}: {error}"}
+    if retry:
+        values.update(status=WebhookEventStatus.PENDING, next_attempt_at=now + retry_delay(row.attempts))
+    else:
+        values.update(status=WebhookEventStatus.DEAD_LETTER, next_attempt_at=None)
+    await _set_status(session_factory, row, **values)
+    if retry:
+        logger.info(f"Retrying {row.event_type} {row.stripe_event_id} after attempt {row.attempts}: {error}")
+        return "retried"
+    logger.error(f"Dead-lettered {row.event_type} {row.stripe_event_id} after {row.attempts} attempts: {error}")
+    return "dead"
+
+
+async def process_events(session_factory: async_sessionmaker, now: datetime, limit: int) -> Dict[str, int]:
+    """Claim and apply one batch in a single transaction, falling back to one event at a time"""
+    async with session_factory() as db:
+        rows = await claim_events(db, now, limit)
+        await db.commit()
+
+    stats = {"claimed": len(rows), "processed": 0, "superseded": 0, "retried": 0, "dead": 0, "deferred": 0}
+    if not rows:
+        return stats
+
+    try:
+        async with session_factory() as db:
+            stats["superseded"] = await apply_events(db, rows)
+            await _finish(db, rows, now)
+            await db.commit()
+        stats["processed"] = len(rows)
+        return stats
+    except Exception as e:
+        logger.warning(f"Batch of {len(rows)} webhook events failed, applying them one at a time: {e}")
+
+    retrying = set()
+    for row in _in_order(rows):
+        if row.ordering_key is not None and row.ordering_key in retrying:
+            # Waits behind the retried event for its subscription; not an attempt
+            await _set_status(
+                session_factory, row,
+                status=WebhookEventStatus.PENDING, attempts=row.attempts - 1, next_attempt_at=now,
+            )
+            stats["deferred"] += 1
+            continue
+        outcome = await process_event(session_factory, row, now)
+        stats[outcome] += 1
+        if outcome == "retried" and row.ordering_key is not None:
+            retrying.add(row.ordering_key)
+    return stats
@@ -0,0 +1,439 @@
+"""
+Columnar archive for cold usage history
+
+Closed months of `usage_metrics` are exported per tenant into
+`<USAGE_ARCHIVE_DIR>/<tenant_id>/<YYYY-MM>/`, one NumPy `.npy` file per
+column plus a small JSON dictionary for the encoded metric names, units and
+metadata objects. Readers memory-map the columns, so analytics only page in what they scan.
+
+Every archived row keeps its `usage_metrics` id, so re-archiving rows that
+are already in a month file replaces them instead of counting them twice.
+"""
+from datetime import datetime, timezone
+from typing import AbstractSet, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import os
+import shutil
+import uuid
+
+import numpy as np
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.usage_metric import UsageMetric, MetricType
+
+logger = logging.getLogger(__name__)
+
+# Metric type code = position in this list (append-only)
+METRIC_TYPES: List[MetricType] = list(MetricType)
+METRIC_TYPE_CODES: Dict[MetricType, int] = {t: i for i, t in enumerate(METRIC_TYPES)}
+
+COLUMNS = {
+    "id": "V16",  # usage_metrics.id as raw UUID bytes
+    "period_start": "datetime64[us]",
+    "period_end": "datetime64[us]",
+    "metric_type": np.uint8,
+    "metric_name": np.uint32,
+    "unit": np.uint32,
+    "value": np.int64,
+    "metadata": np.uint32,  # index into the dictionary's distinct metadata objects
+}
+
+DICTIONARY_FILE = "dictionary.json"
+
+# (id, period_start, period_end, metric_type, metric_name, unit, value, metadata)
+ArchiveRow = Tuple[uuid.UUID, datetime, datetime, MetricType, str, str, int, Optional[Dict[str, Any]]]
+
+
+def _naive_utc(value: datetime) -> datetime:
+    """Normalize timestamps to naive UTC (numpy datetime64 has no timezone)"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def month_key(value: datetime) -> str:
+    """Archive partition name for a timestamp, e.g. 2025-11"""
+    return _naive_utc(value).strftime("%Y-%m")
+
+
+def archive_cutoff(now: Optional[datetime] = None, months: Optional[int] = None) -> datetime:
+    """
+    First instant that is still kept live.
+    Everything whose period starts before it belongs to a closed month.
+    """
+    now = _naive_utc(now or datetime.utcnow())
+    months = settings.USAGE_ARCHIVE_AFTER_MONTHS if months is None else months
+    total = now.year * 12 + (now.month - 1) - months
+    return datetime(total // 12, total % 12 + 1, 1)
+
+
+def metadata_matches(metadata: Optional[Dict[str, Any]], filters: Dict[str, Any]) -> bool:
+    """
+    Containment check with JSONB @> semantics for a flat filter
+    A key must be present with an equal value; null matches only an explicit
+    null and booleans never match numbers.
+    """
+    if not metadata:
+        return False
+    for key, expected in filters.items():
+        if key not in metadata:
+            return False
+        value = metadata[key]
+        if isinstance(value, bool) != isinstance(expected, bool) or value != expected:
+            return False
+    return True
+
+
+def dimension_text(value: Any) -> Optional[str]:
+    """Text form of a metadata value, as PostgreSQL's ->> renders it"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+def _tenant_dir(tenant_id: uuid.UUID) -> str:
+    return os.path.join(settings.USAGE_ARCHIVE_DIR, str(tenant_id))
+
+
+class ArchivedMonth:
+    """
+    One memory-mapped month of usage for a tenant
+    Columns are read-only numpy arrays backed by the files on disk.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.month = os.path.basename(path)
+        with open(os.path.join(path, DICTIONARY_FILE)) as f:
+            dictionary = json.load(f)
+        self.metric_names: List[str] = dictionary["metric_names"]
+        self.units: List[str] = dictionary["units"]
+        self.metadata: List[Optional[Dict[str, Any]]] = dictionary["metadata"]
+        self.columns = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in COLUMNS
+        }
+
+    def __len__(self) -> int:
+        return len(self.columns["value"])
+
+    def rows(self) -> Iterator[ArchiveRow]:
+        """Decode the month back into row tuples"""
+        cols = self.columns
+        for i in range(len(self)):
+            yield (
+                uuid.UUID(bytes=cols["id"][i].tobytes()),
+                cols["period_start"][i].item(),
+                cols["period_end"][i].item(),
+                METRIC_TYPES[int(cols["metric_type"][i])],
+                self.metric_names[int(cols["metric_name"][i])],
+                self.units[int(cols["unit"][i])],
+                int(cols["value"][i]),
+                self.metadata[int(cols["metadata"][i])],
+            )
+
+    def _mask(
+        self,
+        start: Optional[datetime],
+        end: Optional[datetime],
+        metric_type: Optional[MetricType],
+        filters: Optional[Dict[str, Any]],
+        exclude: Optional[AbstractSet[uuid.UUID]] = None,
+    ) -> np.ndarray:
+        cols = self.columns
+        mask = np.ones(len(self), dtype=bool)
+        if start is not None:
+            mask &= cols["period_start"] >= np.datetime64(_naive_utc(start), "us")
+        if end is not None:
+            mask &= cols["period_start"] < np.datetime64(_naive_utc(end), "us")
+        if metric_type is not None:
+            mask &= cols["metric_type"] == METRIC_TYPE_CODES[metric_type]
+        if filters:
+            # Match each distinct metadata object once, then look rows up by code
+            matching = np.array([metadata_matches(m, filters) for m in self.metadata], dtype=bool)
+            mask &= matching[cols["metadata"]]
+        if exclude:
+            mask &= np.fromiter(
+                (uuid.UUID(bytes=row_id.tobytes()) not in exclude for row_id in cols["id"]),
+                dtype=bool,
+                count=len(self),
+            )
+        return mask
+
+    def _sums(self, mask: np.ndarray, groups: np.ndarray) -> Iterator[Tuple[int, int, int, int]]:
+        """Yield (group, type_code, unit_code, total) for the masked rows"""
+        cols = self.columns
+        # Group on a combined (group, type, unit) key in a single pass
+        stride = len(METRIC_TYPES) * len(self.units)
+        keys = (
+            groups.astype(np.int64) * stride
+            + cols["metric_type"][mask].astype(np.int64) * len(self.units)
+            + cols["unit"][mask]
+        )
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        sums = np.bincount(inverse, weights=cols["value"][mask], minlength=len(unique_keys))
+        for key, total in zip(unique_keys.tolist(), sums.tolist()):
+            group, rest = divmod(key, stride)
+            type_code, unit_code = divmod(rest, len(self.units))
+            yield group, type_code, unit_code, int(total)
+
+    def totals(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        metric_type: Optional[MetricType] = None,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> Dict[Tuple[MetricType, str], int]:
+        """Sum values by (metric_type, unit) for rows starting in [start, end)"""
+        mask = self._mask(start, end, metric_type, filters)
+        if not mask.any():
+            return {}
+        groups = np.zeros(int(mask.sum()), dtype=np.int64)
+        return {
+            (METRIC_TYPES[type_code], self.units[unit_code]): total
+            for _, type_code, unit_code, total in self._sums(mask, groups)
+        }
+
+    def breakdown(
+        self,
+        dimension: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        metric_type: Optional[MetricType] = None,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> Dict[Tuple[Optional[str], MetricType, str], int]:
+        """Sum values by (metadata[dimension] as text, metric_type, unit)"""
+        mask = self._mask(start, end, metric_type, filters)
+        if not mask.any():
+            return {}
+        labels: List[Optional[str]] = []
+        label_codes: Dict[Optional[str], int] = {}
+        entry_labels = []
+        for metadata in self.metadata:
+            label = dimension_text((metadata or {}).get(dimension))
+            if label not in label_codes:
+                label_codes[label] = len(labels)
+                labels.append(label)
+            entry_labels.append(label_codes[label])
+        groups = np.array(entry_labels, dtype=np.int64)[self.columns["metadata"][mask]]
+        return {
+            (labels[group], METRIC_TYPES[type_code], self.units[unit_code]): total
+            for group, type_code, unit_code, total in self._sums(mask, groups)
+        }
+
+
+def write_month(tenant_id: uuid.UUID, month: str, rows: List[ArchiveRow]) -> str:
+    """
+    Write (or extend) the archive for one tenant month
+    Rows are keyed by id: merging rows the month already holds replaces them,
+    so a rerun after a failed delete/commit does not archive them twice.
+    Files are written to a temporary directory and swapped in, so readers
+    never see a half-written month. Blocking; call it off the event loop.
+    """
+    tenant_dir = _tenant_dir(tenant_id)
+    final_path = os.path.join(tenant_dir, month)
+
+    merged: Dict[uuid.UUID, ArchiveRow] = {}
+    if os.path.isdir(final_path):
+        # Late-arriving rows for an already archived month
+        merged.update((row[0], row) for row in ArchivedMonth(final_path).rows())
+    merged.update((row[0], row) for row in rows)
+
+    rows = sorted(merged.values(), key=lambda row: (_naive_utc(row[1]), row[0].bytes))
+    metric_names = sorted({row[4] for row in rows})
+    units = sorted({row[5] for row in rows})
+    name_codes = {name: i for i, name in enumerate(metric_names)}
+    unit_codes = {unit: i for i, unit in enumerate(units)}
+    metadata_keys = [json.dumps(row[7], sort_keys=True) for row in rows]
+    distinct_metadata = sorted(set(metadata_keys))
+    metadata_codes = {key: i for i, key in enumerate(distinct_metadata)}
+
+    columns = {
+        "id": np.array([r[0].bytes for r in rows], dtype=COLUMNS["id"]),
+        "period_start": np.array([_naive_utc(r[1]) for r in rows], dtype=COLUMNS["period_start"]),
+        "period_end": np.array([_naive_utc(r[2]) for r in rows], dtype=COLUMNS["period_end"]),
+        "metric_type": np.array([METRIC_TYPE_CODES[MetricType(r[3])] for r in rows], dtype=COLUMNS["metric_type"]),
+        "metric_name": np.array([name_codes[r[4]] for r in rows], dtype=COLUMNS["metric_name"]),
+        "unit": np.array([unit_codes[r[5]] for r in rows], dtype=COLUMNS["unit"]),
+        "value": np.array([r[6] for r in rows], dtype=COLUMNS["value"]),
+        "metadata": np.array([metadata_codes[key] for key in metadata_keys], dtype=COLUMNS["metadata"]),
+    }
+
+    os.makedirs(tenant_dir, exist_ok=True)
+    tmp_path = f"{final_path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name, array in columns.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+    with open(os.path.join(tmp_path, DICTIONARY_FILE), "w") as f:
+        json.dump({
+            "month": month,
+            "rows": len(rows),
+            "metric_names": metric_names,
+            "units": units,
+            "metadata": [json.loads(key) for key in distinct_metadata],
+        }, f)
+
+    old_path = f"{final_path}.old-{os.getpid()}"
+    if os.path.isdir(final_path):
+        os.rename(final_path, old_path)
+    os.rename(tmp_path, final_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return final_path
+
+
+def iter_months(
+    tenant_id: uuid.UUID,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> Iterator[ArchivedMonth]:
+    """Yield archived months overlapping [start, end) for a tenant"""
+    tenant_dir = _tenant_dir(tenant_id)
+    if not os.path.isdir(tenant_dir):
+        return
+
+    first = month_key(start) if start else None
+    last = month_key(end) if end else None
+    for name in sorted(os.listdir(tenant_dir)):
+        if len(name) != 7:  # skip *.tmp-* / *.old-* leftovers
+            continue
+        if (first and name < first) or (last and name > last):
+            continue
+        yield ArchivedMonth(os.path.join(tenant_dir, name))
+
+
+def archived_totals(
+    tenant_id: uuid.UUID,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    metric_type: Optional[MetricType] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> Dict[Tuple[MetricType, str], int]:
+    """
+    Archived usage totals by (metric_type, unit) for rows starting in [start, end)
+    `filters` restricts to rows whose metadata contains the given pairs.
+    Blocking; call it off the event loop.
+    """
+    totals: Dict[Tuple[MetricType, str], int] = {}
+    for month in iter_months(tenant_id, start, end):
+        for key, value in month.totals(start, end, metric_type, filters).items():
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def archived_period_usage(
+    tenant_id: uuid.UUID,
+    start: datetime,
+    end: datetime,
+    exclude: Optional[AbstractSet[uuid.UUID]] = None,
+) -> Dict[MetricType, Tuple[int, int]]:
+    """
+    Archived (sum, peak) per metric type for rows starting in [start, end)
+    Rows whose id is in `exclude` are skipped, so callers that also read the
+    live table can pass the ids still there. Blocking; call it off the event loop.
+    """
+    usage: Dict[MetricType, Tuple[int, int]] = {}
+    for month in iter_months(tenant_id, start, end):
+        mask = month._mask(start, end, None, None, exclude)
+        types = month.columns["metric_type"][mask]
+        values = month.columns["value"][mask]
+        for type_code in np.unique(types).tolist():
+            selected = values[types == type_code]
+            metric_type = METRIC_TYPES[type_code]
+            total, peak = usage.get(metric_type, (0, 0))
+            usage[metric_type] = (total + int(selected.sum()), max(peak, int(selected.max())))
+    return usage
+
+
+def archived_breakdown(
+    tenant_id: uuid.UUID,
+    dimension: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    metric_type: Optional[MetricType] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> Dict[Tuple[Optional[str], MetricType, str], int]:
+    """
+    Archived usage totals by (dimension value, metric_type, unit)
+    Dimension values are text as rendered by dimension_text. Blocking; call
+    it off the event loop.
+    """
+    totals: Dict[Tuple[Optional[str], MetricType, str], int] = {}
+    for month in iter_months(tenant_id, start, end):
+        for key, value in month.breakdown(dimension, start, end, metric_type, filters).items():
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def _chunks(items: List, size: int) -> Iterable[List]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+async def archive_closed_months(
+    db: AsyncSession,
+    now: Optional[datetime] = None,
+    months: Optional[int] = None,
+) -> Dict[str, int]:
+    """
+    Export closed months of usage_metrics to the archive and drop them from the live table
+    Commits once per tenant; only the exported row ids are deleted. The file
+    writes run in a worker thread so the event loop keeps serving requests.
+    """
+    cutoff = archive_cutoff(now, months)
+    result = await db.execute(
+        select(UsageMetric.tenant_id)
+        .where(UsageMetric.period_start < cutoff)
+        .distinct()
+    )
+    tenant_ids = result.scalars().all()
+
+    stats = {"tenants": 0, "months": 0, "rows": 0}
+    for tenant_id in tenant_ids:
+        result = await db.execute(
+            select(
+                UsageMetric.id,
+                UsageMetric.period_start,
+                UsageMetric.period_end,
+                UsageMetric.metric_type,
+                UsageMetric.metric_name,
+                UsageMetric.unit,
+                UsageMetric.value,
+                UsageMetric.metric_metadata,
+            )
+            .where(
+                UsageMetric.tenant_id == tenant_id,
+                UsageMetric.period_start < cutoff,
+            )
+            .order_by(UsageMetric.period_start)
+        )
+
+        by_month: Dict[str, List[ArchiveRow]] = {}
+        ids = []
+        for row in result:
+            ids.append(row.id)
+            by_month.setdefault(month_key(row.period_start), []).append(tuple(row))
+
+        for month, rows in by_month.items():
+            await asyncio.to_thread(write_month, tenant_id, month, rows)
+
+        for chunk in _chunks(ids, 1000):
+            await db.execute(delete(UsageMetric).where(UsageMetric.id.in_(chunk)))
+        await db.commit()
+
+        stats["tenants"] += 1
+        stats["months"] += len(by_month)
+        stats["rows"] += len(ids)
+        logger.info(f"Archived {len(ids)} usage rows ({len(by_month)} months) for tenant {tenant_id}")
+
+    return stats
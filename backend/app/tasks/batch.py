@@ -0,0 +1,248 @@
+"""
+Checkpointed batch runs for long billing tasks
+
+A run is identified by (job_name, run_key) in `job_runs`. Work is read in
+keyset chunks (`WHERE key > cursor ORDER BY key LIMIT n`) and every chunk
+commits together with its checkpoint row update, so a run killed by the
+soft time limit or a pod eviction resumes after the last committed chunk
+instead of starting over.
+
+The checkpoint is fenced with the leader lease token the caller started
+with: once a newer holder has taken over the run, a stale worker's chunk
+fails the fence and its transaction is rolled back.
+"""
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence, TypeVar
+import logging
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.job_run import JobRun, JobRunStatus
+from app.tasks.leader import Lease, LeaseLost
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+FetchChunk = Callable[[AsyncSession, Optional[str], int], Awaitable[Sequence[T]]]
+ProcessChunk = Callable[[AsyncSession, Sequence[T]], Awaitable[Dict[str, int]]]
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+
+def progress_snapshot(run: JobRun) -> Dict[str, Any]:
+    """Progress fields for Celery task state and logs"""
+    return {
+        "job": run.job_name,
+        "run_key": run.run_key,
+        "status": run.status.value,
+        "processed": run.processed,
+        "total": run.total,
+        "progress": run.progress,
+        "chunks": run.chunks,
+        "cursor": run.cursor,
+        "counts": run.counts or {},
+    }
+
+
+def celery_progress(task) -> ProgressCallback:
+    """
+    Publish progress snapshots as PROGRESS state of the running Celery task
+    The task id is captured here because chunks run on the worker loop thread,
+    where task.request is not populated.
+    """
+    task_id = task.request.id
+
+    def report(meta: Dict[str, Any]) -> None:
+        if task_id is not None:
+            task.update_state(task_id=task_id, state="PROGRESS", meta=meta)
+    return report
+
+
+def _merge_counts(current: Optional[Dict[str, Any]], delta: Dict[str, Any]) -> Dict[str, Any]:
+    merged = dict(current or {})
+    for key, value in delta.items():
+        merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+async def pending_run_key(db: AsyncSession, job_name: str, default: str) -> str:
+    """
+    Key of the oldest unfinished run to resume, else `default` for a new run
+    Runs that keep failing are given up after BATCH_MAX_ATTEMPTS.
+    """
+    result = await db.execute(
+        select(JobRun.run_key)
+        .where(
+            JobRun.job_name == job_name,
+            JobRun.status != JobRunStatus.COMPLETED,
+            JobRun.attempts < settings.BATCH_MAX_ATTEMPTS,
+        )
+        .order_by(JobRun.started_at, JobRun.run_key)
+        .limit(1)
+    )
+    return result.scalar_one_or_none() or default
+
+
+async def start_run(
+    db: AsyncSession,
+    job_name: str,
+    run_key: str,
+    lease: Optional[Lease] = None,
+) -> Optional[JobRun]:
+    """
+    Create the run, or reopen an unfinished one for resume
+    Returns None when this run already completed. Commits.
+    """
+    token = lease.token if lease else None
+    query = select(JobRun).where(JobRun.job_name == job_name, JobRun.run_key == run_key)
+    run = (await db.execute(query)).scalar_one_or_none()
+
+    if run is None:
+        run = JobRun(job_name=job_name, run_key=run_key, fencing_token=token, counts={})
+        db.add(run)
+        try:
+            await db.commit()
+            return run
+        except IntegrityError:
+            # Created concurrently by a run without a lease (manual trigger)
+            await db.rollback()
+            run = (await db.execute(query)).scalar_one()
+
+    if run.status == JobRunStatus.COMPLETED:
+        return None
+
+    logger.info(f"Resuming {job_name}:{run_key} after {run.processed} items (cursor {run.cursor})")
+    run.status = JobRunStatus.RUNNING
+    run.attempts += 1
+    run.fencing_token = token
+    run.last_error = None
+    await db.commit()
+    return run
+
+
+async def checkpoint(
+    db: AsyncSession,
+    run: JobRun,
+    processed: int,
+    counts: Dict[str, int],
+    cursor: Optional[str] = None,
+    token: Optional[int] = None,
+) -> None:
+    """
+    Record one chunk in the caller's transaction; the caller commits
+    Row-locks and re-reads the run so parallel chunk tasks add to each
+    other's counts. `token` is the fencing token the caller started with.
+    """
+    query = (
+        select(JobRun)
+        .where(JobRun.id == run.id)
+        .with_for_update()
+        # `run` may be this very row in the session's identity map, read before the lock
+        .execution_options(populate_existing=True)
+    )
+    current = (await db.execute(query)).scalar_one()
+    if token is not None and current.fencing_token != token:
+        raise LeaseLost(
+            f"{run.job_name}:{run.run_key} taken over (token {current.fencing_token}, ours {token})"
+        )
+
+    values = {
+        "processed": current.processed + processed,
+        "chunks": current.chunks + 1,
+        "counts": _merge_counts(current.counts, counts),
+    }
+    if cursor is not None:
+        values["cursor"] = cursor
+    await db.execute(
+        update(JobRun)
+        .where(JobRun.id == run.id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    for key, value in values.items():
+        setattr(run, key, value)
+
+
+async def finish_run(
+    db: AsyncSession,
+    run: JobRun,
+    status: JobRunStatus,
+    error: Optional[str] = None,
+) -> None:
+    """Mark the run completed or failed, unless another holder took it over. Commits."""
+    values = {"status": status, "last_error": error}
+    if status == JobRunStatus.COMPLETED:
+        values["finished_at"] = datetime.utcnow()
+    query = update(JobRun).where(JobRun.id == run.id)
+    if run.fencing_token is not None:
+        query = query.where(JobRun.fencing_token == run.fencing_token)
+    await db.execute(
+        query
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    run.status = status
+    run.last_error = error
+
+
+async def run_batched(
+    job_name: str,
+    run_key: str,
+    fetch_chunk: FetchChunk,
+    process_chunk: ProcessChunk,
+    key: Callable[[T], str],
+    chunk_size: int,
+    count: Optional[Callable[[AsyncSession], Awaitable[int]]] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    lease: Optional[Lease] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Run (or resume) a keyset-chunked job with a commit per chunk
+    fetch_chunk(db, after, limit) returns the next rows ordered by key;
+    process_chunk(db, rows) does the work and returns counters to add up.
+    Returns the final progress snapshot, or None if the run already completed.
+    """
+    async with AsyncSessionLocal() as db:
+        run = await start_run(db, job_name, run_key, lease)
+        if run is None:
+            logger.info(f"{job_name}:{run_key} already completed")
+            return None
+        if count is not None and run.total is None:
+            run.total = await count(db)
+            await db.commit()
+
+    try:
+        while True:
+            if lease is not None:
+                lease.ensure_held()
+
+            async with AsyncSessionLocal() as db:
+                rows = await fetch_chunk(db, run.cursor, chunk_size)
+                if not rows:
+                    break
+                counts = await process_chunk(db, rows)
+                await checkpoint(db, run, len(rows), counts, cursor=key(rows[-1]), token=lease.token if lease else None)
+                await db.commit()
+
+            if on_progress is not None:
+                on_progress(progress_snapshot(run))
+
+    except LeaseLost:
+        # The run now belongs to the new holder; leave its state alone
+        raise
+    except Exception as e:
+        async with AsyncSessionLocal() as db:
+            await finish_run(db, run, JobRunStatus.FAILED, error=str(e)[:2000])
+        raise
+
+    async with AsyncSessionLocal() as db:
+        await finish_run(db, run, JobRunStatus.COMPLETED)
+
+    snapshot = progress_snapshot(run)
+    logger.info(f"{job_name}:{run_key} completed: {snapshot}")
+    return snapshot
@@ -1,178 +1,654 @@
 from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
 import logging
+import time
+import uuid
 
-from app.core.celery_app import celery_app
+import stripe
+from celery import chord
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.tasks.celery_app import celery_app
+from app.tasks.runtime import run_async
+from app.tasks.leader import Lease, current_lease, leader_only
+from app.tasks.batch import (
+    celery_progress,
+    checkpoint,
+    finish_run,
+    pending_run_key,
+    run_batched,
+    start_run,
+)
+from app.core import clock
+from app.core.config import settings
 from app.core.database import AsyncSessionLocal
+from app.core.profiling import PeakMemory, QueryCounter, StageTimer, timed
 from app.models.tenant import Tenant
 from app.models.subscription import Subscription, SubscriptionStatus
-from app.models.invoice import Invoice
-from sqlalchemy import select
+from app.models.plan import Plan
+from app.models.job_run import JobRun, JobRunStatus
+from app.services.dunning import process_due_attempts
+from app.services.invoice_engine import bill_subscriptions
+from app.services.stripe_customers import ensure_stripe_customer
+from app.services.stripe_outbox import drain_outbox
+from app.services.stripe_reconciliation import reconcile_with_stripe
+from app.services.usage_archive import archive_closed_months
+from sqlalchemy import func, select, update
 
 logger = logging.getLogger(__name__)
 
+INVOICE_JOB = "generate_monthly_invoices"
+USAGE_METRICS_JOB = "calculate_usage_metrics"
+
 
 @celery_app.task(name="app.tasks.billing.check_trial_expiration")
+@leader_only("check-trial-expiration")
 def check_trial_expiration():
     """
     Check for expired trials and update tenant status
     """
-    import asyncio
-    asyncio.run(_check_trial_expiration_async())
+    run_async(_check_trial_expiration_async())
 
 
 async def _check_trial_expiration_async():
     async with AsyncSessionLocal() as db:
         try:
-            # Find tenants with expired trials
-            result = await db.execute(
-                select(Tenant).where(
-                    Tenant.is_trial,
-                    Tenant.trial_ends_at <= datetime.utcnow(),
-                )
-            )
-            tenants = result.scalars().all()
-            
-            logger.info(f"Found {len(tenants)} tenants with expired trials")
-            
-            for tenant in tenants:
-                # Check if they have an active subscription
-                result = await db.execute(
-                    select(Subscription).where(
-                        Subscription.tenant_id == tenant.id,
-                        Subscription.status == SubscriptionStatus.ACTIVE,
-                    )
-                )
-                subscription = result.scalar_one_or_none()
-                
-                if subscription:
-                    # Has paid subscription, remove trial status
-                    tenant.is_trial = False
-                else:
-                    # No paid subscription, deactivate
-                    tenant.is_active = False
-                    logger.info(f"Deactivated tenant {tenant.slug} - trial expired")
-            
+            result = await expire_trials(db, clock.utcnow())
             await db.commit()
-            logger.info("Trial expiration check completed")
+            
+            logger.info(
+                f"Trial expiration check completed: {len(result['converted'])} converted, "
+                f"{len(result['deactivated'])} deactivated"
+            )
+            for tenant_id, slug in result["deactivated"]:
+                logger.info(f"Deactivated tenant {slug} - trial expired")
+            return {"converted": len(result["converted"]), "deactivated": len(result["deactivated"])}
             
         except Exception as e:
             logger.error(f"Error checking trial expiration: {e}", exc_info=True)
             await db.rollback()
 
 
+async def expire_trials(db: AsyncSession, now: datetime) -> Dict[str, List]:
+    """
+    End expired trials with two set-based UPDATEs
+    Tenants with an active subscription leave trial; the rest are deactivated.
+    RETURNING gives the affected tenants for cache invalidation/notifications.
+    """
+    has_active_subscription = (
+        select(Subscription.id)
+        .where(
+            Subscription.tenant_id == Tenant.id,
+            Subscription.status == SubscriptionStatus.ACTIVE,
+        )
+        .exists()
+    )
+    expired = (Tenant.is_trial, Tenant.trial_ends_at <= now)
+    
+    result = await db.execute(
+        update(Tenant)
+        .where(*expired, has_active_subscription)
+        .values(is_trial=False)
+        .returning(Tenant.id)
+        .execution_options(synchronize_session=False)
+    )
+    converted = list(result.scalars().all())
+    
+    result = await db.execute(
+        update(Tenant)
+        .where(*expired, Tenant.is_active, ~has_active_subscription)
+        .values(is_active=False)
+        .returning(Tenant.id, Tenant.slug)
+        .execution_options(synchronize_session=False)
+    )
+    deactivated = [tuple(row) for row in result.all()]
+    
+    return {"converted": converted, "deactivated": deactivated}
+
+
 @celery_app.task(name="app.tasks.billing.generate_monthly_invoices")
-def generate_monthly_invoices():
+@leader_only("generate-monthly-invoices")
+def generate_monthly_invoices(dry_run: bool = False):
     """
     Generate monthly invoices for active subscriptions
+    Daily sweeper behind the renewal tick. Coordinator: partitions due
+    subscriptions into fixed-size id ranges and fans them out as a chord of
+    generate_invoice_chunk tasks. Progress is checkpointed in job_runs; an
+    interrupted run is resumed by the next one.
+    With dry_run the whole pipeline runs in rolled-back transactions and the
+    performance report is returned instead.
+    """
+    if dry_run:
+        return run_async(dry_run_invoices(clock.utcnow()))
+    run_async(_generate_monthly_invoices_async(current_lease()))
+
+
+def _due_for_billing(run_at: datetime):
+    """Filter for subscriptions whose billing period has ended"""
+    return (
+        Subscription.status == SubscriptionStatus.ACTIVE,
+        Subscription.current_period_end <= run_at,
+    )
+
+
+async def partition_due_subscriptions(
+    db: AsyncSession,
+    run_at: datetime,
+    chunk_size: int,
+) -> List[Tuple[Optional[str], Optional[str]]]:
     """
-    import asyncio
-    asyncio.run(_generate_monthly_invoices_async())
+    Split due subscriptions into (lower, upper] id ranges of chunk_size rows
+    Only the boundary id of each chunk is read, so the coordinator stays
+    cheap even with millions of due subscriptions.
+    """
+    ranges = []
+    lower = None
+    while True:
+        query = select(Subscription.id).where(*_due_for_billing(run_at))
+        if lower is not None:
+            query = query.where(Subscription.id > lower)
+        result = await db.execute(
+            query.order_by(Subscription.id).offset(chunk_size - 1).limit(1)
+        )
+        upper = result.scalar_one_or_none()
+        
+        if upper is None:
+            # Last (partial) chunk, if anything is left after `lower`
+            query = select(Subscription.id).where(*_due_for_billing(run_at))
+            if lower is not None:
+                query = query.where(Subscription.id > lower)
+            result = await db.execute(query.limit(1))
+            if result.scalar_one_or_none() is not None:
+                ranges.append((str(lower) if lower else None, None))
+            return ranges
+        
+        ranges.append((str(lower) if lower else None, str(upper)))
+        lower = upper
 
 
-async def _generate_monthly_invoices_async():
+async def _generate_monthly_invoices_async(lease: Optional[Lease] = None, inline: bool = False):
+    """
+    Partition the run and fan it out as a chord
+    inline=True bills the chunks one after another in this process and returns
+    the run summary instead; used where no worker pool runs (the simulator).
+    """
+    run_at = clock.utcnow()
+    
     async with AsyncSessionLocal() as db:
         try:
-            # Find subscriptions due for billing
+            # Already-billed subscriptions had their period advanced, so a
+            # resumed run only partitions what the interrupted one left over
+            run_key = await pending_run_key(db, INVOICE_JOB, run_at.date().isoformat())
+            run = await start_run(db, INVOICE_JOB, run_key, lease)
+            if run is None:
+                logger.info(f"Invoice run {run_key} already completed")
+                return
             
-            result = await db.execute(
-                select(Subscription).where(
-                    Subscription.status == SubscriptionStatus.ACTIVE,
-                    Subscription.current_period_end <= datetime.utcnow(),
-                )
+            started = time.perf_counter()
+            ranges = await partition_due_subscriptions(db, run_at, settings.INVOICE_CHUNK_SIZE)
+            if run.total is None:
+                result = await db.execute(select(func.count(Subscription.id)).where(*_due_for_billing(run_at)))
+                run.total = result.scalar_one()
+                await db.commit()
+            logger.info(
+                f"Partitioned due subscriptions into {len(ranges)} chunks of "
+                f"{settings.INVOICE_CHUNK_SIZE} in {time.perf_counter() - started:.2f}s "
+                f"(run {run_key}, attempt {run.attempts})"
             )
-            subscriptions = result.scalars().all()
             
-            logger.info(f"Found {len(subscriptions)} subscriptions due for billing")
-            
-            for subscription in subscriptions:
-                # Check if invoice already exists
-                result = await db.execute(
-                    select(Invoice).where(
-                        Invoice.subscription_id == subscription.id,
-                        Invoice.invoice_date >= subscription.current_period_start,
-                    )
-                )
-                existing_invoice = result.scalar_one_or_none()
-                
-                if existing_invoice:
-                    logger.info(f"Invoice already exists for subscription {subscription.id}")
-                    continue
-                
-                # Invoice generation would be handled by Stripe webhooks
-                # This is a placeholder for custom logic
-                logger.info(f"Would generate invoice for subscription {subscription.id}")
+            if not ranges:
+                logger.info("No subscriptions due for billing")
+                await finish_run(db, run, JobRunStatus.COMPLETED)
+                return
             
+        except Exception as e:
+            logger.error(f"Error partitioning monthly invoices: {e}", exc_info=True)
+            return
+    
+    if inline:
+        results = [
+            await _generate_invoice_chunk_async(index, lower, upper, run_at, str(run.id), run.fencing_token)
+            for index, (lower, upper) in enumerate(ranges)
+        ]
+        summary = build_run_summary(results, run_at.isoformat())
+        await _finish_invoice_run_async(str(run.id), summary["failed_chunks"])
+        return summary
+    
+    chord(
+        generate_invoice_chunk.s(index, lower, upper, run_at.isoformat(), str(run.id), run.fencing_token)
+        for index, (lower, upper) in enumerate(ranges)
+    )(summarize_invoice_run.s(run_at.isoformat(), str(run.id)))
+
+
+@celery_app.task(name="app.tasks.billing.generate_invoice_chunk")
+def generate_invoice_chunk(
+    chunk_index: int,
+    lower_id: Optional[str],
+    upper_id: Optional[str],
+    run_at: str,
+    run_id: Optional[str] = None,
+    fencing_token: Optional[int] = None,
+):
+    """
+    Generate invoices for one (lower_id, upper_id] range of due subscriptions
+    fencing_token is the run's token when it was partitioned; chunks of a
+    run taken over since then do not count themselves into it.
+    """
+    return run_async(_generate_invoice_chunk_async(
+        chunk_index, lower_id, upper_id, datetime.fromisoformat(run_at), run_id, fencing_token,
+    ))
+
+
+async def _generate_invoice_chunk_async(
+    chunk_index: int,
+    lower_id: Optional[str],
+    upper_id: Optional[str],
+    run_at: datetime,
+    run_id: Optional[str] = None,
+    fencing_token: Optional[int] = None,
+) -> Dict[str, Any]:
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        try:
+            stats = await process_invoice_chunk(db, lower_id, upper_id, run_at)
+            if run_id is not None:
+                # Checkpoint commits with the invoices it counts
+                run = await db.get(JobRun, uuid.UUID(run_id))
+                await checkpoint(db, run, stats["subscriptions"], {
+                    key: stats[key] for key in ("generated", "existing", "ended")
+                }, token=fencing_token)
             await db.commit()
-            logger.info("Monthly invoice generation completed")
             
         except Exception as e:
-            logger.error(f"Error generating monthly invoices: {e}", exc_info=True)
+            logger.error(f"Error generating invoice chunk {chunk_index}: {e}", exc_info=True)
             await db.rollback()
+            stats = {"subscriptions": 0, "existing": 0, "generated": 0, "ended": 0, "amount": "0", "failed": True}
+    
+    stats["chunk"] = chunk_index
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    logger.info(
+        f"Invoice chunk {chunk_index}: {stats['subscriptions']} due, "
+        f"{stats['existing']} already invoiced, {stats['generated']} generated in {stats['seconds']}s"
+    )
+    return stats
+
+
+async def process_invoice_chunk(
+    db: AsyncSession,
+    lower_id: Optional[str],
+    upper_id: Optional[str],
+    run_at: datetime,
+    timer: Optional[StageTimer] = None,
+) -> Dict[str, Any]:
+    """Bill one id range of due subscriptions through the bulk invoice engine"""
+    query = (
+        select(Subscription, Plan)
+        .join(Plan, Subscription.plan_id == Plan.id)
+        .where(*_due_for_billing(run_at))
+    )
+    if lower_id is not None:
+        query = query.where(Subscription.id > uuid.UUID(lower_id))
+    if upper_id is not None:
+        query = query.where(Subscription.id <= uuid.UUID(upper_id))
+    
+    with timed(timer, "load"):
+        result = await db.execute(query.order_by(Subscription.id))
+        due = [tuple(row) for row in result.all()]
+    
+    stats = await bill_subscriptions(db, due, run_at, timer)
+    return stats.as_dict()
 
 
-@celery_app.task(name="app.tasks.billing.calculate_usage_metrics")
-def calculate_usage_metrics():
+async def dry_run_invoices(run_at: datetime, chunk_size: Optional[int] = None) -> Dict[str, Any]:
     """
-    Calculate and aggregate usage metrics for all tenants
+    Run invoice generation end to end and roll every write back
+    Same partitioning and chunk path as the real run, with each chunk in its
+    own transaction that is rolled back, so row locks are held no longer than
+    a real chunk holds them. Chunks are billed one after another, so the
+    timings are a single-worker baseline. Returns counts, totals per plan,
+    per-stage timings, query count and peak memory.
+    """
+    chunk_size = chunk_size or settings.INVOICE_CHUNK_SIZE
+    timer = StageTimer()
+    queries = QueryCounter()
+    results = []
+    started = time.perf_counter()
+    
+    with PeakMemory() as memory:
+        async with AsyncSessionLocal() as db:
+            async with queries.watch(db):
+                with timer.stage("partition"):
+                    ranges = await partition_due_subscriptions(db, run_at, chunk_size)
+            await db.rollback()
+        
+        for lower, upper in ranges:
+            async with AsyncSessionLocal() as db:
+                try:
+                    async with queries.watch(db):
+                        results.append(await process_invoice_chunk(db, lower, upper, run_at, timer))
+                finally:
+                    await db.rollback()
+    
+    seconds = time.perf_counter() - started
+    subscriptions = sum(r["subscriptions"] for r in results)
+    report = {
+        "dry_run": True,
+        "run_at": run_at.isoformat(),
+        "chunk_size": chunk_size,
+        "chunks": len(ranges),
+        "subscriptions": subscriptions,
+        "existing": sum(r["existing"] for r in results),
+        "generated": sum(r["generated"] for r in results),
+        "ended": sum(r["ended"] for r in results),
+        "amount": str(sum((Decimal(r["amount"]) for r in results), Decimal("0"))),
+        "by_plan": merge_plan_totals(results),
+        "stages": timer.as_dict(),
+        "queries": queries.count,
+        "peak_memory_mb": memory.peak_mb,
+        "seconds": round(seconds, 3),
+        "subscriptions_per_second": round(subscriptions / seconds, 1) if seconds else 0,
+    }
+    logger.info(f"Invoice dry run: {report}")
+    return report
+
+
+def merge_plan_totals(chunk_results: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Add up the per-plan invoice counts and amounts of several chunks"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for result in chunk_results:
+        for slug, totals in result.get("by_plan", {}).items():
+            entry = merged.setdefault(slug, {"invoices": 0, "amount": Decimal("0")})
+            entry["invoices"] += totals["invoices"]
+            entry["amount"] += Decimal(totals["amount"])
+    return {
+        slug: {"invoices": entry["invoices"], "amount": str(entry["amount"])}
+        for slug, entry in sorted(merged.items())
+    }
+
+
+@celery_app.task(name="app.tasks.billing.renew_due_subscriptions")
+@leader_only("renew-due-subscriptions")
+def renew_due_subscriptions():
     """
-    import asyncio
-    asyncio.run(_calculate_usage_metrics_async())
+    Minute tick: bill the next slices of subscriptions whose period just ended
+    Keeps invoices close to their due time; generate_monthly_invoices stays
+    as the daily sweeper for anything left behind.
+    """
+    run_async(_renew_due_subscriptions_async())
+
+
+async def claim_renewal_slice(
+    db: AsyncSession,
+    now: datetime,
+    limit: int,
+) -> List[Tuple[Subscription, Plan]]:
+    """
+    Lock the `limit` earliest-ending due subscriptions
+    Reads the head of ix_subscriptions_renewal_due (active subscriptions by
+    current_period_end), so the cost follows the slice, not the table.
+    """
+    result = await db.execute(
+        select(Subscription, Plan)
+        .join(Plan, Subscription.plan_id == Plan.id)
+        .where(*_due_for_billing(now))
+        .order_by(Subscription.current_period_end)
+        .limit(limit)
+        .with_for_update(skip_locked=True, of=Subscription)
+    )
+    return [tuple(row) for row in result.all()]
+
+
+async def _renew_due_subscriptions_async():
+    now = clock.utcnow()
+    totals = {"subscriptions": 0, "generated": 0, "existing": 0, "ended": 0}
+    
+    for _ in range(settings.RENEWAL_MAX_SLICES):
+        async with AsyncSessionLocal() as db:
+            try:
+                due = await claim_renewal_slice(db, now, settings.RENEWAL_SLICE_SIZE)
+                stats = await bill_subscriptions(db, due, now)
+                await db.commit()
+                
+            except Exception as e:
+                logger.error(f"Error renewing subscriptions: {e}", exc_info=True)
+                await db.rollback()
+                break
+        
+        for key in totals:
+            totals[key] += getattr(stats, key)
+        if len(due) < settings.RENEWAL_SLICE_SIZE:
+            break
+    
+    if totals["subscriptions"]:
+        logger.info(f"Renewal tick completed: {totals}")
+    return totals
+
+
+@celery_app.task(name="app.tasks.billing.summarize_invoice_run")
+def summarize_invoice_run(chunk_results: List[Dict[str, Any]], run_at: str, run_id: Optional[str] = None):
+    """
+    Chord callback: aggregate per-chunk progress and timings for the run
+    """
+    summary = build_run_summary(chunk_results, run_at)
+    if run_id is not None:
+        run_async(_finish_invoice_run_async(run_id, summary["failed_chunks"]))
+    return summary
+
+
+def build_run_summary(chunk_results: List[Dict[str, Any]], run_at: str) -> Dict[str, Any]:
+    started = datetime.fromisoformat(run_at)
+    summary = {
+        "run_at": run_at,
+        "chunks": len(chunk_results),
+        "failed_chunks": sum(1 for r in chunk_results if r.get("failed")),
+        "subscriptions": sum(r["subscriptions"] for r in chunk_results),
+        "existing": sum(r["existing"] for r in chunk_results),
+        "generated": sum(r["generated"] for r in chunk_results),
+        "ended": sum(r.get("ended", 0) for r in chunk_results),
+        "amount": str(sum((Decimal(r.get("amount", "0")) for r in chunk_results), Decimal("0"))),
+        "by_plan": merge_plan_totals(chunk_results),
+        "chunk_seconds_total": round(sum(r["seconds"] for r in chunk_results), 3),
+        "chunk_seconds_max": max((r["seconds"] for r in chunk_results), default=0),
+        "wall_seconds": round((clock.utcnow() - started).total_seconds(), 3),
+    }
+    logger.info(f"Monthly invoice generation completed: {summary}")
+    return summary
 
 
-async def _calculate_usage_metrics_async():
+async def _finish_invoice_run_async(run_id: str, failed_chunks: int):
     async with AsyncSessionLocal() as db:
         try:
-            # Find active tenants
-            result = await db.execute(
-                select(Tenant).where(Tenant.is_active)
-            )
-            tenants = result.scalars().all()
-            
-            logger.info(f"Calculating usage metrics for {len(tenants)} tenants")
-            
-            for tenant in tenants:
-                # Placeholder for actual usage calculation
-                # This would integrate with your actual service metrics
-                logger.debug(f"Calculating usage for tenant {tenant.slug}")
-            
-            await db.commit()
-            logger.info("Usage metrics calculation completed")
+            run = await db.get(JobRun, uuid.UUID(run_id))
+            if failed_chunks:
+                # Left open: the next generate_monthly_invoices resumes it
+                await finish_run(db, run, JobRunStatus.FAILED, error=f"{failed_chunks} chunks failed")
+            else:
+                await finish_run(db, run, JobRunStatus.COMPLETED)
             
         except Exception as e:
-            logger.error(f"Error calculating usage metrics: {e}", exc_info=True)
+            logger.error(f"Error closing invoice run {run_id}: {e}", exc_info=True)
             await db.rollback()
 
 
+@celery_app.task(bind=True, name="app.tasks.billing.calculate_usage_metrics")
+@leader_only("calculate-usage-metrics")
+def calculate_usage_metrics(self):
+    """
+    Calculate and aggregate usage metrics for all tenants
+    Checkpointed batch run over active tenants; reports PROGRESS task state
+    """
+    run_async(_calculate_usage_metrics_async(celery_progress(self), current_lease()))
+
+
+async def _fetch_active_tenants(db: AsyncSession, after: Optional[str], limit: int):
+    query = select(Tenant.id, Tenant.slug).where(Tenant.is_active)
+    if after is not None:
+        query = query.where(Tenant.id > uuid.UUID(after))
+    result = await db.execute(query.order_by(Tenant.id).limit(limit))
+    return result.all()
+
+
+async def _count_active_tenants(db: AsyncSession) -> int:
+    result = await db.execute(select(func.count(Tenant.id)).where(Tenant.is_active))
+    return result.scalar_one()
+
+
+async def _calculate_tenant_usage(db: AsyncSession, tenants) -> Dict[str, int]:
+    for tenant_id, slug in tenants:
+        # Placeholder for actual usage calculation
+        # This would integrate with your actual service metrics
+        logger.debug(f"Calculating usage for tenant {slug}")
+    return {"tenants": len(tenants)}
+
+
+async def _calculate_usage_metrics_async(on_progress=None, lease: Optional[Lease] = None):
+    run_at = clock.utcnow()
+    try:
+        async with AsyncSessionLocal() as db:
+            run_key = await pending_run_key(db, USAGE_METRICS_JOB, f"{run_at:%Y-%m-%dT%H}")
+        
+        summary = await run_batched(
+            USAGE_METRICS_JOB,
+            run_key,
+            fetch_chunk=_fetch_active_tenants,
+            process_chunk=_calculate_tenant_usage,
+            key=lambda row: str(row.id),
+            chunk_size=settings.BATCH_CHUNK_SIZE,
+            count=_count_active_tenants,
+            on_progress=on_progress,
+            lease=lease,
+        )
+        if summary is not None:
+            logger.info(f"Usage metrics calculation completed for {summary['processed']} tenants")
+        
+    except Exception as e:
+        logger.error(f"Error calculating usage metrics: {e}", exc_info=True)
+
+
 @celery_app.task(name="app.tasks.billing.process_failed_payments")
+@leader_only("process-failed-payments")
 def process_failed_payments():
     """
-    Retry failed payments and update subscription status
+    Retry failed payments that are due and update subscription status
     """
-    import asyncio
-    asyncio.run(_process_failed_payments_async())
+    run_async(_process_failed_payments_async())
 
 
 async def _process_failed_payments_async():
+    totals = {}
+    for _ in range(settings.DUNNING_MAX_BATCHES):
+        try:
+            # Commits its own short transactions; none is open while Stripe is called
+            stats = await process_due_attempts(AsyncSessionLocal, clock.utcnow(), settings.DUNNING_BATCH_SIZE)
+        except Exception as e:
+            logger.error(f"Error processing failed payments: {e}", exc_info=True)
+            break
+        
+        for key, value in stats.items():
+            totals[key] = totals.get(key, 0) + value
+        if stats["attempted"] + stats["canceled"] < settings.DUNNING_BATCH_SIZE:
+            break
+    
+    logger.info(f"Failed payment processing completed: {totals}")
+    return totals
+
+
+@celery_app.task(name="app.tasks.billing.reconcile_stripe")
+@leader_only("reconcile-stripe")
+def reconcile_stripe():
+    """
+    Correct subscriptions and invoices that drifted from Stripe (dropped webhooks)
+    """
+    return run_async(_reconcile_stripe_async())
+
+
+async def _reconcile_stripe_async():
     async with AsyncSessionLocal() as db:
         try:
-            # Find subscriptions with payment issues
-            result = await db.execute(
-                select(Subscription).where(
-                    Subscription.status == SubscriptionStatus.PAST_DUE,
-                )
+            stats = await reconcile_with_stripe(db, clock.utcnow())
+            logger.info(
+                f"Stripe reconciliation completed: {stats['pages']} pages in {stats['seconds']}s "
+                f"({stats['objects_per_second']} objects/s); subscriptions {stats['subscriptions']}, "
+                f"invoices {stats['invoices']}"
             )
-            subscriptions = result.scalars().all()
-            
-            logger.info(f"Found {len(subscriptions)} subscriptions with failed payments")
+            return stats
             
-            for subscription in subscriptions:
-                # Retry payment logic would go here
-                # This is typically handled by Stripe
-                logger.info(f"Processing failed payment for subscription {subscription.id}")
-            
-            await db.commit()
-            logger.info("Failed payment processing completed")
+        except Exception as e:
+            logger.error(f"Error reconciling with Stripe: {e}", exc_info=True)
+            await db.rollback()
+
+
+@celery_app.task(
+    name="app.tasks.billing.create_stripe_customer",
+    # Stripe unavailable (CircuitOpenError is an APIConnectionError); a paid
+    # action creates the customer on demand if every retry fails
+    autoretry_for=(stripe.error.APIConnectionError, stripe.error.APIError, stripe.error.RateLimitError),
+    retry_backoff=True,
+    max_retries=5,
+)
+def create_stripe_customer(tenant_id: str):
+    """
+    Create the Stripe customer of a newly registered tenant
+    """
+    return run_async(_create_stripe_customer_async(uuid.UUID(tenant_id)))
+
+
+async def _create_stripe_customer_async(tenant_id: uuid.UUID) -> Optional[str]:
+    async with AsyncSessionLocal() as db:
+        tenant = await db.get(Tenant, tenant_id)
+        if tenant is None:
+            logger.error(f"Tenant {tenant_id} not found")
+            return None
+        customer_id = await ensure_stripe_customer(db, tenant)
+        logger.info(f"Tenant {tenant.slug} has Stripe customer {customer_id}")
+        return customer_id
+
+
+@celery_app.task(name="app.tasks.billing.drain_stripe_outbox")
+def drain_stripe_outbox():
+    """
+    Send queued Stripe operations (subscription writes made in async mode)
+    Woken by the API after each enqueue; the beat entry sweeps up retries.
+    Concurrent drainers are safe: claims skip rows another one holds.
+    """
+    return run_async(_drain_stripe_outbox_async())
+
+
+async def _drain_stripe_outbox_async():
+    totals = {"claimed": 0, "succeeded": 0, "retried": 0, "failed": 0}
+    while True:
+        stats = await drain_outbox(AsyncSessionLocal, clock.utcnow(), settings.OUTBOX_BATCH_SIZE)
+        for key, value in stats.items():
+            totals[key] += value
+        if stats["claimed"] < settings.OUTBOX_BATCH_SIZE:
+            break
+    if totals["claimed"]:
+        logger.info(
+            f"Stripe outbox drained: {totals['succeeded']} succeeded, "
+            f"{totals['retried']} to retry, {totals['failed']} failed"
+        )
+    return totals
+
+
+@celery_app.task(name="app.tasks.billing.archive_usage_history")
+@leader_only("archive-usage-history")
+def archive_usage_history():
+    """
+    Move closed months of usage metrics into the columnar archive
+    """
+    run_async(_archive_usage_history_async())
+
+
+async def _archive_usage_history_async():
+    async with AsyncSessionLocal() as db:
+        try:
+            stats = await archive_closed_months(db)
+            logger.info(
+                f"Usage archive completed: {stats['rows']} rows, "
+                f"{stats['months']} months, {stats['tenants']} tenants"
+            )
             
         except Exception as e:
-            logger.error(f"Error processing failed payments: {e}", exc_info=True)
+            logger.error(f"Error archiving usage history: {e}", exc_info=True)
             await db.rollback()
@@ -1,11 +1,26 @@
 from celery import Celery
+from kombu import Queue
+
 from app.core.config import settings
 
+# Dedicated queues, each consumed by its own worker profile (k8s/celery.yaml):
+# prefork for billing, a thread pool for IO-bound email,
+# and webhook consumers kept apart so billing runs never delay Stripe events
+BILLING_QUEUE = "billing"
+NOTIFICATIONS_QUEUE = "notifications"
+WEBHOOKS_QUEUE = "webhooks"
+QUEUES = (BILLING_QUEUE, NOTIFICATIONS_QUEUE, WEBHOOKS_QUEUE)
+
+# Redis emulates priorities with one list per step; 0 is served first
+PRIORITY_STEPS = [0, 3, 6, 9]
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 6
+
 celery_app = Celery(
     "saas_billing",
     broker=settings.CELERY_BROKER_URL,
     backend=settings.CELERY_RESULT_BACKEND,
-    include=["app.tasks.billing", "app.tasks.notifications"],
+    include=["app.tasks.billing", "app.tasks.notifications", "app.tasks.webhooks"],
 )
 
 # Celery configuration
@@ -18,27 +33,81 @@ celery_app.conf.update(
     task_track_started=True,
     task_time_limit=30 * 60,  # 30 minutes
     task_soft_time_limit=25 * 60,  # 25 minutes
+    task_queues=[Queue(name, routing_key=name) for name in QUEUES],
+    task_default_queue=BILLING_QUEUE,
+    task_default_priority=PRIORITY_NORMAL,
+    broker_transport_options={
+        "queue_order_strategy": "priority",
+        "priority_steps": PRIORITY_STEPS,
+        "sep": ":",
+    },
+    # Reserve one message at a time, so a long chunk does not sit on
+    # prefetched high-priority work and priorities hold across the queue
+    worker_prefetch_multiplier=1,
 )
 
+# Exact names are matched before patterns
+celery_app.conf.task_routes = {
+    # Time-sensitive billing work goes ahead of bulk chunks in the same queue
+    "app.tasks.billing.renew_due_subscriptions": {"queue": BILLING_QUEUE, "priority": PRIORITY_HIGH},
+    "app.tasks.billing.check_trial_expiration": {"queue": BILLING_QUEUE, "priority": PRIORITY_HIGH},
+    "app.tasks.billing.process_failed_payments": {"queue": BILLING_QUEUE, "priority": 3},
+    # Someone is polling for these
+    "app.tasks.billing.drain_stripe_outbox": {"queue": BILLING_QUEUE, "priority": PRIORITY_HIGH},
+    "app.tasks.billing.*": {"queue": BILLING_QUEUE, "priority": PRIORITY_NORMAL},
+    # Transactional payment emails ahead of bulk reminders and warnings
+    "app.tasks.notifications.send_payment_success_email": {"queue": NOTIFICATIONS_QUEUE, "priority": PRIORITY_HIGH},
+    "app.tasks.notifications.send_payment_failure_email": {"queue": NOTIFICATIONS_QUEUE, "priority": PRIORITY_HIGH},
+    "app.tasks.notifications.*": {"queue": NOTIFICATIONS_QUEUE, "priority": PRIORITY_NORMAL},
+    "app.tasks.webhooks.*": {"queue": WEBHOOKS_QUEUE, "priority": PRIORITY_HIGH},
+}
+
 # Periodic tasks schedule
 celery_app.conf.beat_schedule = {
     "check-trial-expiration": {
         "task": "app.tasks.billing.check_trial_expiration",
         "schedule": 3600.0,  # Every hour
     },
+    "renew-due-subscriptions": {
+        "task": "app.tasks.billing.renew_due_subscriptions",
+        "schedule": 60.0,  # Every minute; bills renewals close to their due time
+    },
     "generate-monthly-invoices": {
         "task": "app.tasks.billing.generate_monthly_invoices",
-        "schedule": 86400.0,  # Every day
+        "schedule": 86400.0,  # Every day; sweeps anything the renewal tick missed
+    },
+    "process-failed-payments": {
+        "task": "app.tasks.billing.process_failed_payments",
+        "schedule": 900.0,  # Every 15 minutes; only due retries are popped
     },
     "calculate-usage-metrics": {
         "task": "app.tasks.billing.calculate_usage_metrics",
         "schedule": 3600.0,  # Every hour
     },
+    "drain-stripe-outbox": {
+        "task": "app.tasks.billing.drain_stripe_outbox",
+        "schedule": 15.0,  # Sweeps retries; new operations wake a drainer directly
+    },
+    "process-webhook-events": {
+        "task": "app.tasks.webhooks.process_webhook_events",
+        "schedule": 15.0,  # Sweeps retries; each received event wakes a consumer directly
+    },
+    "reconcile-stripe": {
+        "task": "app.tasks.billing.reconcile_stripe",
+        "schedule": 21600.0,  # Every 6 hours; repairs drift from dropped webhooks
+    },
+    "archive-usage-history": {
+        "task": "app.tasks.billing.archive_usage_history",
+        "schedule": 86400.0,  # Every day
+    },
     "send-payment-reminders": {
         "task": "app.tasks.notifications.send_payment_reminders",
         "schedule": 43200.0,  # Every 12 hours
     },
 }
 
+# Connected in every process that publishes or runs tasks
+from app.tasks import monitoring  # noqa: E402,F401
+
 if __name__ == "__main__":
     celery_app.start()
@@ -0,0 +1,246 @@
+"""
+Leader leases for periodic tasks
+
+Beat can fire a job twice (two beat replicas, a slow run overlapping the
+next tick, a manual trigger). Wrapping a task in @leader_only makes the
+second run skip instead of contending on the same rows.
+
+The lease is a Redis key set with SET NX PX. Each acquisition also
+increments a per-job counter, giving a fencing token that only grows, and
+a heartbeat thread keeps extending the TTL while the task runs. Renew and
+release are compare-and-set Lua scripts, so a run whose lease already
+expired can never extend or delete a newer holder's lease.
+
+If Redis is unreachable the lease falls back to a PostgreSQL session-level
+advisory lock, held on a dedicated connection until the task finishes.
+"""
+from typing import Any, Callable, Optional
+import functools
+import hashlib
+import logging
+import os
+import socket
+import threading
+import uuid
+
+import redis
+from sqlalchemy import text
+
+from app.core import database
+from app.core.config import settings
+from app.tasks.runtime import run_async
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] = lease key, KEYS[2] = fencing counter; ARGV[1] = owner, ARGV[2] = ttl ms
+ACQUIRE_SCRIPT = """
+if redis.call('set', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return redis.call('incr', KEYS[2])
+end
+return false
+"""
+
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaseLost(Exception):
+    """Raised by Lease.ensure_held() once the lease has been taken over"""
+
+
+class Lease:
+    """A held lease; subclasses implement acquire/release"""
+
+    backend = "none"
+
+    def __init__(self, name: str):
+        self.name = name
+        self.token: Optional[int] = None
+        self.lost = threading.Event()
+
+    def acquire(self) -> bool:
+        return True
+
+    def release(self) -> None:
+        pass
+
+    def ensure_held(self) -> None:
+        """Call between commits of a long run to stop writing after losing the lease"""
+        if self.lost.is_set():
+            raise LeaseLost(f"Lease {self.name} (token {self.token}) was lost")
+
+
+class RedisLease(Lease):
+    """SET NX PX lease with a fencing token and a heartbeat thread"""
+
+    backend = "redis"
+
+    def __init__(self, client: redis.Redis, name: str, ttl_seconds: int):
+        super().__init__(name)
+        self._client = client
+        self._key = f"lease:{name}"
+        self._fence_key = f"lease:{name}:fence"
+        self._ttl_ms = int(ttl_seconds * 1000)
+        self._owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def acquire(self) -> bool:
+        token = self._client.eval(ACQUIRE_SCRIPT, 2, self._key, self._fence_key, self._owner, self._ttl_ms)
+        if not token:
+            return False
+
+        self.token = int(token)
+        self._heartbeat = threading.Thread(
+            target=self._renew_until_stopped, name=f"lease-{self.name}", daemon=True
+        )
+        self._heartbeat.start()
+        return True
+
+    def _renew_until_stopped(self) -> None:
+        interval = self._ttl_ms / 3000
+        while not self._stop.wait(interval):
+            try:
+                renewed = self._client.eval(RENEW_SCRIPT, 1, self._key, self._owner, self._ttl_ms)
+            except redis.RedisError as e:
+                # Keep trying until the TTL runs out; the next renew may get through
+                logger.warning(f"Lease {self.name} heartbeat failed: {e}")
+                continue
+
+            if not renewed:
+                self.lost.set()
+                logger.error(f"Lease {self.name} (token {self.token}) expired while the task was running")
+                return
+
+    def release(self) -> None:
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        try:
+            self._client.eval(RELEASE_SCRIPT, 1, self._key, self._owner)
+        except redis.RedisError as e:
+            # The lease expires on its own after the TTL
+            logger.warning(f"Could not release lease {self.name}: {e}")
+
+
+class AdvisoryLease(Lease):
+    """
+    PostgreSQL session-level advisory lock
+    No TTL to renew: the lock lives exactly as long as its connection, so a
+    crashed holder releases it when the connection drops.
+    """
+
+    backend = "postgres"
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        digest = hashlib.sha256(f"lease:{name}".encode()).digest()
+        self.key = int.from_bytes(digest[:8], "big", signed=True)
+        self._conn = None
+
+    def acquire(self) -> bool:
+        return run_async(self._acquire())
+
+    async def _acquire(self) -> bool:
+        engine = database.AsyncSessionLocal.kw["bind"]
+        conn = await engine.connect()
+        try:
+            result = await conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key})
+            acquired = bool(result.scalar())
+            # Session-level lock: commit so the connection does not sit idle in a transaction
+            await conn.commit()
+        except Exception:
+            await conn.close()
+            raise
+
+        if not acquired:
+            await conn.close()
+            return False
+        self._conn = conn
+        return True
+
+    def release(self) -> None:
+        if self._conn is not None:
+            run_async(self._release())
+
+    async def _release(self) -> None:
+        try:
+            await self._conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+            await self._conn.commit()
+        finally:
+            await self._conn.close()
+            self._conn = None
+
+
+_redis_client: Optional[redis.Redis] = None
+_held = threading.local()
+
+
+def get_redis() -> redis.Redis:
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(
+            settings.REDIS_URL,
+            socket_connect_timeout=2,
+            socket_timeout=2,
+        )
+    return _redis_client
+
+
+def acquire_lease(name: str, ttl_seconds: int) -> Optional[Lease]:
+    """Take the lease for `name`, or return None if another run holds it"""
+    try:
+        lease = RedisLease(get_redis(), name, ttl_seconds)
+        return lease if lease.acquire() else None
+    except redis.RedisError as e:
+        logger.warning(f"Redis unavailable for lease {name}, falling back to database lock: {e}")
+
+    if database.AsyncSessionLocal.kw["bind"].dialect.name == "postgresql":
+        lease = AdvisoryLease(name)
+        return lease if lease.acquire() else None
+
+    # Development databases (SQLite) run a single worker; nothing to elect
+    logger.warning(f"No lock backend for lease {name}; running unguarded")
+    return Lease(name)
+
+
+def current_lease() -> Optional[Lease]:
+    """The lease held by the @leader_only task running in this thread"""
+    return getattr(_held, "lease", None)
+
+
+def leader_only(name: str, ttl_seconds: Optional[int] = None) -> Callable:
+    """
+    Run the task only while holding the `name` lease; skip it otherwise
+    Place it under @celery_app.task so Celery registers the wrapper.
+    """
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            lease = acquire_lease(name, ttl_seconds or settings.LEADER_LEASE_TTL_SECONDS)
+            if lease is None:
+                logger.info(f"Skipping {name}: another run holds the lease")
+                return None
+
+            logger.info(f"Acquired lease {name} via {lease.backend} (token {lease.token})")
+            _held.lease = lease
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _held.lease = None
+                lease.release()
+                if lease.lost.is_set():
+                    logger.error(f"{name} finished after losing its lease; another run may have overlapped")
+        return wrapper
+    return decorator
@@ -0,0 +1,129 @@
+"""
+Per-queue latency and backlog metrics for the Celery workers
+
+Every published message is stamped with its publish time. When a worker
+starts the task, the queue wait (publish -> start) is recorded, and when
+it finishes, the runtime; both go to capped Redis lists per queue on the
+broker, so any process can read recent percentiles. Backlog is the length
+of the queue's broker lists (one per priority step).
+
+Recording never fails a task: metrics are dropped if Redis is unavailable.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+import threading
+import time
+
+import redis
+from celery import Celery
+from celery.signals import before_task_publish, task_postrun, task_prerun
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PUBLISHED_HEADER = "published_at"
+METRICS_PREFIX = "celery:metrics"
+
+_client: Optional[redis.Redis] = None
+_started: Dict[str, Tuple[str, float]] = {}
+_started_lock = threading.Lock()
+
+
+def get_broker_redis() -> redis.Redis:
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.CELERY_BROKER_URL,
+            socket_connect_timeout=2,
+            socket_timeout=2,
+        )
+    return _client
+
+
+def _key(queue: str, kind: str) -> str:
+    return f"{METRICS_PREFIX}:{queue}:{kind}"
+
+
+def record_sample(queue: str, kind: str, seconds: float, client: Optional[redis.Redis] = None) -> None:
+    """Keep the latest QUEUE_METRICS_SAMPLES values (ms) of `kind` for `queue`"""
+    client = client or get_broker_redis()
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.lpush(_key(queue, kind), round(seconds * 1000, 1))
+        pipe.ltrim(_key(queue, kind), 0, settings.QUEUE_METRICS_SAMPLES - 1)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.debug(f"Dropped {kind} sample for queue {queue}: {e}")
+
+
+def _queue_of(request) -> Optional[str]:
+    return (request.delivery_info or {}).get("routing_key")
+
+
+@before_task_publish.connect
+def _stamp_published(headers: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+    if headers is not None:
+        headers.setdefault(PUBLISHED_HEADER, time.time())
+
+
+@task_prerun.connect
+def _record_wait(task_id: str = None, task=None, **kwargs: Any) -> None:
+    queue = _queue_of(task.request)
+    if queue is None:
+        # Eager or direct call: never went through a queue
+        return
+
+    now = time.time()
+    with _started_lock:
+        _started[task_id] = (queue, now)
+    published = getattr(task.request, PUBLISHED_HEADER, None)
+    if published is not None:
+        record_sample(queue, "wait", max(0.0, now - float(published)))
+
+
+@task_postrun.connect
+def _record_runtime(task_id: str = None, **kwargs: Any) -> None:
+    with _started_lock:
+        started = _started.pop(task_id, None)
+    if started is not None:
+        queue, started_at = started
+        record_sample(queue, "runtime", time.time() - started_at)
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+    return {
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
+
+
+def priority_keys(app: Celery, queue: str) -> List[str]:
+    """Broker list names of `queue`, one per priority step (kombu's naming)"""
+    options = app.conf.broker_transport_options or {}
+    sep = options.get("sep", "\x06\x16")
+    return [queue if step == 0 else f"{queue}{sep}{step}" for step in options.get("priority_steps", [0, 3, 6, 9])]
+
+
+def queue_stats(app: Celery, client: Optional[redis.Redis] = None) -> Dict[str, Dict[str, Any]]:
+    """Backlog and recent wait/runtime percentiles (ms) for every configured queue"""
+    client = client or get_broker_redis()
+    stats = {}
+    for queue in (q.name for q in app.conf.task_queues):
+        pipe = client.pipeline(transaction=False)
+        for key in priority_keys(app, queue):
+            pipe.llen(key)
+        pipe.lrange(_key(queue, "wait"), 0, -1)
+        pipe.lrange(_key(queue, "runtime"), 0, -1)
+        *lengths, waits, runtimes = pipe.execute()
+        stats[queue] = {
+            "backlog": sum(lengths),
+            "wait_ms": _percentiles([float(v) for v in waits]),
+            "runtime_ms": _percentiles([float(v) for v in runtimes]),
+            "samples": len(waits),
+        }
+    return stats
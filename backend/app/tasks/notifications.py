@@ -1,7 +1,10 @@
-from datetime import datetime, timedelta
+from datetime import timedelta
 import logging
 
-from app.core.celery_app import celery_app
+from app.tasks.celery_app import celery_app
+from app.tasks.runtime import run_async
+from app.tasks.leader import leader_only
+from app.core import clock
 from app.core.database import AsyncSessionLocal
 from app.models.tenant import Tenant
 from app.models.invoice import Invoice, InvoiceStatus
@@ -14,38 +17,34 @@ logger = logging.getLogger(__name__)
 @celery_app.task(name="app.tasks.notifications.send_welcome_email")
 def send_welcome_email(email: str, user_name: str, tenant_name: str = None):
     """Send welcome email to new user"""
-    import asyncio
-    asyncio.run(email_service.send_welcome_email(email, user_name, tenant_name))
+    run_async(email_service.send_welcome_email(email, user_name, tenant_name))
 
 
 @celery_app.task(name="app.tasks.notifications.send_subscription_email")
 def send_subscription_email(email: str, plan_name: str, amount: float, trial_days: int = None):
     """Send subscription created email"""
-    import asyncio
-    asyncio.run(email_service.send_subscription_created(email, plan_name, amount, trial_days))
+    run_async(email_service.send_subscription_created(email, plan_name, amount, trial_days))
 
 
 @celery_app.task(name="app.tasks.notifications.send_payment_success_email")
 def send_payment_success_email(email: str, amount: float, invoice_url: str, next_billing: str):
     """Send payment success email"""
-    import asyncio
-    asyncio.run(email_service.send_payment_succeeded(email, amount, invoice_url, next_billing))
+    run_async(email_service.send_payment_succeeded(email, amount, invoice_url, next_billing))
 
 
 @celery_app.task(name="app.tasks.notifications.send_payment_failure_email")
 def send_payment_failure_email(email: str, amount: float, retry_date: str, reason: str = None):
     """Send payment failure email"""
-    import asyncio
-    asyncio.run(email_service.send_payment_failed(email, amount, retry_date, reason))
+    run_async(email_service.send_payment_failed(email, amount, retry_date, reason))
 
 
 @celery_app.task(name="app.tasks.notifications.send_payment_reminders")
+@leader_only("send-payment-reminders")
 def send_payment_reminders():
     """
     Send payment reminder emails for overdue invoices
     """
-    import asyncio
-    asyncio.run(_send_payment_reminders_async())
+    run_async(_send_payment_reminders_async())
 
 
 async def _send_payment_reminders_async():
@@ -55,7 +54,7 @@ async def _send_payment_reminders_async():
             result = await db.execute(
                 select(Invoice).where(
                     Invoice.status == InvoiceStatus.OPEN,
-                    Invoice.due_date <= datetime.utcnow(),
+                    Invoice.due_date <= clock.utcnow(),
                 )
             )
             invoices = result.scalars().all()
@@ -75,31 +74,32 @@ async def _send_payment_reminders_async():
                     logger.info(f"Sent payment reminder to {tenant.email} for invoice {invoice.invoice_number}")
             
             logger.info("Payment reminders sent successfully")
+            return {"reminders": len(invoices)}
             
         except Exception as e:
             logger.error(f"Error sending payment reminders: {e}", exc_info=True)
 
 
 @celery_app.task(name="app.tasks.notifications.send_trial_expiry_warning")
+@leader_only("send-trial-expiry-warning")
 def send_trial_expiry_warning():
     """
     Send warning emails to tenants with trials expiring soon
     """
-    import asyncio
-    asyncio.run(_send_trial_expiry_warning_async())
+    run_async(_send_trial_expiry_warning_async())
 
 
 async def _send_trial_expiry_warning_async():
     async with AsyncSessionLocal() as db:
         try:
             # Find trials expiring in 3 days
-            expiry_date = datetime.utcnow() + timedelta(days=3)
+            expiry_date = clock.utcnow() + timedelta(days=3)
             
             result = await db.execute(
                 select(Tenant).where(
                     Tenant.is_trial,
                     Tenant.trial_ends_at <= expiry_date,
-                    Tenant.trial_ends_at > datetime.utcnow(),
+                    Tenant.trial_ends_at > clock.utcnow(),
                 )
             )
             tenants = result.scalars().all()
@@ -122,8 +122,7 @@ def send_invoice_email(invoice_id: str):
     """
     Send invoice email to tenant
     """
-    import asyncio
-    asyncio.run(_send_invoice_email_async(invoice_id))
+    run_async(_send_invoice_email_async(invoice_id))
 
 
 async def _send_invoice_email_async(invoice_id: str):
@@ -0,0 +1,118 @@
+"""
+Worker-level asyncio runtime for Celery tasks
+
+Each worker process owns one long-lived event loop, running in a background
+thread, and one async engine/pool bound to that loop. Tasks submit their
+coroutines with run_async() instead of asyncio.run(), so pooled database
+connections survive from one task to the next instead of being tied to a
+loop that is thrown away.
+"""
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+import asyncio
+import logging
+import threading
+
+from celery.signals import (
+    worker_process_init,
+    worker_process_shutdown,
+    worker_shutdown,
+)
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core import database
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class WorkerRuntime:
+    """Owns the event loop thread and the engine for one worker process"""
+
+    def __init__(self, engine_factory: Callable[[], AsyncEngine] = database.build_engine):
+        self._engine_factory = engine_factory
+        self._lock = threading.Lock()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+        self.engine: Optional[AsyncEngine] = None
+
+    @property
+    def running(self) -> bool:
+        return self.loop is not None and self.loop.is_running()
+
+    def start(self) -> None:
+        """Start the loop thread and bind AsyncSessionLocal to a fresh engine"""
+        with self._lock:
+            if self.running:
+                return
+
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run_loop():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            self.thread = threading.Thread(target=run_loop, name="celery-async-runtime", daemon=True)
+            self.thread.start()
+            ready.wait()
+            self.loop = loop
+
+            # Engines must not be shared across fork(); each process gets its own pool
+            self.engine = self._engine_factory()
+            database.AsyncSessionLocal.configure(bind=self.engine)
+            logger.info("Async worker runtime started")
+
+    def run(self, coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+        """Run a coroutine on the worker loop and block until it finishes"""
+        if not self.running:
+            self.start()
+
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            # Soft time limits and timeouts interrupt the caller, not the loop
+            future.cancel()
+            raise
+
+    def shutdown(self) -> None:
+        """Dispose the pool and stop the loop thread"""
+        with self._lock:
+            if not self.running:
+                return
+
+            try:
+                asyncio.run_coroutine_threadsafe(self.engine.dispose(), self.loop).result(30)
+            except Exception as e:
+                logger.error(f"Error disposing worker engine: {e}", exc_info=True)
+
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=30)
+            self.loop.close()
+            database.AsyncSessionLocal.configure(bind=database.engine)
+
+            self.loop = None
+            self.thread = None
+            self.engine = None
+            logger.info("Async worker runtime stopped")
+
+
+runtime = WorkerRuntime()
+
+
+def run_async(coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """Submit a coroutine to this process's worker runtime"""
+    return runtime.run(coro, timeout)
+
+
+@worker_process_init.connect
+def _start_runtime(**kwargs: Any) -> None:
+    runtime.start()
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def _stop_runtime(**kwargs: Any) -> None:
+    runtime.shutdown()
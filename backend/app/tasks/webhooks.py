@@ -0,0 +1,41 @@
+from collections import Counter
+import logging
+
+from app.tasks.celery_app import celery_app
+from app.tasks.runtime import run_async
+from app.core import clock
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.services.stripe_webhooks import process_events
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(name="app.tasks.webhooks.process_webhook_events")
+def process_webhook_events():
+    """
+    Apply received Stripe webhook events
+    Woken by the webhook endpoint after each stored event; the beat entry
+    sweeps up retries. Concurrent consumers are safe: claims skip rows
+    another one holds, and a subscription's events are never split between
+    two consumers at once.
+    """
+    return run_async(_process_webhook_events_async())
+
+
+async def _process_webhook_events_async():
+    totals = Counter()
+    while True:
+        stats = await process_events(AsyncSessionLocal, clock.utcnow(), settings.WEBHOOK_BATCH_SIZE)
+        totals.update(stats)
+        # A short batch is not the end: applying an event unblocks the
+        # next one for its subscription
+        if not stats["claimed"]:
+            break
+    if totals["claimed"]:
+        logger.info(
+            f"Webhook events processed: {totals['processed']} applied "
+            f"({totals['superseded']} superseded in their batch), "
+            f"{totals['retried']} to retry, {totals['dead']} dead-lettered"
+        )
+    return dict(totals)
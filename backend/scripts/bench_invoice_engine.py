@@ -0,0 +1,144 @@
+"""
+Benchmark the bulk invoice engine
+Seeds N due subscriptions (with some metered usage) and bills them in
+INVOICE_CHUNK_SIZE chunks through process_invoice_chunk, the same path the
+generate_invoice_chunk tasks run. A second pass over the same periods
+measures the idempotent (all-conflict) rerun.
+
+Run: python scripts/bench_invoice_engine.py [--subscriptions 100000] [--chunk-size 1000] [--database-url URL]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import func, insert, select, text, update
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.models import base  # noqa: F401 - registers all models
+from app.core.database import Base
+from app.models.tenant import Tenant
+from app.models.plan import Plan, PlanTier
+from app.models.subscription import Subscription, SubscriptionStatus
+from app.models.invoice import Invoice
+from app.models.usage_metric import UsageMetric, MetricType
+from app.tasks.billing import partition_due_subscriptions, process_invoice_chunk
+
+PERIOD_START = datetime(2026, 9, 1)
+PERIOD_END = datetime(2026, 10, 1)
+
+
+async def seed(session_factory, subscriptions: int):
+    plan_id = uuid.uuid4()
+    async with session_factory() as db:
+        await db.execute(insert(Plan).values(
+            id=plan_id, name="Pro", slug="pro", tier=PlanTier.PRO, price=Decimal("29.00"),
+        ))
+        for offset in range(0, subscriptions, 5000):
+            batch = range(offset, min(offset + 5000, subscriptions))
+            tenant_ids = [uuid.uuid4() for _ in batch]
+            await db.execute(insert(Tenant), [
+                {
+                    "id": tenant_id, "name": f"t{i}", "slug": f"t{i}", "email": f"t{i}@example.com",
+                    "schema_name": f"tenant_t{i}", "is_trial": False, "is_active": True, "max_users": 5,
+                }
+                for i, tenant_id in zip(batch, tenant_ids)
+            ])
+            await db.execute(insert(Subscription), [
+                {
+                    "id": uuid.uuid4(), "tenant_id": tenant_id, "plan_id": plan_id,
+                    "status": SubscriptionStatus.ACTIVE, "cancel_at_period_end": False,
+                    "current_period_start": PERIOD_START, "current_period_end": PERIOD_END,
+                }
+                for tenant_id in tenant_ids
+            ])
+            # Every tenant records a month of API calls; a tenth of them go over the plan limit
+            await db.execute(insert(UsageMetric), [
+                {
+                    "id": uuid.uuid4(), "tenant_id": tenant_id, "metric_type": MetricType.API_CALLS,
+                    "metric_name": "api_calls", "value": 2500 if i % 10 == 0 else 400, "unit": "calls",
+                    "period_start": PERIOD_START + timedelta(days=day), "period_end": PERIOD_START + timedelta(days=day),
+                }
+                for i, tenant_id in zip(batch, tenant_ids)
+                for day in (3, 17)
+            ])
+        await db.commit()
+
+
+async def run_pass(session_factory, run_at: datetime, chunk_size: int):
+    async with session_factory() as db:
+        ranges = await partition_due_subscriptions(db, run_at, chunk_size)
+
+    totals = {"subscriptions": 0, "generated": 0, "existing": 0}
+    start = time.perf_counter()
+    for lower, upper in ranges:
+        async with session_factory() as db:
+            stats = await process_invoice_chunk(db, lower, upper, run_at)
+            await db.commit()
+        for key in totals:
+            totals[key] += stats[key]
+    return totals, time.perf_counter() - start
+
+
+async def main(url: str, subscriptions: int, chunk_size: int):
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    print(f"Seeding {subscriptions} due subscriptions...")
+    await seed(session_factory, subscriptions)
+    async with engine.begin() as conn:
+        # Planner statistics, as autovacuum would have them in production
+        await conn.execute(text("ANALYZE"))
+    run_at = PERIOD_END + timedelta(hours=1)
+
+    print(f"\n{'pass':<10}{'due':>10}{'generated':>11}{'existing':>10}{'seconds':>10}{'subs/s':>10}")
+    totals, seconds = await run_pass(session_factory, run_at, chunk_size)
+    print(f"{'first':<10}{totals['subscriptions']:>10}{totals['generated']:>11}{totals['existing']:>10}"
+          f"{seconds:>10.2f}{totals['subscriptions'] / seconds:>10.0f}")
+
+    # Rewind the periods to replay the same run: every insert now conflicts
+    async with session_factory() as db:
+        await db.execute(update(Subscription).values(
+            current_period_start=PERIOD_START, current_period_end=PERIOD_END,
+        ))
+        await db.commit()
+    totals, seconds = await run_pass(session_factory, run_at, chunk_size)
+    print(f"{'rerun':<10}{totals['subscriptions']:>10}{totals['generated']:>11}{totals['existing']:>10}"
+          f"{seconds:>10.2f}{totals['subscriptions'] / seconds:>10.0f}")
+
+    async with session_factory() as db:
+        count, amount = (await db.execute(select(func.count(Invoice.id), func.sum(Invoice.total)))).one()
+    print(f"\n{count} invoices, ${amount} billed")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--subscriptions", type=int, default=100_000)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument(
+        "--database-url",
+        default=None,
+        help="async SQLAlchemy URL (default: temporary SQLite file)",
+    )
+    args = parser.parse_args()
+
+    url = args.database_url
+    if url is None:
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        url = f"sqlite+aiosqlite:///{path}"
+    asyncio.run(main(url, args.subscriptions, args.chunk_size))
@@ -0,0 +1,139 @@
+"""
+Benchmark listing endpoints: ORM + Pydantic path vs. column-only fast path
+Measures median latency and peak allocations (tracemalloc) for listing
+N rows of usage metrics, invoices and subscriptions.
+
+Run: python scripts/bench_listing.py [--rows 10000] [--repeat 5]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from typing import List
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from app.models import base  # noqa: F401 - registers all models
+from app.core.database import Base
+from app.models.tenant import Tenant
+from app.models.plan import Plan, PlanTier
+from app.models.subscription import Subscription, SubscriptionStatus
+from app.models.invoice import Invoice, InvoiceStatus
+from app.models.usage_metric import UsageMetric, MetricType
+from app.schemas.invoice import InvoiceResponse
+from app.schemas.subscription import SubscriptionResponse
+from app.schemas.usage_metric import UsageMetricResponse
+from app.services import fast_listing
+
+
+async def seed(session_factory, rows: int) -> uuid.UUID:
+    tenant_id = uuid.uuid4()
+    plan_id = uuid.uuid4()
+    now = datetime.utcnow()
+    async with session_factory() as db:
+        db.add(Tenant(id=tenant_id, name="Bench", slug="bench", email="bench@example.com", schema_name="tenant_bench"))
+        db.add(Plan(id=plan_id, name="Pro", slug="pro", tier=PlanTier.PRO, price=Decimal("29.00")))
+        await db.flush()
+        for i in range(rows):
+            subscription_id = uuid.uuid4()
+            db.add(Subscription(
+                id=subscription_id, tenant_id=tenant_id, plan_id=plan_id,
+                status=SubscriptionStatus.ACTIVE,
+                current_period_start=now, current_period_end=now + timedelta(days=30),
+            ))
+            db.add(Invoice(
+                id=uuid.uuid4(), tenant_id=tenant_id, subscription_id=subscription_id,
+                invoice_number=f"INV-BENCH-{i:06d}", status=InvoiceStatus.PAID,
+                subtotal=Decimal("29.00"), tax=Decimal("0.00"), total=Decimal("29.00"),
+                amount_paid=Decimal("29.00"), amount_due=Decimal("0.00"),
+                line_items=[{"description": "Pro Plan", "amount": 2900, "quantity": 1}],
+                invoice_date=now - timedelta(days=i % 365),
+            ))
+            db.add(UsageMetric(
+                id=uuid.uuid4(), tenant_id=tenant_id, metric_type=MetricType.API_CALLS,
+                metric_name="api_calls", value=i, unit="calls",
+                period_start=now, period_end=now, metric_metadata={"region": "eu"},
+            ))
+            if i % 1000 == 999:
+                await db.flush()
+        await db.commit()
+    return tenant_id
+
+
+async def orm_path(db: AsyncSession, model, schema, tenant_id) -> bytes:
+    """What FastAPI does today: ORM hydration, from_attributes validation, JSON encoding"""
+    result = await db.execute(select(model).where(model.tenant_id == tenant_id))
+    objects = result.scalars().all()
+    adapter = TypeAdapter(List[schema])
+    validated = adapter.validate_python(objects, from_attributes=True)
+    return json.dumps(adapter.dump_python(validated, mode="json")).encode()
+
+
+async def fast_path(db: AsyncSession, model, row_cls, tenant_id) -> bytes:
+    query = fast_listing.row_select(row_cls, model).where(model.tenant_id == tenant_id)
+    rows = await fast_listing.fetch_rows(db, row_cls, query)
+    return fast_listing.dump_rows(rows)
+
+
+async def measure(session_factory, fn, repeat: int):
+    """Median latency over `repeat` runs, then one traced run for peak allocations"""
+    timings = []
+    for _ in range(repeat):
+        async with session_factory() as db:
+            start = time.perf_counter()
+            await fn(db)
+            timings.append(time.perf_counter() - start)
+
+    async with session_factory() as db:
+        tracemalloc.start()
+        await fn(db)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return statistics.median(timings), peak
+
+
+async def main(rows: int, repeat: int):
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    print(f"Seeding {rows} rows per table...")
+    tenant_id = await seed(session_factory, rows)
+
+    cases = [
+        ("usage_metrics", UsageMetric, UsageMetricResponse, fast_listing.UsageMetricRow),
+        ("invoices", Invoice, InvoiceResponse, fast_listing.InvoiceRow),
+        ("subscriptions", Subscription, SubscriptionResponse, fast_listing.SubscriptionRow),
+    ]
+
+    print(f"\n{'listing':<15}{'path':<6}{'median ms':>12}{'peak MiB':>12}")
+    for name, model, schema, row_cls in cases:
+        for label, fn in (
+            ("orm", lambda db: orm_path(db, model, schema, tenant_id)),
+            ("fast", lambda db: fast_path(db, model, row_cls, tenant_id)),
+        ):
+            seconds, peak = await measure(session_factory, fn, repeat)
+            print(f"{name:<15}{label:<6}{seconds * 1000:>12.1f}{peak / 2**20:>12.2f}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
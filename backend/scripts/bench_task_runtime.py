@@ -0,0 +1,84 @@
+"""
+Benchmark Celery task overhead: asyncio.run() per task vs. the worker runtime
+Runs N short tasks (one SELECT 1 through AsyncSessionLocal) each way and
+reports total time and per-task overhead.
+
+asyncio.run() needs a fresh engine per task (pooled connections are bound to
+the loop that opened them); the worker runtime keeps one loop and one pool.
+
+Run: python scripts/bench_task_runtime.py [--tasks 1000] [--database-url URL]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core import database
+from app.tasks.runtime import WorkerRuntime
+
+
+async def short_task():
+    async with database.AsyncSessionLocal() as db:
+        await db.execute(text("SELECT 1"))
+
+
+def bench_asyncio_run(url: str, tasks: int) -> float:
+    async def one():
+        engine = create_async_engine(url)
+        database.AsyncSessionLocal.configure(bind=engine)
+        try:
+            await short_task()
+        finally:
+            await engine.dispose()
+
+    start = time.perf_counter()
+    for _ in range(tasks):
+        asyncio.run(one())
+    return time.perf_counter() - start
+
+
+def bench_runtime(url: str, tasks: int) -> float:
+    runtime = WorkerRuntime(engine_factory=lambda: create_async_engine(url))
+    runtime.start()
+    try:
+        start = time.perf_counter()
+        for _ in range(tasks):
+            runtime.run(short_task())
+        return time.perf_counter() - start
+    finally:
+        runtime.shutdown()
+
+
+def main(url: str, tasks: int):
+    print(f"{tasks} tasks against {url.split('@')[-1]}\n")
+    print(f"{'mode':<14}{'total s':>10}{'per task ms':>14}")
+    for label, fn in (("asyncio.run", bench_asyncio_run), ("runtime", bench_runtime)):
+        seconds = fn(url, tasks)
+        print(f"{label:<14}{seconds:>10.2f}{seconds / tasks * 1000:>14.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--tasks", type=int, default=1000)
+    parser.add_argument(
+        "--database-url",
+        default=None,
+        help="async SQLAlchemy URL (default: temporary SQLite file)",
+    )
+    args = parser.parse_args()
+
+    url = args.database_url
+    if url is None:
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        url = f"sqlite+aiosqlite:///{path}"
+    main(url, args.tasks)
@@ -0,0 +1,121 @@
+"""
+Benchmark trial expiration: per-tenant N+1 loop vs. set-based UPDATEs
+Seeds N expired-trial tenants (half with an active subscription) and times
+the previous implementation against billing.expire_trials().
+
+Run: python scripts/bench_trial_expiration.py [--tenants 100000] [--database-url URL]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import select, insert, update
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.models import base  # noqa: F401 - registers all models
+from app.core.database import Base
+from app.models.tenant import Tenant
+from app.models.plan import Plan, PlanTier
+from app.models.subscription import Subscription, SubscriptionStatus
+from app.tasks.billing import expire_trials
+
+
+async def seed(session_factory, tenants: int):
+    now = datetime.utcnow()
+    plan_id = uuid.uuid4()
+    async with session_factory() as db:
+        await db.execute(insert(Plan).values(id=plan_id, name="Pro", slug="pro", tier=PlanTier.PRO, price=Decimal("29.00")))
+        for offset in range(0, tenants, 5000):
+            batch = range(offset, min(offset + 5000, tenants))
+            tenant_rows = [
+                {
+                    "id": uuid.uuid4(), "name": f"t{i}", "slug": f"t{i}", "email": f"t{i}@example.com",
+                    "schema_name": f"tenant_t{i}", "is_trial": True, "is_active": True,
+                    "trial_ends_at": now - timedelta(hours=1), "max_users": 5,
+                }
+                for i in batch
+            ]
+            await db.execute(insert(Tenant), tenant_rows)
+            await db.execute(insert(Subscription), [
+                {
+                    "id": uuid.uuid4(), "tenant_id": row["id"], "plan_id": plan_id,
+                    "status": SubscriptionStatus.ACTIVE if i % 2 else SubscriptionStatus.TRIALING,
+                    "current_period_start": now, "current_period_end": now + timedelta(days=30),
+                    "cancel_at_period_end": False,
+                }
+                for i, row in zip(batch, tenant_rows)
+            ])
+        await db.commit()
+
+
+async def reset(session_factory):
+    async with session_factory() as db:
+        await db.execute(update(Tenant).values(is_trial=True, is_active=True))
+        await db.commit()
+
+
+async def legacy(db, now):
+    """The previous implementation: one SELECT per expired tenant"""
+    result = await db.execute(select(Tenant).where(Tenant.is_trial, Tenant.trial_ends_at <= now))
+    for tenant in result.scalars().all():
+        result = await db.execute(
+            select(Subscription).where(
+                Subscription.tenant_id == tenant.id,
+                Subscription.status == SubscriptionStatus.ACTIVE,
+            )
+        )
+        if result.scalar_one_or_none():
+            tenant.is_trial = False
+        else:
+            tenant.is_active = False
+
+
+async def main(url: str, tenants: int):
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    print(f"Seeding {tenants} expired-trial tenants...")
+    await seed(session_factory, tenants)
+
+    print(f"\n{'implementation':<16}{'seconds':>10}{'tenants/s':>14}")
+    for label, fn in (("n+1 loop", legacy), ("set-based", expire_trials)):
+        await reset(session_factory)
+        async with session_factory() as db:
+            start = time.perf_counter()
+            await fn(db, datetime.utcnow())
+            await db.commit()
+            seconds = time.perf_counter() - start
+        print(f"{label:<16}{seconds:>10.2f}{tenants / seconds:>14.0f}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--tenants", type=int, default=100_000)
+    parser.add_argument(
+        "--database-url",
+        default=None,
+        help="async SQLAlchemy URL (default: temporary SQLite file)",
+    )
+    args = parser.parse_args()
+
+    url = args.database_url
+    if url is None:
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        url = f"sqlite+aiosqlite:///{path}"
+    asyncio.run(main(url, args.tenants))
@@ -0,0 +1,144 @@
+"""
+Benchmark webhook event processing: one transaction per event vs. batches
+Replays a month-start burst (every subscription gets several
+customer.subscription.updated events and an invoice.paid, interleaved)
+into webhook_events, then applies it each way and reports events/second:
+
+  per-event  each event claimed, loaded, applied and committed on its own
+             (the consumer before batching; now its fallback path)
+  batched    process_events: claimed batches applied in one transaction,
+             newest event per row only, targets loaded with one IN query
+
+Run: python scripts/bench_webhook_events.py [--subscriptions 500] [--updates 4] [--batch 100] [--database-url URL]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.core.database import Base
+from app.models.invoice import Invoice, InvoiceStatus
+from app.models.plan import Plan, PlanTier
+from app.models.subscription import Subscription, SubscriptionStatus
+from app.models.tenant import Tenant
+from app.services.stripe_webhooks import claim_events, event_header, process_event, process_events, record_event
+
+NOW = datetime(2026, 11, 1, 0, 5)
+CREATED = 1_793_491_200  # 2026-11-01 00:00 UTC
+
+
+def burst(subscriptions: int, updates: int):
+    """Events in arrival order: rounds across all subscriptions, like a billing run fanning out"""
+    events = []
+    for n in range(updates + 1):
+        for i in range(subscriptions):
+            if n < updates:
+                obj = {
+                    "id": f"sub_bench_{i}", "object": "subscription", "status": "active",
+                    "current_period_start": CREATED, "current_period_end": CREATED + 30 * 86400,
+                    "cancel_at_period_end": False,
+                    "items": {"data": [{"id": f"si_bench_{i}", "price": {"id": "price_bench"}}]},
+                }
+                event_type = "customer.subscription.updated"
+            else:
+                obj = {"id": f"in_bench_{i}", "object": "invoice", "subscription": f"sub_bench_{i}", "status": "paid"}
+                event_type = "invoice.paid"
+            events.append({
+                "id": f"evt_{uuid.uuid4().hex}", "object": "event", "type": event_type,
+                "created": CREATED + n, "data": {"object": obj},
+            })
+    return events
+
+
+async def prepare(url: str, subscriptions: int, events):
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    async with session_factory() as db:
+        tenant = Tenant(id=uuid.uuid4(), name="Bench Co", slug="bench", email="bench@example.com", schema_name="tenant_bench")
+        plan = Plan(id=uuid.uuid4(), name="Pro", slug="pro", tier=PlanTier.PRO, price=Decimal("29.00"))
+        db.add_all([tenant, plan])
+        for i in range(subscriptions):
+            subscription = Subscription(
+                id=uuid.uuid4(), tenant_id=tenant.id, plan_id=plan.id, status=SubscriptionStatus.ACTIVE,
+                stripe_subscription_id=f"sub_bench_{i}",
+                current_period_start=datetime(2026, 10, 1), current_period_end=datetime(2026, 11, 1),
+            )
+            db.add_all([subscription, Invoice(
+                id=uuid.uuid4(), tenant_id=tenant.id, subscription_id=subscription.id,
+                invoice_number=f"INV-BENCH-{i}", stripe_invoice_id=f"in_bench_{i}", status=InvoiceStatus.OPEN,
+                subtotal=Decimal("29.00"), total=Decimal("29.00"), amount_due=Decimal("29.00"),
+                invoice_date=datetime(2026, 11, 1),
+            )])
+        for event in events:
+            payload = json.dumps(event).encode()
+            await record_event(db, event_header(payload), payload, NOW)
+        await db.commit()
+    return engine, session_factory
+
+
+async def per_event(session_factory, batch: int) -> None:
+    while True:
+        async with session_factory() as db:
+            rows = await claim_events(db, NOW, batch)
+            await db.commit()
+        if not rows:
+            return
+        for row in rows:
+            await process_event(session_factory, row, NOW)
+
+
+async def batched(session_factory, batch: int) -> None:
+    while (await process_events(session_factory, NOW, batch))["claimed"]:
+        pass
+
+
+async def main(url: str, subscriptions: int, updates: int, batch: int):
+    events = burst(subscriptions, updates)
+    print(f"{len(events)} events for {subscriptions} subscriptions, batches of {batch}, {url.split('@')[-1]}\n")
+    print(f"{'mode':<11}{'seconds':>10}{'events/s':>12}")
+    rates = {}
+    for label, run in (("per-event", per_event), ("batched", batched)):
+        engine, session_factory = await prepare(url, subscriptions, events)
+        start = time.perf_counter()
+        await run(session_factory, batch)
+        seconds = time.perf_counter() - start
+        await engine.dispose()
+        rates[label] = len(events) / seconds
+        print(f"{label:<11}{seconds:>10.2f}{rates[label]:>12.0f}")
+    print(f"\nspeedup {rates['batched'] / rates['per-event']:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--subscriptions", type=int, default=500)
+    parser.add_argument("--updates", type=int, default=4, help="subscription.updated events per subscription")
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument(
+        "--database-url",
+        default=None,
+        help="async SQLAlchemy URL (default: temporary SQLite file)",
+    )
+    args = parser.parse_args()
+
+    url = args.database_url
+    if url is None:
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        url = f"sqlite+aiosqlite:///{path}"
+    asyncio.run(main(url, args.subscriptions, args.updates, args.batch))
@@ -0,0 +1,98 @@
+"""
+Benchmark per-event CPU of webhook verification and parsing
+Signs a realistic customer.subscription.updated delivery once, then times
+each stage over many iterations with process_time (CPU, not wall clock):
+
+  sdk       stripe.Webhook.construct_event: HMAC plus a full parse into a
+            StripeObject tree (the endpoint before); json.loads in the consumer
+  fast      verify_signature over the raw bytes plus event_header (one
+            orjson parse, routing fields only); orjson.loads in the consumer
+
+Run: python scripts/bench_webhook_verify.py [--iterations 20000] [--items 3]
+"""
+import argparse
+import json
+import sys
+import time
+import uuid
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import orjson
+import stripe
+
+from app.services.stripe_webhooks import event_header, verify_signature
+from scripts.fake_stripe import FakeStripe
+
+SECRET = "whsec_bench"
+CREATED = 1_793_491_200
+
+
+def delivery(items: int):
+    """Body and Stripe-Signature of a subscription event about the size Stripe sends"""
+    price = {
+        "id": "price_bench", "object": "price", "active": True, "currency": "usd", "unit_amount": 2900,
+        "recurring": {"interval": "month", "interval_count": 1, "usage_type": "licensed"},
+        "product": "prod_bench", "metadata": {}, "livemode": False, "created": CREATED,
+    }
+    obj = {
+        "id": "sub_bench", "object": "subscription", "customer": "cus_bench", "status": "active",
+        "current_period_start": CREATED, "current_period_end": CREATED + 30 * 86400,
+        "cancel_at_period_end": False, "canceled_at": None, "collection_method": "charge_automatically",
+        "default_payment_method": "pm_bench", "latest_invoice": "in_bench", "livemode": False,
+        "metadata": {"tenant_id": str(uuid.uuid4())},
+        "items": {"object": "list", "has_more": False, "data": [
+            {"id": f"si_bench_{i}", "object": "subscription_item", "quantity": 1, "price": price, "metadata": {}}
+            for i in range(items)
+        ]},
+    }
+    event = {
+        "id": f"evt_{uuid.uuid4().hex}", "object": "event", "api_version": "2023-10-16", "type": "customer.subscription.updated",
+        "created": CREATED, "livemode": False, "pending_webhooks": 1, "request": {"id": None, "idempotency_key": None},
+        "data": {"object": obj, "previous_attributes": {"cancel_at_period_end": True}},
+    }
+    payload = json.dumps(event).encode()
+    return payload, FakeStripe(webhook_secret=SECRET).sign(payload, CREATED)
+
+
+def cpu_us(fn, iterations: int) -> float:
+    start = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return (time.process_time() - start) / iterations * 1e6
+
+
+def main(iterations: int, items: int):
+    payload, header = delivery(items)
+    text = payload.decode()
+    now = CREATED + 1
+    stages = {
+        "sdk": (
+            lambda: stripe.Webhook.construct_event(payload, header, SECRET, tolerance=None),
+            lambda: json.loads(text)["data"]["object"],
+        ),
+        "fast": (
+            lambda: (verify_signature(payload, header, SECRET, now=now), event_header(payload)),
+            lambda: orjson.loads(text)["data"]["object"],
+        ),
+    }
+
+    print(f"{len(payload)} byte event, {iterations} iterations, CPU microseconds per event\n")
+    print(f"{'path':<6}{'ingest':>10}{'consume':>10}{'total':>10}")
+    totals = {}
+    for label, (ingest, consume) in stages.items():
+        ingest(), consume()  # warm up
+        ingest_us, consume_us = cpu_us(ingest, iterations), cpu_us(consume, iterations)
+        totals[label] = ingest_us + consume_us
+        print(f"{label:<6}{ingest_us:>10.1f}{consume_us:>10.1f}{totals[label]:>10.1f}")
+    print(f"\nspeedup {totals['sdk'] / totals['fast']:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--items", type=int, default=3, help="subscription items in the event")
+    args = parser.parse_args()
+    main(args.iterations, args.items)
@@ -0,0 +1,698 @@
+"""
+Local fake Stripe API for offline tests and benchmarks
+An HTTP server speaking enough of Stripe's v1 API for StripeService:
+customers, products, prices, subscriptions (create, retrieve, modify,
+cancel, list), invoices (retrieve, list, pay), payment intents and
+checkout sessions. Requests are form-encoded the way the SDK sends them;
+responses are Stripe-shaped JSON, `expand` included. Idempotency-Key
+replays the first response like Stripe does, and a reused key with other
+parameters is rejected with an idempotency_error.
+
+Every state change emits a Stripe event, signed with the webhook secret
+and POSTed to --webhook-url if one is given; all events are also kept on
+`FakeStripe.events` for in-process use (`signed(event)` gives the body and
+Stripe-Signature header).
+
+Faults, applied before the request is handled:
+  --latency     fixed:MS | uniform:LO:HI | normal:MEAN:SD | lognormal:MEDIAN:SIGMA (ms)
+  --error-rate  share of requests answered 500
+  --rate-limit  share of requests answered 429
+  --decline-rate share of charges declined (pm_card_chargeDeclined always is)
+
+Point the app at it with STRIPE_API_BASE=http://127.0.0.1:<port> and any
+STRIPE_SECRET_KEY.
+
+Run: python scripts/fake_stripe.py [--port 12111] [--latency lognormal:120:0.5] [--error-rate 0.01] [--rate-limit 0.02]
+                                    [--webhook-url http://localhost:8000/api/v1/webhooks/stripe] [--webhook-secret whsec_...]
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlparse
+import argparse
+import copy
+import hashlib
+import hmac
+import json
+import logging
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+logger = logging.getLogger("fake_stripe")
+
+API_VERSION = "2023-10-16"
+DECLINE_TOKEN = "pm_card_chargeDeclined"
+INTERVAL_SECONDS = {"day": 86400, "week": 7 * 86400, "month": 30 * 86400, "year": 365 * 86400}
+
+# Fields holding an id that `expand` can replace with the object
+EXPANDABLE = {
+    "customer": "customers",
+    "latest_invoice": "invoices",
+    "payment_intent": "payment_intents",
+    "subscription": "subscriptions",
+    "product": "products",
+}
+
+
+class StripeFault(Exception):
+    """An error response in Stripe's format"""
+
+    def __init__(self, status: int, type_: str, message: str, code: Optional[str] = None, param: Optional[str] = None):
+        super().__init__(message)
+        self.status = status
+        self.body = {"error": {"type": type_, "message": message, "code": code, "param": param}}
+
+
+def latency_sampler(spec: str, rng: random.Random) -> Callable[[], float]:
+    """Seconds-returning sampler for a latency spec in milliseconds"""
+    kind, *args = spec.split(":") if ":" in spec else ("fixed", spec)
+    values = [float(a) for a in args]
+    if kind == "fixed":
+        return lambda: values[0] / 1000
+    if kind == "uniform":
+        return lambda: rng.uniform(values[0], values[1]) / 1000
+    if kind == "normal":
+        return lambda: max(0.0, rng.gauss(values[0], values[1])) / 1000
+    if kind == "lognormal":
+        # Median and shape: a long right tail, like real API latency
+        return lambda: values[0] * rng.lognormvariate(0, values[1]) / 1000
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def decode_form(pairs: List[Tuple[str, str]]) -> Dict[str, Any]:
+    """Nest the SDK's `a[b][0][c]=v` keys back into dicts and lists"""
+    root: Dict[str, Any] = {}
+    for key, value in pairs:
+        parts = [key.split("[", 1)[0], *re.findall(r"\[([^\]]*)\]", key)]
+        node = root
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = value
+
+    def listify(node: Any) -> Any:
+        if not isinstance(node, dict):
+            return node
+        if node and all(k.isdigit() for k in node):
+            return [listify(node[k]) for k in sorted(node, key=int)]
+        return {k: listify(v) for k, v in node.items()}
+
+    return listify(root)
+
+
+def _flag(value: Any) -> bool:
+    return str(value).lower() == "true"
+
+
+class FakeStripe:
+    """In-memory Stripe with an HTTP front end; use as a context manager or start()/stop()"""
+
+    def __init__(
+        self,
+        latency: str = "fixed:0",
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        decline_rate: float = 0.0,
+        webhook_url: Optional[str] = None,
+        webhook_secret: str = "whsec_fake",
+        seed: int = 0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.rng = random.Random(seed)
+        self.latency = latency_sampler(latency, self.rng)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.decline_rate = decline_rate
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.clock = clock
+        self.host, self.port = host, port
+
+        self.objects: Dict[str, Dict[str, Dict[str, Any]]] = {
+            name: {} for name in ("customers", "products", "prices", "subscriptions", "invoices",
+                                  "payment_intents", "checkout_sessions")
+        }
+        self.events: List[Dict[str, Any]] = []
+        self.requests: List[Tuple[str, str, int]] = []  # (method, path, status)
+        self.webhook_failures = 0
+        self._idempotent: Dict[str, Tuple[Dict[str, Any], int, Dict[str, Any]]] = {}
+        self._counter = 0
+        # Ids stay unique across fake instances, as event ids are deduplicated
+        self._instance = uuid.uuid4().hex[:8]
+        self._lock = threading.RLock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._deliveries: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+
+        self.routes = [
+            ("POST", r"/v1/customers", self._create_customer),
+            ("GET", r"/v1/customers/(?P<id>[^/]+)", self._retrieve("customers")),
+            ("POST", r"/v1/customers/(?P<id>[^/]+)", self._modify_customer),
+            ("POST", r"/v1/products", self._create_product),
+            ("GET", r"/v1/products/(?P<id>[^/]+)", self._retrieve("products")),
+            ("POST", r"/v1/prices", self._create_price),
+            ("GET", r"/v1/prices/(?P<id>[^/]+)", self._retrieve("prices")),
+            ("POST", r"/v1/subscriptions", self._create_subscription),
+            ("GET", r"/v1/subscriptions", self._list("subscriptions")),
+            ("GET", r"/v1/subscriptions/(?P<id>[^/]+)", self._retrieve("subscriptions")),
+            ("POST", r"/v1/subscriptions/(?P<id>[^/]+)", self._modify_subscription),
+            ("DELETE", r"/v1/subscriptions/(?P<id>[^/]+)", self._cancel_subscription),
+            ("GET", r"/v1/invoices", self._list("invoices")),
+            ("GET", r"/v1/invoices/(?P<id>[^/]+)", self._retrieve("invoices")),
+            ("POST", r"/v1/invoices/(?P<id>[^/]+)/pay", self._pay_invoice),
+            ("POST", r"/v1/payment_intents", self._create_payment_intent),
+            ("GET", r"/v1/payment_intents/(?P<id>[^/]+)", self._retrieve("payment_intents")),
+            ("POST", r"/v1/checkout/sessions", self._create_checkout_session),
+        ]
+
+    # Lifecycle
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> "FakeStripe":
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, like api.stripe.com
+
+            def _serve(self):
+                url = urlparse(self.path)
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0) or 0)).decode()
+                params = decode_form(parse_qsl(url.query) + parse_qsl(body))
+                status, payload, headers = fake.dispatch(
+                    self.command, url.path, params, self.headers.get("Idempotency-Key"),
+                )
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("Request-Id", f"req_fake{time.monotonic_ns()}")
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_DELETE = _serve
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_port
+        threading.Thread(target=self._server.serve_forever, name="fake-stripe", daemon=True).start()
+        if self.webhook_url:
+            threading.Thread(target=self._deliver_webhooks, name="fake-stripe-webhooks", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self._deliveries.put(None)
+
+    def __enter__(self) -> "FakeStripe":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # Request handling
+
+    def dispatch(
+        self, method: str, path: str, params: Dict[str, Any], idempotency_key: Optional[str] = None,
+    ) -> Tuple[int, Dict[str, Any], Dict[str, str]]:
+        """Apply faults, then route. Returns (status, body, extra headers)."""
+        with self._lock:
+            delay = self.latency()
+            roll = self.rng.random()
+        if delay:
+            time.sleep(delay)
+
+        status, body, headers = self._handle(method, path, params, idempotency_key, roll)
+        with self._lock:
+            self.requests.append((method, path, status))
+        return status, body, headers
+
+    def _handle(self, method, path, params, idempotency_key, roll):
+        if roll < self.rate_limit_rate:
+            return 429, StripeFault(429, "invalid_request_error", "Too many requests", "rate_limit").body, {}
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500, StripeFault(500, "api_error", "Injected server error").body, {}
+
+        with self._lock:
+            if method == "POST" and idempotency_key in self._idempotent:
+                first_params, status, body = self._idempotent[idempotency_key]
+                if params != first_params:
+                    fault = StripeFault(
+                        400, "idempotency_error",
+                        "Keys for idempotent requests can only be used with the same parameters they were "
+                        f"first used with. Try using a key other than '{idempotency_key}' if you meant to "
+                        "execute a different request.",
+                    )
+                    return fault.status, fault.body, {}
+                return status, body, {"Idempotent-Replayed": "true"}
+            first_params = copy.deepcopy(params)
+
+            for route_method, pattern, handler in self.routes:
+                match = re.fullmatch(pattern, path)
+                if route_method == method and match:
+                    break
+            else:
+                fault = StripeFault(404, "invalid_request_error", f"Unrecognized request URL ({method}: {path})")
+                return fault.status, fault.body, {}
+
+            expand = params.pop("expand", []) or []
+            try:
+                status, body = 200, self._expand(handler(params, **match.groupdict()), expand)
+            except StripeFault as fault:
+                status, body = fault.status, fault.body
+            if method == "POST" and idempotency_key:
+                self._idempotent[idempotency_key] = (first_params, status, body)
+            return status, body, {}
+
+    # Helpers
+
+    def _id(self, prefix: str) -> str:
+        self._counter += 1
+        return f"{prefix}_{self._instance}{self._counter:010d}"
+
+    def _now(self) -> int:
+        return int(self.clock())
+
+    def _get(self, resource: str, object_id: str, param: str = "id") -> Dict[str, Any]:
+        obj = self.objects[resource].get(object_id)
+        if obj is None:
+            raise StripeFault(404, "invalid_request_error", f"No such {resource[:-1]}: '{object_id}'",
+                              "resource_missing", param)
+        return obj
+
+    def _expand(self, obj: Dict[str, Any], paths: List[str]) -> Dict[str, Any]:
+        obj = copy.deepcopy(obj)
+        for path in paths:
+            self._expand_path(obj, path.split("."))
+        return obj
+
+    def _expand_path(self, node: Any, parts: List[str]) -> None:
+        if not parts or not isinstance(node, dict):
+            return
+        head, rest = parts[0], parts[1:]
+        if head == "data" and isinstance(node.get("data"), list):
+            for item in node["data"]:
+                self._expand_path(item, rest)
+            return
+        value = node.get(head)
+        if isinstance(value, str) and head in EXPANDABLE:
+            value = node[head] = copy.deepcopy(self.objects[EXPANDABLE[head]].get(value, value))
+        self._expand_path(value, rest)
+
+    def _emit(self, event_type: str, obj: Dict[str, Any], previous: Optional[Dict[str, Any]] = None) -> None:
+        event = {
+            "id": self._id("evt"),
+            "object": "event",
+            "api_version": API_VERSION,
+            "created": self._now(),
+            "type": event_type,
+            "livemode": False,
+            "pending_webhooks": 1 if self.webhook_url else 0,
+            "data": {"object": copy.deepcopy(obj)},
+        }
+        if previous:
+            event["data"]["previous_attributes"] = previous
+        self.events.append(event)
+        if self.webhook_url:
+            self._deliveries.put(event)
+
+    def sign(self, payload: bytes, timestamp: Optional[int] = None) -> str:
+        """Stripe-Signature header value for `payload`"""
+        timestamp = int(time.time()) if timestamp is None else timestamp
+        signed_payload = f"{timestamp}.".encode() + payload
+        digest = hmac.new(self.webhook_secret.encode(), signed_payload, hashlib.sha256).hexdigest()
+        return f"t={timestamp},v1={digest}"
+
+    def signed(self, event: Dict[str, Any]) -> Tuple[bytes, Dict[str, str]]:
+        """Body and headers of a webhook delivery of `event`"""
+        payload = json.dumps(event).encode()
+        return payload, {"Content-Type": "application/json", "Stripe-Signature": self.sign(payload)}
+
+    def _deliver_webhooks(self) -> None:
+        while True:
+            event = self._deliveries.get()
+            if event is None:
+                return
+            payload, headers = self.signed(event)
+            try:
+                request = urllib.request.Request(self.webhook_url, data=payload, headers=headers, method="POST")
+                with urllib.request.urlopen(request, timeout=10) as response:
+                    response.read()
+            except Exception as e:
+                self.webhook_failures += 1
+                logger.warning(f"Webhook {event['type']} {event['id']} not delivered: {e}")
+
+    def _declines(self, payment_method: Optional[str]) -> bool:
+        return payment_method == DECLINE_TOKEN or self.rng.random() < self.decline_rate
+
+    # Resources
+
+    def _retrieve(self, resource: str):
+        def retrieve(params, id):
+            return self._get(resource, id)
+        return retrieve
+
+    def _list(self, resource: str):
+        def list_(params, **_):
+            items = list(reversed(self.objects[resource].values()))  # Newest first
+            if resource == "subscriptions" and params.get("status", "all") != "all":
+                items = [i for i in items if i["status"] == params["status"]]
+            for field in ("customer", "subscription"):
+                if field in params:
+                    items = [i for i in items if i.get(field) == params[field]]
+            created = params.get("created")
+            if isinstance(created, dict) and "gte" in created:
+                items = [i for i in items if i["created"] >= int(created["gte"])]
+            if "starting_after" in params:
+                ids = [i["id"] for i in items]
+                items = items[ids.index(params["starting_after"]) + 1:] if params["starting_after"] in ids else []
+            limit = int(params.get("limit", 10))
+            return {
+                "object": "list",
+                "url": f"/v1/{resource}",
+                "data": items[:limit],
+                "has_more": len(items) > limit,
+            }
+        return list_
+
+    def _create_customer(self, params):
+        customer = {
+            "id": self._id("cus"),
+            "object": "customer",
+            "created": self._now(),
+            "email": params.get("email"),
+            "name": params.get("name"),
+            "address": params.get("address"),
+            "metadata": params.get("metadata", {}),
+            "invoice_settings": {"default_payment_method": params.get("payment_method")},
+            "livemode": False,
+        }
+        self.objects["customers"][customer["id"]] = customer
+        self._emit("customer.created", customer)
+        return customer
+
+    def _modify_customer(self, params, id):
+        customer = self._get("customers", id)
+        for field in ("email", "name", "address"):
+            if field in params:
+                customer[field] = params[field]
+        customer["metadata"].update(params.get("metadata", {}))
+        if "invoice_settings" in params:
+            customer["invoice_settings"].update(params["invoice_settings"])
+        self._emit("customer.updated", customer)
+        return customer
+
+    def _create_product(self, params):
+        product = {
+            "id": self._id("prod"),
+            "object": "product",
+            "created": self._now(),
+            "name": params.get("name"),
+            "description": params.get("description"),
+            "metadata": params.get("metadata", {}),
+            "active": True,
+        }
+        self.objects["products"][product["id"]] = product
+        return product
+
+    def _create_price(self, params):
+        self._get("products", params.get("product"), "product")
+        recurring = params.get("recurring")
+        price = {
+            "id": self._id("price"),
+            "object": "price",
+            "created": self._now(),
+            "product": params["product"],
+            "unit_amount": int(params.get("unit_amount", 0)),
+            "currency": params.get("currency", "usd"),
+            "recurring": {"interval": recurring.get("interval", "month"), "interval_count": 1} if recurring else None,
+            "type": "recurring" if recurring else "one_time",
+            "metadata": params.get("metadata", {}),
+            "active": True,
+        }
+        self.objects["prices"][price["id"]] = price
+        return price
+
+    def _charge(self, invoice: Dict[str, Any], payment_method: Optional[str]) -> bool:
+        """Collect an open invoice through a payment intent; emits the outcome events"""
+        now = self._now()
+        intent = self.objects["payment_intents"].get(invoice.get("payment_intent"))
+        if intent is None:
+            intent = self._new_payment_intent(invoice["amount_due"], invoice["currency"], invoice["customer"])
+            invoice["payment_intent"] = intent["id"]
+            intent["invoice"] = invoice["id"]
+
+        if self._declines(payment_method):
+            intent["status"] = "requires_payment_method"
+            intent["last_payment_error"] = {"type": "card_error", "code": "card_declined",
+                                            "message": "Your card was declined."}
+            invoice["attempt_count"] += 1
+            invoice["attempted"] = True
+            self._emit("payment_intent.payment_failed", intent)
+            self._emit("invoice.payment_failed", invoice)
+            return False
+
+        intent["status"] = "succeeded"
+        intent["amount_received"] = intent["amount"]
+        invoice.update(
+            status="paid", paid=True, attempted=True, amount_paid=invoice["amount_due"], amount_remaining=0,
+            attempt_count=invoice["attempt_count"] + 1,
+        )
+        invoice["status_transitions"]["paid_at"] = now
+        self._emit("payment_intent.succeeded", intent)
+        self._emit("invoice.paid", invoice)
+        self._emit("invoice.payment_succeeded", invoice)
+        return True
+
+    def _new_invoice(self, subscription: Dict[str, Any], amount: int, currency: str) -> Dict[str, Any]:
+        now = self._now()
+        invoice = {
+            "id": self._id("in"),
+            "object": "invoice",
+            "created": now,
+            "customer": subscription["customer"],
+            "subscription": subscription["id"],
+            "status": "open",
+            "currency": currency,
+            "subtotal": amount,
+            "total": amount,
+            "amount_due": amount,
+            "amount_paid": 0,
+            "amount_remaining": amount,
+            "paid": False,
+            "attempted": False,
+            "attempt_count": 0,
+            "payment_intent": None,
+            "period_start": subscription["current_period_start"],
+            "period_end": subscription["current_period_end"],
+            "status_transitions": {"finalized_at": now, "paid_at": None},
+            "lines": {"object": "list", "data": [{"amount": amount, "description": "Subscription"}], "has_more": False},
+            "metadata": {},
+        }
+        self.objects["invoices"][invoice["id"]] = invoice
+        self._emit("invoice.created", invoice)
+        return invoice
+
+    def _new_payment_intent(self, amount: int, currency: str, customer: Optional[str]) -> Dict[str, Any]:
+        intent = {
+            "id": self._id("pi"),
+            "object": "payment_intent",
+            "created": self._now(),
+            "amount": amount,
+            "amount_received": 0,
+            "currency": currency,
+            "customer": customer,
+            "status": "requires_payment_method",
+            "client_secret": f"secret_{self._counter}",
+            "metadata": {},
+        }
+        self.objects["payment_intents"][intent["id"]] = intent
+        return intent
+
+    def _subscription_item(self, price: Dict[str, Any]) -> Dict[str, Any]:
+        return {"id": self._id("si"), "object": "subscription_item", "price": copy.deepcopy(price), "quantity": 1}
+
+    def _create_subscription(self, params):
+        customer = self._get("customers", params.get("customer"), "customer")
+        items = params.get("items") or []
+        if not items:
+            raise StripeFault(400, "invalid_request_error", "Missing required param: items.", "parameter_missing", "items")
+        price = self._get("prices", items[0].get("price"), "items[0][price]")
+
+        now = self._now()
+        trial_days = int(params.get("trial_period_days") or 0)
+        period = INTERVAL_SECONDS[(price["recurring"] or {}).get("interval", "month")]
+        payment_method = params.get("default_payment_method") or customer["invoice_settings"]["default_payment_method"]
+        subscription = {
+            "id": self._id("sub"),
+            "object": "subscription",
+            "created": now,
+            "customer": customer["id"],
+            "status": "trialing" if trial_days else "incomplete",
+            "items": {"object": "list", "data": [self._subscription_item(price)], "has_more": False},
+            "current_period_start": now,
+            "current_period_end": now + (trial_days * 86400 if trial_days else period),
+            "trial_start": now if trial_days else None,
+            "trial_end": now + trial_days * 86400 if trial_days else None,
+            "cancel_at_period_end": False,
+            "canceled_at": None,
+            "ended_at": None,
+            "default_payment_method": params.get("default_payment_method"),
+            "latest_invoice": None,
+            "metadata": params.get("metadata", {}),
+        }
+        self.objects["subscriptions"][subscription["id"]] = subscription
+        self._emit("customer.subscription.created", subscription)
+
+        invoice = self._new_invoice(subscription, 0 if trial_days else price["unit_amount"], price["currency"])
+        subscription["latest_invoice"] = invoice["id"]
+        if trial_days or invoice["amount_due"] == 0:
+            invoice.update(status="paid", paid=True)
+            invoice["status_transitions"]["paid_at"] = now
+            self._emit("invoice.paid", invoice)
+        elif payment_method or params.get("payment_behavior") != "default_incomplete":
+            # Without default_incomplete the customer is assumed to have a card on file
+            if self._charge(invoice, payment_method):
+                self._set_status(subscription, "active")
+        else:
+            # Waits for the client to confirm the payment intent
+            invoice["payment_intent"] = self._new_payment_intent(
+                invoice["amount_due"], invoice["currency"], customer["id"],
+            )["id"]
+        return subscription
+
+    def _set_status(self, subscription: Dict[str, Any], status: str) -> None:
+        previous = {"status": subscription["status"]}
+        subscription["status"] = status
+        self._emit("customer.subscription.updated", subscription, previous)
+
+    def _modify_subscription(self, params, id):
+        subscription = self._get("subscriptions", id)
+        previous = {}
+        for change in params.get("items") or []:
+            item = next((i for i in subscription["items"]["data"] if i["id"] == change.get("id")), None)
+            if item is None:
+                raise StripeFault(400, "invalid_request_error", f"No such subscription item: '{change.get('id')}'",
+                                  "resource_missing", "items[0][id]")
+            if "price" in change:
+                previous["items"] = copy.deepcopy(subscription["items"])
+                item["price"] = copy.deepcopy(self._get("prices", change["price"], "items[0][price]"))
+        if "cancel_at_period_end" in params:
+            previous["cancel_at_period_end"] = subscription["cancel_at_period_end"]
+            subscription["cancel_at_period_end"] = _flag(params["cancel_at_period_end"])
+            subscription["canceled_at"] = self._now() if subscription["cancel_at_period_end"] else None
+        if "default_payment_method" in params:
+            subscription["default_payment_method"] = params["default_payment_method"]
+        subscription["metadata"].update(params.get("metadata", {}))
+        self._emit("customer.subscription.updated", subscription, previous)
+        return subscription
+
+    def _cancel_subscription(self, params, id):
+        subscription = self._get("subscriptions", id)
+        if subscription["status"] == "canceled":
+            raise StripeFault(400, "invalid_request_error", f"No such subscription: '{id}'", "resource_missing", "id")
+        now = self._now()
+        subscription.update(status="canceled", canceled_at=now, ended_at=now)
+        self._emit("customer.subscription.deleted", subscription)
+        return subscription
+
+    def _pay_invoice(self, params, id):
+        invoice = self._get("invoices", id)
+        if invoice["status"] == "paid":
+            raise StripeFault(400, "invalid_request_error", "Invoice is already paid", "invoice_already_paid")
+        subscription = self.objects["subscriptions"].get(invoice["subscription"], {})
+        customer = self.objects["customers"].get(invoice["customer"], {})
+        payment_method = (
+            params.get("payment_method")
+            or subscription.get("default_payment_method")
+            or (customer.get("invoice_settings") or {}).get("default_payment_method")
+        )
+        # No payment method on file fails like a decline
+        if not self._charge(invoice, payment_method or DECLINE_TOKEN):
+            raise StripeFault(402, "card_error", "Your card was declined.", "card_declined")
+        if subscription and subscription["status"] in ("incomplete", "past_due", "unpaid"):
+            self._set_status(subscription, "active")
+        return invoice
+
+    def _create_payment_intent(self, params):
+        intent = self._new_payment_intent(int(params.get("amount", 0)), params.get("currency", "usd"),
+                                          params.get("customer"))
+        intent["metadata"] = params.get("metadata", {})
+        intent["payment_method"] = params.get("payment_method")
+        if _flag(params.get("confirm")):
+            if self._declines(params.get("payment_method")):
+                self._emit("payment_intent.payment_failed", intent)
+                raise StripeFault(402, "card_error", "Your card was declined.", "card_declined")
+            intent.update(status="succeeded", amount_received=intent["amount"])
+            self._emit("payment_intent.succeeded", intent)
+        return intent
+
+    def _create_checkout_session(self, params):
+        session = {
+            "id": self._id("cs"),
+            "object": "checkout.session",
+            "created": self._now(),
+            "customer": params.get("customer"),
+            "mode": params.get("mode"),
+            "success_url": params.get("success_url"),
+            "cancel_url": params.get("cancel_url"),
+            "url": f"{self.url}/checkout/{self._counter}",
+            "metadata": params.get("metadata", {}),
+            "status": "open",
+        }
+        self.objects["checkout_sessions"][session["id"]] = session
+        return session
+
+
+if __name__ == "__main__":
+    from app.core.config import settings
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12111)
+    parser.add_argument("--latency", default="fixed:0")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0)
+    parser.add_argument("--decline-rate", type=float, default=0.0)
+    parser.add_argument("--webhook-url")
+    parser.add_argument("--webhook-secret", default=settings.STRIPE_WEBHOOK_SECRET or "whsec_fake")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    fake = FakeStripe(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit,
+        decline_rate=args.decline_rate,
+        webhook_url=args.webhook_url,
+        webhook_secret=args.webhook_secret,
+        seed=args.seed,
+        host=args.host,
+        port=args.port,
+    ).start()
+    print(f"Fake Stripe on {fake.url} (STRIPE_API_BASE={fake.url}); Ctrl-C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
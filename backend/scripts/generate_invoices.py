@@ -0,0 +1,77 @@
+"""
+Trigger monthly invoice generation, or rehearse it with --dry-run
+Without --dry-run the generate_monthly_invoices task is queued for the
+workers. With --dry-run the full partition + chunk pipeline runs here,
+every chunk is rolled back, and a report is printed: counts, totals per
+plan, per-stage timings, query count and peak memory. Point
+--database-url at a restored snapshot to rehearse without touching
+production rows at all.
+
+Run: docker-compose exec backend python scripts/generate_invoices.py --dry-run [--run-at 2026-11-01T00:00] [--chunk-size 1000] [--json]
+"""
+import argparse
+import asyncio
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.models import base  # noqa: F401 - registers all models
+from app.core import database
+from app.tasks.billing import dry_run_invoices, generate_monthly_invoices
+
+
+def print_report(report: dict):
+    print(f"Dry run at {report['run_at']} ({report['chunks']} chunks of {report['chunk_size']})")
+    print(f"  due subscriptions   {report['subscriptions']:>10}")
+    print(f"  would generate      {report['generated']:>10}")
+    print(f"  already invoiced    {report['existing']:>10}")
+    print(f"  would end           {report['ended']:>10}")
+    print(f"  amount              {report['amount']:>10}")
+
+    print(f"\n{'plan':<24}{'invoices':>10}{'amount':>14}")
+    for slug, totals in report["by_plan"].items():
+        print(f"{slug:<24}{totals['invoices']:>10}{totals['amount']:>14}")
+
+    print(f"\n{'stage':<24}{'seconds':>10}")
+    for stage, seconds in report["stages"].items():
+        print(f"{stage:<24}{seconds:>10.3f}")
+
+    print(f"\n{report['queries']} queries, peak memory {report['peak_memory_mb']} MB, "
+          f"{report['seconds']}s total ({report['subscriptions_per_second']} subs/s)")
+
+
+async def dry_run(url: str, run_at: datetime, chunk_size: int) -> dict:
+    if url:
+        engine = create_async_engine(url)
+        database.AsyncSessionLocal.configure(bind=engine)
+    try:
+        return await dry_run_invoices(run_at, chunk_size)
+    finally:
+        await database.AsyncSessionLocal.kw["bind"].dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--dry-run", action="store_true", help="simulate and report; writes nothing")
+    parser.add_argument("--run-at", type=datetime.fromisoformat, default=None, help="billing time (default: now, UTC)")
+    parser.add_argument("--chunk-size", type=int, default=None, help="default: INVOICE_CHUNK_SIZE")
+    parser.add_argument("--database-url", default=None, help="async SQLAlchemy URL (default: DATABASE_URL)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    if not args.dry_run:
+        result = generate_monthly_invoices.delay()
+        print(f"Queued generate_monthly_invoices ({result.id})")
+        sys.exit(0)
+
+    report = asyncio.run(dry_run(args.database_url, args.run_at or datetime.utcnow(), args.chunk_size))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
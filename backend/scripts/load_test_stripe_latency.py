@@ -0,0 +1,91 @@
+"""
+Load test: unrelated endpoints under slow Stripe responses
+Starts the local fake Stripe API (scripts/fake_stripe.py) answering after --stripe-latency seconds,
+then hammers GET /health in-process while concurrent callers create Stripe
+customers. Three scenarios are compared:
+
+  baseline   no Stripe traffic
+  blocking   SDK called directly on the event loop (the old StripeService)
+  offloaded  StripeService, which runs the SDK on its bounded thread pool
+
+Run: python scripts/load_test_stripe_latency.py [--stripe-latency 0.5] [--seconds 5] [--stripe-callers 8] [--health-callers 16]
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import httpx
+import stripe
+
+from app.main import app
+from app.models.tenant import Tenant
+from app.services.stripe_service import StripeService
+from scripts.fake_stripe import FakeStripe
+
+
+async def blocking_create_customer(tenant: Tenant):
+    # What StripeService used to do: a synchronous SDK call inside a coroutine
+    return stripe.Customer.create(email=tenant.email, name=tenant.name)
+
+
+async def run_scenario(name: str, seconds: float, health_callers: int, stripe_callers: int, create_customer):
+    tenant = Tenant(name="Load Co", email="load@example.com")
+    deadline = time.perf_counter() + seconds
+    latencies, stripe_calls = [], 0
+
+    async def hit_health(client: httpx.AsyncClient):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await client.get("/health")
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    async def call_stripe():
+        nonlocal stripe_calls
+        while time.perf_counter() < deadline:
+            await create_customer(tenant)
+            stripe_calls += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+        callers = [hit_health(client) for _ in range(health_callers)]
+        if create_customer is not None:
+            callers += [call_stripe() for _ in range(stripe_callers)]
+        await asyncio.gather(*callers)
+
+    ordered = sorted(latencies)
+    print(
+        f"{name:<11}{len(latencies) / seconds:>10.0f}"
+        f"{statistics.median(ordered) * 1000:>10.1f}"
+        f"{ordered[int(len(ordered) * 0.95)] * 1000:>10.1f}"
+        f"{ordered[-1] * 1000:>10.1f}{stripe_calls:>14}"
+    )
+
+
+async def main(latency: float, seconds: float, health_callers: int, stripe_callers: int):
+    server = FakeStripe(latency=f"fixed:{latency * 1000}").start()
+    stripe.api_base = server.url
+    stripe.api_key = "sk_test_loadtest"
+
+    print(f"Stripe latency {latency}s, {health_callers} /health callers, {stripe_callers} Stripe callers, {seconds}s each\n")
+    print(f"{'scenario':<11}{'health/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'stripe calls':>14}")
+    await run_scenario("baseline", seconds, health_callers, stripe_callers, None)
+    await run_scenario("blocking", seconds, health_callers, stripe_callers, blocking_create_customer)
+    await run_scenario("offloaded", seconds, health_callers, stripe_callers, StripeService.create_customer)
+    server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--stripe-latency", type=float, default=0.5)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--health-callers", type=int, default=16)
+    parser.add_argument("--stripe-callers", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(main(args.stripe_latency, args.seconds, args.health_callers, args.stripe_callers))
@@ -0,0 +1,282 @@
+"""
+Time-travel billing simulator
+Seeds N tenants and drives the billing tasks through simulated months under
+a FakeClock: trial expiry, the renewal tick, the invoice sweeper, dunning
+retries and payment reminders, in the order beat would run them. Customer
+behaviour (trial conversion, churn, first-charge and retry outcomes) comes
+from a seeded RNG, so a run with the same arguments is reproducible and can
+be compared before and after a billing change.
+
+Payments never reach Stripe: first charges are settled by the simulator and
+dunning retries go through a deterministic stand-in for
+StripeService.pay_invoice.
+
+Run: python scripts/simulate_billing.py [--tenants 1000] [--months 12] [--step-hours 24] [--seed 7] [--database-url URL]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import func, insert, select, text, update
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.models import base  # noqa: F401 - registers all models
+from app.core import clock, database
+from app.core.database import Base
+from app.models.tenant import Tenant
+from app.models.plan import Plan, PlanTier
+from app.models.subscription import Subscription, SubscriptionStatus
+from app.models.invoice import Invoice, InvoiceStatus
+from app.services.dunning import schedule_dunning
+from app.services.stripe_service import StripeService
+from app.tasks import billing, notifications
+
+START = datetime(2026, 1, 1)
+PLANS = [
+    ("Starter", "starter", PlanTier.PRO, Decimal("9.00")),
+    ("Pro", "pro", PlanTier.PRO, Decimal("29.00")),
+    ("Enterprise", "enterprise", PlanTier.ENTERPRISE, Decimal("199.00")),
+]
+
+# Task name -> (coroutine factory, counter that measures its throughput)
+TASKS = [
+    ("check_trial_expiration", billing._check_trial_expiration_async, ("converted", "deactivated")),
+    ("renew_due_subscriptions", billing._renew_due_subscriptions_async, ("generated",)),
+    ("generate_monthly_invoices", lambda: billing._generate_monthly_invoices_async(inline=True), ("generated",)),
+    ("process_failed_payments", billing._process_failed_payments_async, ("attempted", "canceled")),
+    ("send_payment_reminders", notifications._send_payment_reminders_async, ("reminders",)),
+]
+
+
+class Customers:
+    """Seeded customer behaviour; every decision is a pure function of the seed and its inputs"""
+
+    def __init__(self, seed: int, trial_share: float, conversion: float, churn: float, failure: float, recovery: float):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.trial_share = trial_share
+        self.conversion = conversion
+        self.churn = churn
+        self.failure = failure
+        self.recovery = recovery
+
+    def uuid(self) -> uuid.UUID:
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def chance(self, *key) -> float:
+        return random.Random(":".join(str(part) for part in (self.seed, *key))).random()
+
+    async def pay_invoice(self, invoice_id: str, idempotency_key: str = None):
+        """Stand-in for StripeService.pay_invoice during dunning retries"""
+        paid = self.chance("retry", invoice_id, clock.utcnow()) < self.recovery
+        return SimpleNamespace(id=invoice_id, status="paid" if paid else "open")
+
+
+async def seed(session_factory, customers: Customers, tenants: int):
+    plan_ids = [customers.uuid() for _ in PLANS]
+    async with session_factory() as db:
+        await db.execute(insert(Plan), [
+            {"id": plan_id, "name": name, "slug": slug, "tier": tier, "price": price}
+            for plan_id, (name, slug, tier, price) in zip(plan_ids, PLANS)
+        ])
+        for offset in range(0, tenants, 5000):
+            tenant_rows, subscription_rows = [], []
+            for i in range(offset, min(offset + 5000, tenants)):
+                tenant_id = customers.uuid()
+                # Sign-ups spread over the first month
+                signed_up = START + timedelta(hours=customers.rng.randrange(24 * 30))
+                trial_ends = signed_up + timedelta(days=14)
+                trialing = customers.rng.random() < customers.trial_share
+                tenant_rows.append({
+                    "id": tenant_id, "name": f"t{i}", "slug": f"t{i}", "email": f"t{i}@example.com",
+                    "schema_name": f"tenant_t{i}", "is_trial": True, "is_active": True, "max_users": 5,
+                    "trial_ends_at": trial_ends,
+                })
+                subscription_rows.append({
+                    "id": customers.uuid(), "tenant_id": tenant_id,
+                    "plan_id": plan_ids[customers.rng.randrange(len(plan_ids))],
+                    "status": SubscriptionStatus.TRIALING if trialing else SubscriptionStatus.ACTIVE,
+                    # A trial that will not convert is flagged to end with the trial
+                    "cancel_at_period_end": trialing and customers.rng.random() >= customers.conversion,
+                    "trial_start": signed_up if trialing else None,
+                    "trial_end": trial_ends if trialing else None,
+                    "current_period_start": signed_up,
+                    "current_period_end": trial_ends if trialing else signed_up + relativedelta(months=1),
+                })
+            await db.execute(insert(Tenant), tenant_rows)
+            await db.execute(insert(Subscription), subscription_rows)
+        await db.commit()
+
+
+async def act_as_customers(session_factory, customers: Customers, step: timedelta) -> None:
+    """What Stripe and the customers would do between task runs"""
+    now = clock.utcnow()
+    async with session_factory() as db:
+        # Trials ending: converted ones start their first paid period, the rest end
+        result = await db.execute(
+            select(Subscription).where(
+                Subscription.status == SubscriptionStatus.TRIALING,
+                Subscription.current_period_end <= now,
+            )
+        )
+        for subscription in result.scalars().all():
+            if subscription.cancel_at_period_end:
+                subscription.status = SubscriptionStatus.CANCELED
+                subscription.ended_at = subscription.current_period_end
+            else:
+                subscription.status = SubscriptionStatus.ACTIVE
+                subscription.current_period_start = subscription.current_period_end
+                subscription.current_period_end += relativedelta(months=1)
+
+        # Churn: a share of paying customers cancel at the end of their period
+        result = await db.execute(
+            select(Subscription.id).where(
+                Subscription.status == SubscriptionStatus.ACTIVE,
+                Subscription.cancel_at_period_end.is_(False),
+            )
+        )
+        per_step = customers.churn * step / timedelta(days=30)
+        churned = [
+            subscription_id for subscription_id in result.scalars().all()
+            if customers.chance("churn", subscription_id, now) < per_step
+        ]
+        if churned:
+            await db.execute(
+                update(Subscription)
+                .where(Subscription.id.in_(churned))
+                .values(cancel_at_period_end=True, canceled_at=now)
+            )
+
+        # First charge of each new invoice; failures go to dunning
+        result = await db.execute(
+            select(Invoice).where(Invoice.status == InvoiceStatus.OPEN, Invoice.stripe_invoice_id.is_(None))
+        )
+        for invoice in result.scalars().all():
+            # Invoice numbers derive from subscription and period, so they repeat across runs
+            invoice.stripe_invoice_id = f"in_sim_{invoice.invoice_number}"
+            if customers.chance("charge", invoice.invoice_number) >= customers.failure:
+                invoice.status = InvoiceStatus.PAID
+                invoice.amount_paid = invoice.total
+                invoice.amount_due = 0
+                invoice.paid_at = now
+                continue
+            await schedule_dunning(db, invoice, now)
+            await db.execute(
+                update(Subscription)
+                .where(Subscription.id == invoice.subscription_id, Subscription.status == SubscriptionStatus.ACTIVE)
+                .values(status=SubscriptionStatus.PAST_DUE)
+            )
+        await db.commit()
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def simulate(url: str, tenants: int, months: int, step_hours: int, customers: Customers):
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    database.AsyncSessionLocal.configure(bind=engine)
+    session_factory = database.AsyncSessionLocal
+
+    print(f"Seeding {tenants} tenants...")
+    await seed(session_factory, customers, tenants)
+    if engine.dialect.name == "sqlite":
+        async with engine.begin() as conn:
+            await conn.execute(text("ANALYZE"))
+
+    fake = clock.FakeClock(START)
+    step = timedelta(hours=step_hours)
+    end = START + relativedelta(months=months)
+    latencies = {name: [] for name, _, _ in TASKS}
+    processed = {name: 0 for name, _, _ in TASKS}
+    steps = 0
+
+    real_pay_invoice = StripeService.pay_invoice
+    StripeService.pay_invoice = staticmethod(customers.pay_invoice)
+    started = time.perf_counter()
+    try:
+        with clock.use_clock(fake):
+            while fake.now() < end:
+                fake.advance(step)
+                steps += 1
+                await act_as_customers(session_factory, customers, step)
+                for name, task, counters in TASKS:
+                    task_started = time.perf_counter()
+                    stats = await task() or {}
+                    latencies[name].append(time.perf_counter() - task_started)
+                    processed[name] += sum(stats.get(counter, 0) for counter in counters)
+                if steps % 30 == 0:
+                    print(f"  {fake.now():%Y-%m-%d}  {time.perf_counter() - started:8.1f}s")
+    finally:
+        StripeService.pay_invoice = real_pay_invoice
+    wall = time.perf_counter() - started
+
+    print(f"\nSimulated {months} months in {steps} steps of {step_hours}h: {wall:.1f}s wall\n")
+    print(f"{'task':<28}{'runs':>6}{'items':>9}{'items/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}{'total s':>9}")
+    for name, _, _ in TASKS:
+        samples = latencies[name]
+        total = sum(samples)
+        print(
+            f"{name:<28}{len(samples):>6}{processed[name]:>9}{processed[name] / total if total else 0:>10.0f}"
+            f"{statistics.median(samples) * 1000:>9.1f}{percentile(samples, 0.95) * 1000:>9.1f}"
+            f"{max(samples) * 1000:>9.1f}{total:>9.2f}"
+        )
+
+    async with session_factory() as db:
+        invoices = (await db.execute(
+            select(Invoice.status, func.count(Invoice.id), func.sum(Invoice.total)).group_by(Invoice.status)
+        )).all()
+        subscriptions = (await db.execute(
+            select(Subscription.status, func.count(Subscription.id)).group_by(Subscription.status)
+        )).all()
+    print("\ninvoices:      " + ", ".join(f"{status.value} {count} (${amount})" for status, count, amount in invoices))
+    print("subscriptions: " + ", ".join(f"{status.value} {count}" for status, count in subscriptions))
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--tenants", type=int, default=1000)
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--step-hours", type=int, default=24, help="simulated time between task runs")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--trial-share", type=float, default=0.3, help="share of tenants signing up on a trial")
+    parser.add_argument("--conversion", type=float, default=0.6, help="share of trials that convert")
+    parser.add_argument("--churn", type=float, default=0.03, help="monthly cancellation rate")
+    parser.add_argument("--failure", type=float, default=0.08, help="share of first charges that fail")
+    parser.add_argument("--recovery", type=float, default=0.4, help="chance a dunning retry succeeds")
+    parser.add_argument(
+        "--database-url",
+        default=None,
+        help="async SQLAlchemy URL; its tables are dropped and recreated (default: temporary SQLite file)",
+    )
+    args = parser.parse_args()
+
+    url = args.database_url
+    if url is None:
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        url = f"sqlite+aiosqlite:///{path}"
+    logging.getLogger("app").setLevel(logging.ERROR)
+    customers = Customers(args.seed, args.trial_share, args.conversion, args.churn, args.failure, args.recovery)
+    asyncio.run(simulate(url, args.tenants, args.months, args.step_hours, customers))
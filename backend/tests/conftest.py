@@ -1,6 +1,7 @@
 import pytest
 import pytest_asyncio
 import httpx
+from celery.app.task import Task
 from httpx import AsyncClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
@@ -9,6 +10,7 @@ from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sess
 
 from app.main import app
 from app.core.database import Base, get_db
+from app.services import stripe_resilience
 
 # Test database setup - using synchronous SQLite for tests  
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
@@ -33,6 +35,32 @@ AsyncTestingSessionLocal = async_sessionmaker(
 )
 
 
+@pytest.fixture(autouse=True)
+def stripe_breaker(monkeypatch):
+    """A closed breaker per test and no backoff sleeps, so Stripe failures stay local and fast"""
+    breaker = stripe_resilience.CircuitBreaker(
+        window=stripe_resilience.breaker.window,
+        min_calls=stripe_resilience.breaker.min_calls,
+        error_rate=stripe_resilience.breaker.error_rate,
+        cooldown=stripe_resilience.breaker.cooldown,
+    )
+    monkeypatch.setattr(stripe_resilience, "breaker", breaker)
+    monkeypatch.setattr(stripe_resilience.settings, "STRIPE_RETRY_BASE_DELAY_SECONDS", 0.0)
+    return breaker
+
+
+@pytest.fixture(autouse=True)
+def published_tasks(monkeypatch):
+    """No broker in tests: task publishes are recorded as (name, args, options)"""
+    published = []
+    
+    def apply_async(self, args=None, kwargs=None, **options):
+        published.append((self.name, args, options))
+    
+    monkeypatch.setattr(Task, "apply_async", apply_async)
+    return published
+
+
 @pytest.fixture
 def db_session():
     """Create a fresh synchronous database for model tests"""
@@ -62,6 +90,16 @@ async def async_db_session():
         await conn.run_sync(Base.metadata.drop_all)
 
 
+@pytest_asyncio.fixture
+async def task_db(async_db_session):
+    """Test database session, with AsyncSessionLocal (used by tasks) bound to the same engine"""
+    from app.core import database
+    
+    database.AsyncSessionLocal.configure(bind=async_engine)
+    yield async_db_session
+    database.AsyncSessionLocal.configure(bind=database.engine)
+
+
 @pytest_asyncio.fixture
 async def client(async_db_session):
     """Create an async test client with overridden database dependency"""
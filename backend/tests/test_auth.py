@@ -24,6 +24,21 @@ class TestAuthEndpoints:
         assert "refresh_token" in data
         assert data["token_type"] == "bearer"
     
+    async def test_register_leaves_stripe_to_a_task(self, client, test_user_data, published_tasks, monkeypatch):
+        """Test signup does not wait on Stripe and queues customer creation"""
+        from app.services.stripe_service import StripeService
+        
+        async def create_customer(*args, **kwargs):
+            raise AssertionError("Stripe called during signup")
+        
+        monkeypatch.setattr(StripeService, "create_customer", create_customer)
+        response = await client.post("/api/v1/auth/register", json=test_user_data)
+        assert response.status_code == 201
+        
+        name, args, options = published_tasks[-1]
+        assert name == "app.tasks.billing.create_stripe_customer"
+        assert len(args) == 1 and options == {"retry": False}
+    
     async def test_register_duplicate_email(self, client, test_user_data):
         """Test registration with existing email fails"""
         # First registration
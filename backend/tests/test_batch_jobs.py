@@ -0,0 +1,164 @@
+"""Tests for checkpointed batch runs"""
+import pytest
+from datetime import datetime
+import uuid
+
+from sqlalchemy import select
+
+from app.models.tenant import Tenant
+from app.models.job_run import JobRun, JobRunStatus
+from app.tasks import batch, billing
+from app.tasks.leader import Lease, LeaseLost
+
+
+async def _seed_tenants(db, count):
+    tenants = [
+        Tenant(
+            id=uuid.uuid4(), name=f"Batch {i}", slug=f"batch-{i}-{uuid.uuid4().hex[:6]}",
+            email=f"batch{i}@example.com", schema_name=f"tenant_{uuid.uuid4().hex[:8]}",
+        )
+        for i in range(count)
+    ]
+    db.add_all(tenants)
+    await db.commit()
+    return sorted(tenants, key=lambda t: str(t.id))
+
+
+def _run(job_name, run_key, process_chunk, lease=None, on_progress=None):
+    return batch.run_batched(
+        job_name,
+        run_key,
+        fetch_chunk=billing._fetch_active_tenants,
+        process_chunk=process_chunk,
+        key=lambda row: str(row.id),
+        chunk_size=2,
+        count=billing._count_active_tenants,
+        on_progress=on_progress,
+        lease=lease,
+    )
+
+
+async def _job_run(db, job_name):
+    query = select(JobRun).where(JobRun.job_name == job_name).execution_options(populate_existing=True)
+    return (await db.execute(query)).scalar_one()
+
+
+@pytest.mark.asyncio
+class TestRunBatched:
+    """Test chunked iteration, checkpoints and resume"""
+
+    async def test_runs_all_chunks_once(self, task_db):
+        await _seed_tenants(task_db, 5)
+        seen, progress = [], []
+
+        async def process(db, rows):
+            seen.extend(row.id for row in rows)
+            return {"tenants": len(rows)}
+
+        summary = await _run("job", "k1", process, on_progress=progress.append)
+        assert summary["processed"] == 5 and summary["total"] == 5
+        assert summary["chunks"] == 3
+        assert summary["counts"] == {"tenants": 5}
+        assert [p["processed"] for p in progress] == [2, 4, 5]
+        assert len(set(seen)) == 5
+
+        # A completed run is not repeated
+        assert await _run("job", "k1", process) is None
+        assert len(seen) == 5
+
+    async def test_resumes_after_last_committed_chunk(self, task_db):
+        tenants = await _seed_tenants(task_db, 5)
+        seen = []
+
+        async def flaky(db, rows):
+            if len(seen) == 2:
+                raise RuntimeError("soft time limit")
+            seen.extend(row.id for row in rows)
+            return {"tenants": len(rows)}
+
+        with pytest.raises(RuntimeError):
+            await _run("job", "k1", flaky)
+        run = await _job_run(task_db, "job")
+        assert run.status == JobRunStatus.FAILED
+        assert run.processed == 2 and run.cursor == str(tenants[1].id)
+        assert run.last_error == "soft time limit"
+
+        async def process(db, rows):
+            seen.extend(row.id for row in rows)
+            return {"tenants": len(rows)}
+
+        assert await batch.pending_run_key(task_db, "job", "k2") == "k1"
+        summary = await _run("job", "k1", process)
+        assert summary["processed"] == 5
+        assert seen == [t.id for t in tenants]
+        run = await _job_run(task_db, "job")
+        assert run.status == JobRunStatus.COMPLETED and run.attempts == 2
+        assert await batch.pending_run_key(task_db, "job", "k2") == "k2"
+
+    async def test_stale_token_cannot_checkpoint(self, task_db):
+        await _seed_tenants(task_db, 3)
+        old, new = Lease("job"), Lease("job")
+        old.token, new.token = 1, 2
+
+        async def taken_over(db, rows):
+            # Another holder resumes the run while this one is mid-chunk
+            async with batch.AsyncSessionLocal() as other:
+                await batch.start_run(other, "job", "k1", new)
+            return {"tenants": len(rows)}
+
+        with pytest.raises(LeaseLost):
+            await _run("job", "k1", taken_over, lease=old)
+        run = await _job_run(task_db, "job")
+        assert run.processed == 0 and run.fencing_token == 2
+        assert run.status == JobRunStatus.RUNNING
+
+
+@pytest.mark.asyncio
+class TestInvoiceRunCheckpoints:
+    """Test the invoice chunk tasks recording into the run"""
+
+    async def test_chunk_counts_commit_with_invoices(self, task_db):
+        from tests.test_billing_tasks import _seed_subscriptions
+
+        await _seed_subscriptions(task_db, 3)
+        run = await batch.start_run(task_db, billing.INVOICE_JOB, "2026-10-19")
+
+        stats = await billing._generate_invoice_chunk_async(0, None, None, datetime.utcnow(), str(run.id))
+        assert stats["generated"] == 3
+
+        await billing._finish_invoice_run_async(str(run.id), failed_chunks=0)
+        run = await _job_run(task_db, billing.INVOICE_JOB)
+        assert run.processed == 3
+        assert run.counts == {"generated": 3, "existing": 0, "ended": 0}
+        assert run.status == JobRunStatus.COMPLETED
+
+    async def test_parallel_checkpoints_add_up(self, task_db):
+        run = await batch.start_run(task_db, billing.INVOICE_JOB, "2026-10-19")
+
+        async with batch.AsyncSessionLocal() as first, batch.AsyncSessionLocal() as second:
+            # Both chunks loaded the run before either checkpointed
+            first_run = await first.get(JobRun, run.id)
+            second_run = await second.get(JobRun, run.id)
+            await batch.checkpoint(second, second_run, 3, {"generated": 3})
+            await second.commit()
+            await batch.checkpoint(first, first_run, 2, {"generated": 1, "existing": 1})
+            await first.commit()
+
+        run = await _job_run(task_db, billing.INVOICE_JOB)
+        assert run.processed == 5 and run.chunks == 2
+        assert run.counts == {"generated": 4, "existing": 1}
+
+    async def test_chunk_of_a_taken_over_run_is_not_counted(self, task_db):
+        from tests.test_billing_tasks import _seed_subscriptions
+
+        await _seed_subscriptions(task_db, 2)
+        old, new = Lease(billing.INVOICE_JOB), Lease(billing.INVOICE_JOB)
+        old.token, new.token = 1, 2
+        run = await batch.start_run(task_db, billing.INVOICE_JOB, "2026-10-19", old)
+        await batch.start_run(task_db, billing.INVOICE_JOB, "2026-10-19", new)
+
+        stats = await billing._generate_invoice_chunk_async(0, None, None, datetime.utcnow(), str(run.id), 1)
+
+        assert stats["failed"]
+        run = await _job_run(task_db, billing.INVOICE_JOB)
+        assert run.processed == 0 and run.fencing_token == 2
@@ -0,0 +1,20 @@
+"""Tests for the application clock"""
+from datetime import datetime, timedelta
+
+from app.core import clock
+
+
+class TestClock:
+    """Test fake clock installation"""
+
+    def test_fake_clock_only_moves_when_advanced(self):
+        fake = clock.FakeClock(datetime(2026, 1, 1))
+        with clock.use_clock(fake):
+            assert clock.utcnow() == datetime(2026, 1, 1)
+            fake.advance(timedelta(days=31))
+            assert clock.utcnow() == datetime(2026, 2, 1)
+
+    def test_use_clock_restores_wall_clock(self):
+        with clock.use_clock(clock.FakeClock(datetime(2000, 1, 1))):
+            pass
+        assert clock.utcnow() > datetime(2026, 1, 1)
@@ -0,0 +1,199 @@
+"""Tests for the dunning retry queue"""
+import pytest
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+import uuid
+
+import stripe
+from sqlalchemy import select
+
+from app.core import database
+from app.core.config import settings
+from app.models.dunning_attempt import DunningAttempt, DunningStatus
+from app.models.invoice import Invoice, InvoiceStatus
+from app.models.subscription import SubscriptionStatus
+from app.services import dunning
+from app.services.stripe_service import StripeService
+from app.services.stripe_webhooks import handle_invoice_paid, handle_invoice_payment_failed
+from tests.test_billing_tasks import _seed_subscriptions
+
+
+async def _failed_invoices(db, count):
+    tenant, _, subscriptions = await _seed_subscriptions(db, count, ended=False, status=SubscriptionStatus.PAST_DUE)
+    invoices = []
+    for i, subscription in enumerate(subscriptions):
+        invoices.append(Invoice(
+            id=uuid.uuid4(), tenant_id=tenant.id, subscription_id=subscription.id,
+            invoice_number=f"INV-DUN-{uuid.uuid4().hex[:8]}", stripe_invoice_id=f"in_dun_{i}_{uuid.uuid4().hex[:6]}",
+            status=InvoiceStatus.OPEN, subtotal=Decimal("29.00"), total=Decimal("29.00"),
+            amount_due=Decimal("29.00"), invoice_date=datetime.utcnow(),
+        ))
+    db.add_all(invoices)
+    await db.commit()
+    return subscriptions, invoices
+
+
+def _fake_pay(monkeypatch, declined=()):
+    calls = []
+
+    async def pay_invoice(invoice_id, idempotency_key=None):
+        calls.append(invoice_id)
+        if invoice_id in declined:
+            raise stripe.error.CardError("Your card was declined.", None, "card_declined")
+        return SimpleNamespace(id=invoice_id, status="paid")
+
+    monkeypatch.setattr(StripeService, "pay_invoice", pay_invoice)
+    return calls
+
+
+class TestRetryDelay:
+    """Test the exponential backoff policy"""
+
+    def test_doubles_up_to_cap(self):
+        delays = [dunning.retry_delay(n) for n in range(1, 6)]
+        assert delays[:3] == [timedelta(hours=24), timedelta(hours=48), timedelta(hours=96)]
+        assert delays[3] == delays[4] == timedelta(hours=settings.DUNNING_MAX_DELAY_HOURS)
+
+
+@pytest.mark.asyncio
+class TestDunningQueue:
+    """Test scheduling and popping due retries"""
+
+    async def test_schedule_is_idempotent(self, async_db_session):
+        db = async_db_session
+        _, (invoice,) = await _failed_invoices(db, 1)
+        now = datetime.utcnow()
+
+        assert await dunning.schedule_dunning(db, invoice, now)
+        assert not await dunning.schedule_dunning(db, invoice, now + timedelta(hours=5))
+        await db.commit()
+
+        attempt = (await db.execute(select(DunningAttempt))).scalar_one()
+        assert attempt.status == DunningStatus.SCHEDULED
+        assert attempt.next_attempt_at.replace(tzinfo=None) == now + timedelta(hours=24)
+
+    async def test_pops_only_due_attempts(self, task_db, monkeypatch):
+        db = task_db
+        subscriptions, invoices = await _failed_invoices(db, 3)
+        now = datetime.utcnow()
+        for invoice in invoices:
+            await dunning.schedule_dunning(db, invoice, now - timedelta(days=2))
+        # The third one is not due yet
+        await db.execute(
+            DunningAttempt.__table__.update()
+            .where(DunningAttempt.invoice_id == invoices[2].id)
+            .values(next_attempt_at=now + timedelta(hours=3))
+        )
+        await db.commit()
+        calls = _fake_pay(monkeypatch, declined={invoices[1].stripe_invoice_id})
+
+        stats = await dunning.process_due_attempts(database.AsyncSessionLocal, now, limit=10)
+        assert stats == {"attempted": 2, "recovered": 1, "rescheduled": 1, "exhausted": 0, "canceled": 0}
+        assert invoices[2].stripe_invoice_id not in calls
+
+        attempts = {
+            a.invoice_id: a
+            for a in (await db.execute(select(DunningAttempt).execution_options(populate_existing=True))).scalars()
+        }
+        assert attempts[invoices[0].id].status == DunningStatus.SUCCEEDED
+        declined = attempts[invoices[1].id]
+        assert declined.attempt_count == 1
+        assert declined.next_attempt_at.replace(tzinfo=None) == now + timedelta(hours=48)
+        assert declined.last_error == "Your card was declined."
+
+        await db.refresh(subscriptions[0])
+        assert subscriptions[0].status == SubscriptionStatus.ACTIVE
+        await db.refresh(invoices[0])
+        assert invoices[0].status == InvoiceStatus.PAID
+
+        # Nothing else is due now
+        assert await dunning.process_due_attempts(database.AsyncSessionLocal, now, limit=10) == {
+            "attempted": 0, "recovered": 0, "rescheduled": 0, "exhausted": 0, "canceled": 0,
+        }
+
+    async def test_stripe_is_called_after_the_claim_commits(self, task_db, monkeypatch):
+        db = task_db
+        _, (invoice,) = await _failed_invoices(db, 1)
+        now = datetime.utcnow()
+        await dunning.schedule_dunning(db, invoice, now - timedelta(days=1))
+        await db.commit()
+        seen = []
+
+        async def pay_invoice(invoice_id, idempotency_key=None):
+            # The lease is committed: another worker finds nothing due
+            async with database.AsyncSessionLocal() as other:
+                seen.append(await dunning.claim_due_attempts(other, now, 10))
+                # Paid another way while Stripe was being called
+                await dunning.cancel_dunning(other, invoice.id)
+                await other.commit()
+            return SimpleNamespace(id=invoice_id, status="paid")
+
+        monkeypatch.setattr(StripeService, "pay_invoice", pay_invoice)
+        stats = await dunning.process_due_attempts(database.AsyncSessionLocal, now, limit=10)
+
+        assert seen == [[]]
+        assert stats["attempted"] == 1 and stats["recovered"] == 0
+        attempt = (await db.execute(select(DunningAttempt).execution_options(populate_existing=True))).scalar_one()
+        assert attempt.status == DunningStatus.CANCELED
+        assert attempt.attempt_count == 0
+
+    async def test_exhausted_retries_mark_unpaid(self, task_db, monkeypatch):
+        db = task_db
+        (subscription,), (invoice,) = await _failed_invoices(db, 1)
+        now = datetime.utcnow()
+        await dunning.schedule_dunning(db, invoice, now - timedelta(days=1))
+        await db.execute(
+            DunningAttempt.__table__.update().values(attempt_count=settings.DUNNING_MAX_ATTEMPTS - 1)
+        )
+        await db.commit()
+        _fake_pay(monkeypatch, declined={invoice.stripe_invoice_id})
+
+        stats = await dunning.process_due_attempts(database.AsyncSessionLocal, now, limit=10)
+        assert stats["exhausted"] == 1
+
+        await db.refresh(invoice)
+        await db.refresh(subscription)
+        assert invoice.status == InvoiceStatus.UNCOLLECTIBLE
+        assert subscription.status == SubscriptionStatus.UNPAID
+
+
+@pytest.mark.asyncio
+class TestDunningWebhooks:
+    """Test queueing from Stripe invoice events"""
+
+    async def test_payment_failed_queues_and_paid_cancels(self, async_db_session):
+        db = async_db_session
+        _, (invoice,) = await _failed_invoices(db, 1)
+        now = datetime.utcnow()
+
+        await handle_invoice_payment_failed(db, invoice, {"id": invoice.stripe_invoice_id}, now)
+        attempt = (await db.execute(select(DunningAttempt))).scalar_one()
+        assert attempt.status == DunningStatus.SCHEDULED
+
+        await handle_invoice_paid(db, invoice, {"id": invoice.stripe_invoice_id}, now)
+        await db.refresh(attempt)
+        assert attempt.status == DunningStatus.CANCELED
+        assert attempt.next_attempt_at is None
+
+    async def test_late_failure_does_not_reopen_an_exhausted_invoice(self, task_db, monkeypatch):
+        db = task_db
+        _, (invoice,) = await _failed_invoices(db, 1)
+        now = datetime.utcnow()
+        await dunning.schedule_dunning(db, invoice, now - timedelta(days=1))
+        await db.execute(
+            DunningAttempt.__table__.update().values(attempt_count=settings.DUNNING_MAX_ATTEMPTS - 1)
+        )
+        await db.commit()
+        _fake_pay(monkeypatch, declined={invoice.stripe_invoice_id})
+        assert (await dunning.process_due_attempts(database.AsyncSessionLocal, now, limit=10))["exhausted"] == 1
+        await db.refresh(invoice)
+
+        # Stripe's payment_failed for that last retry arrives afterwards
+        await handle_invoice_payment_failed(db, invoice, {"id": invoice.stripe_invoice_id}, now)
+        await db.commit()
+
+        await db.refresh(invoice)
+        assert invoice.status == InvoiceStatus.UNCOLLECTIBLE
+        attempt = (await db.execute(select(DunningAttempt).execution_options(populate_existing=True))).scalar_one()
+        assert attempt.status == DunningStatus.EXHAUSTED
@@ -0,0 +1,213 @@
+"""Tests for the local fake Stripe API (scripts/fake_stripe.py), driven through StripeService"""
+from decimal import Decimal
+import json
+import random
+
+import pytest
+import stripe
+from fastapi import status
+from sqlalchemy import select
+
+from app.core import clock, database
+from app.core.config import settings
+from app.models.subscription import Subscription
+from app.models.tenant import Tenant
+from app.services import stripe_outbox
+from app.services.stripe_outbox import CREATE_SUBSCRIPTION, drain_outbox, enqueue_operation
+from app.services.stripe_resilience import idempotency_key, metrics
+from app.services.stripe_service import StripeService
+from app.services.stripe_webhooks import process_events
+from app.tasks.billing import _create_stripe_customer_async
+from scripts.fake_stripe import DECLINE_TOKEN, FakeStripe, decode_form, latency_sampler
+from tests.test_billing_tasks import _seed_subscriptions
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    """Fake Stripe on a free port, with the SDK and the webhook secret pointed at it"""
+    server = FakeStripe(webhook_secret="whsec_fake_test").start()
+    monkeypatch.setattr(stripe, "api_base", server.url)
+    monkeypatch.setattr(stripe, "api_key", "sk_test_fake")
+    monkeypatch.setattr(settings, "STRIPE_WEBHOOK_SECRET", server.webhook_secret)
+    metrics.clear()
+    yield server
+    server.stop()
+
+
+async def _price(amount="29.00"):
+    product = await StripeService.create_product(name="Pro")
+    return await StripeService.create_price(product["id"], Decimal(amount))
+
+
+async def _customer():
+    tenant = Tenant(name="Fake Co", email="fake@example.com")
+    return await StripeService.create_customer(tenant)
+
+
+def test_form_decoding_restores_nesting():
+    params = decode_form([
+        ("items[0][price]", "price_1"), ("items[1][price]", "price_2"),
+        ("metadata[tenant_id]", "t1"), ("expand[0]", "latest_invoice.payment_intent"),
+        ("created[gte]", "100"),
+    ])
+    assert params == {
+        "items": [{"price": "price_1"}, {"price": "price_2"}],
+        "metadata": {"tenant_id": "t1"},
+        "expand": ["latest_invoice.payment_intent"],
+        "created": {"gte": "100"},
+    }
+
+
+def test_latency_specs():
+    rng = random.Random(1)
+    assert latency_sampler("fixed:250", rng)() == 0.25
+    assert 0.1 <= latency_sampler("uniform:100:200", rng)() <= 0.2
+    samples = sorted(latency_sampler("lognormal:100:0.5", rng)() for _ in range(1001))
+    assert 0.08 < samples[500] < 0.12
+    with pytest.raises(ValueError):
+        latency_sampler("bimodal:1:2", rng)
+
+
+@pytest.mark.asyncio
+class TestFakeStripe:
+    """Test StripeService against the fake's resources, faults and webhooks"""
+
+    async def test_subscription_lifecycle(self, fake):
+        price = await _price()
+        customer = await _customer()
+
+        subscription = await StripeService.create_subscription(
+            customer["id"], price["id"], payment_method_id="pm_card_visa",
+        )
+        assert subscription["status"] == "active"
+        assert subscription["items"]["data"][0]["price"]["id"] == price["id"]
+        # expand=latest_invoice.payment_intent is honoured
+        assert subscription["latest_invoice"]["payment_intent"]["status"] == "succeeded"
+        assert subscription["latest_invoice"]["amount_paid"] == 2900
+
+        other = await _price("99.00")
+        updated = await StripeService.update_subscription(
+            subscription["id"], price_id=other["id"], item_id=subscription["items"]["data"][0]["id"],
+        )
+        assert updated["items"]["data"][0]["price"]["unit_amount"] == 9900
+
+        canceled = await StripeService.cancel_subscription(subscription["id"], immediately=True)
+        assert canceled["status"] == "canceled"
+
+        page = await StripeService.list_subscriptions(limit=10, expand=["data.latest_invoice"])
+        assert [s["id"] for s in page["data"]] == [subscription["id"]]
+        assert page["data"][0]["latest_invoice"]["object"] == "invoice"
+
+        assert [e["type"] for e in fake.events if e["type"].startswith("customer.subscription")] == [
+            "customer.subscription.created",
+            "customer.subscription.updated",
+            "customer.subscription.updated",
+            "customer.subscription.deleted",
+        ]
+
+    async def test_decline_raises_card_error_and_emits_failure(self, fake):
+        price = await _price()
+        customer = await _customer()
+        subscription = await StripeService.create_subscription(customer["id"], price["id"])
+        assert subscription["status"] == "incomplete"
+
+        # No payment method yet
+        with pytest.raises(stripe.error.CardError):
+            await StripeService.pay_invoice(subscription["latest_invoice"]["id"])
+        # Declines are not retried
+        assert metrics[("invoice.pay", "calls")] == 1
+
+        stripe.Subscription.modify(subscription["id"], default_payment_method=DECLINE_TOKEN)
+        with pytest.raises(stripe.error.CardError):
+            await StripeService.pay_invoice(subscription["latest_invoice"]["id"])
+        assert fake.events[-1]["type"] == "invoice.payment_failed"
+
+    async def test_idempotency_key_replays_the_first_response(self, fake):
+        price = await _price()
+        customer = await _customer()
+        key = idempotency_key("subscription.create", "sub-1")
+
+        first = await StripeService.create_subscription(customer["id"], price["id"], idempotency_key=key)
+        second = await StripeService.create_subscription(customer["id"], price["id"], idempotency_key=key)
+
+        assert first["id"] == second["id"]
+        assert len(fake.objects["subscriptions"]) == 1
+
+    async def test_customer_creation_race_yields_one_customer(self, fake, task_db, monkeypatch):
+        tenant, _, (subscription,) = await _seed_subscriptions(task_db, 1, ended=False)
+        price = await _price()
+        enqueue_operation(
+            task_db, tenant.id, CREATE_SUBSCRIPTION, {"price_id": price["id"]}, clock.utcnow(), subscription.id,
+        )
+        await task_db.commit()
+        load = stripe_outbox._load
+
+        async def load_then_lose_the_race(session_factory, op):
+            loaded = await load(session_factory, op)
+            # The signup task creates the customer after the drainer read the tenant
+            await _create_stripe_customer_async(tenant.id)
+            return loaded
+
+        monkeypatch.setattr(stripe_outbox, "_load", load_then_lose_the_race)
+        stats = await drain_outbox(database.AsyncSessionLocal, clock.utcnow(), 10)
+
+        assert stats["succeeded"] == 1
+        assert len(fake.objects["customers"]) == 1
+        (customer_id,) = fake.objects["customers"]
+        await task_db.refresh(tenant)
+        assert tenant.stripe_customer_id == customer_id
+        (remote,) = fake.objects["subscriptions"].values()
+        assert remote["customer"] == customer_id
+
+        # Stripe rejects the same key with different parameters
+        with pytest.raises(stripe.error.IdempotencyError):
+            stripe.Customer.create(email="other@example.com", idempotency_key=idempotency_key("customer.create", tenant.id))
+
+    async def test_injected_faults_are_retried(self, fake):
+        price = await _price()
+        customer = await _customer()
+        subscription = await StripeService.create_subscription(customer["id"], price["id"])
+        fake.rate_limit_rate = fake.error_rate = 0.1
+        fake.rng.seed(3)
+
+        outcomes = []
+        for _ in range(20):
+            try:
+                await StripeService.retrieve_subscription(subscription["id"])
+                outcomes.append(200)
+            except stripe.error.StripeError as e:
+                outcomes.append(e.http_status)
+
+        served = [code for method, _, code in fake.requests if method == "GET"]
+        assert 429 in served and 500 in served
+        assert metrics[("subscription.retrieve", "retries")] == len(served) - len(outcomes)
+        # Below the breaker's trip rate, retries hide the faults
+        assert outcomes == [200] * 20
+
+    async def test_signed_events_reach_the_webhook_endpoint(self, fake, client, task_db):
+        tenant, _, (local,) = await _seed_subscriptions(task_db, 1, ended=False)
+        price = await _price()
+        customer = await _customer()
+        remote = await StripeService.create_subscription(customer["id"], price["id"], payment_method_id="pm_card_visa")
+        local.stripe_subscription_id = remote["id"]
+        await task_db.commit()
+
+        await StripeService.cancel_subscription(remote["id"])
+        event = fake.events[-1]
+        assert event["type"] == "customer.subscription.updated"
+
+        payload, headers = fake.signed(event)
+        assert StripeService.verify_webhook_signature(payload, headers["Stripe-Signature"], fake.webhook_secret)
+        response = await client.post("/api/v1/webhooks/stripe", content=payload, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert (await process_events(database.AsyncSessionLocal, clock.utcnow(), 10))["processed"] == 1
+
+        result = await task_db.execute(
+            select(Subscription).where(Subscription.id == local.id).execution_options(populate_existing=True)
+        )
+        assert result.scalar_one().cancel_at_period_end is True
+
+        tampered = json.dumps({**event, "type": "customer.subscription.deleted"}).encode()
+        response = await client.post("/api/v1/webhooks/stripe", content=tampered, headers=headers)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
@@ -0,0 +1,97 @@
+"""Tests for the ORM-free listing read path"""
+import pytest
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import List
+from pydantic import TypeAdapter
+import orjson
+import uuid
+
+from app.models.tenant import Tenant
+from app.models.plan import Plan, PlanTier
+from app.models.subscription import Subscription, SubscriptionStatus
+from app.models.invoice import Invoice, InvoiceStatus
+from app.models.usage_metric import UsageMetric, MetricType
+from app.schemas.invoice import InvoiceResponse
+from app.schemas.subscription import SubscriptionResponse
+from app.schemas.usage_metric import UsageMetricResponse
+from app.services import fast_listing
+
+
+async def _seed(db):
+    tenant = Tenant(
+        id=uuid.uuid4(),
+        name="Listing Co",
+        slug="listing-co",
+        email="listing@example.com",
+        schema_name="tenant_listing_co",
+    )
+    plan = Plan(id=uuid.uuid4(), name="Pro", slug="pro-listing", tier=PlanTier.PRO, price=Decimal("29.00"))
+    now = datetime.utcnow()
+    subscription = Subscription(
+        id=uuid.uuid4(),
+        tenant_id=tenant.id,
+        plan_id=plan.id,
+        status=SubscriptionStatus.ACTIVE,
+        current_period_start=now,
+        current_period_end=now + timedelta(days=30),
+    )
+    invoice = Invoice(
+        id=uuid.uuid4(),
+        tenant_id=tenant.id,
+        subscription_id=subscription.id,
+        invoice_number="INV-LIST-001",
+        status=InvoiceStatus.OPEN,
+        subtotal=Decimal("29.00"),
+        tax=Decimal("0.00"),
+        total=Decimal("29.00"),
+        amount_paid=Decimal("0.00"),
+        amount_due=Decimal("29.00"),
+        line_items=[{"description": "Pro Plan", "amount": 2900, "quantity": 1}],
+        invoice_date=datetime(2026, 1, 1, tzinfo=timezone.utc),
+    )
+    metric = UsageMetric(
+        id=uuid.uuid4(),
+        tenant_id=tenant.id,
+        metric_type=MetricType.API_CALLS,
+        metric_name="api_calls",
+        value=42,
+        unit="calls",
+        period_start=now,
+        period_end=now,
+        metric_metadata={"region": "eu"},
+    )
+    db.add_all([tenant, plan, subscription, invoice, metric])
+    await db.commit()
+    return tenant
+
+
+@pytest.mark.asyncio
+class TestFastListing:
+    """The fast path must produce the same JSON as the Pydantic path"""
+
+    @pytest.mark.parametrize("row_cls,model,schema", [
+        (fast_listing.InvoiceRow, Invoice, InvoiceResponse),
+        (fast_listing.SubscriptionRow, Subscription, SubscriptionResponse),
+        (fast_listing.UsageMetricRow, UsageMetric, UsageMetricResponse),
+    ])
+    async def test_matches_pydantic_output(self, async_db_session, row_cls, model, schema):
+        db = async_db_session
+        await _seed(db)
+
+        rows = await fast_listing.fetch_rows(db, row_cls, fast_listing.row_select(row_cls, model))
+        fast = orjson.loads(fast_listing.dump_rows(rows))
+
+        from sqlalchemy import select
+        objects = (await db.execute(select(model))).scalars().all()
+        adapter = TypeAdapter(List[schema])
+        expected = adapter.dump_python(adapter.validate_python(objects, from_attributes=True), mode="json")
+
+        assert fast == expected
+
+    async def test_rows_are_slotted(self, async_db_session):
+        await _seed(async_db_session)
+        rows = await fast_listing.fetch_rows(
+            async_db_session, fast_listing.InvoiceRow, fast_listing.select_invoices()
+        )
+        assert not hasattr(rows[0], "__dict__")
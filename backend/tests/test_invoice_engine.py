@@ -0,0 +1,167 @@
+"""Tests for the bulk invoice engine"""
+import pytest
+from datetime import datetime
+from decimal import Decimal
+import uuid
+
+from sqlalchemy import select
+
+from app.models.tenant import Tenant
+from app.models.plan import Plan, PlanTier, BillingInterval
+from app.models.subscription import Subscription, SubscriptionStatus
+from app.models.invoice import Invoice
+from app.core.config import settings
+from app.models.usage_metric import UsageMetric, MetricType
+from app.services import invoice_engine, usage_archive
+from app.services.invoice_engine import PeriodUsage
+
+
+def _plan(**kwargs):
+    values = dict(
+        id=uuid.uuid4(), name="Pro", slug=f"pro-{uuid.uuid4().hex[:8]}", tier=PlanTier.PRO,
+        price=Decimal("29.00"), max_api_calls=1000, max_storage_gb=5,
+        billing_interval=BillingInterval.MONTHLY,
+    )
+    values.update(kwargs)
+    return Plan(**values)
+
+
+class TestLineItems:
+    """Test line item and total computation"""
+
+    def test_plan_only(self):
+        line_items, subtotal = invoice_engine.build_line_items(_plan(), PeriodUsage(api_calls=1000, storage_gb=5))
+        assert line_items == [{"description": "Pro plan", "amount": 2900, "quantity": 1}]
+        assert subtotal == Decimal("29.00")
+
+    def test_overage(self):
+        line_items, subtotal = invoice_engine.build_line_items(_plan(), PeriodUsage(api_calls=3500, storage_gb=9))
+        # 2,500 extra calls -> 3 blocks at $0.50, 4 extra GB at $0.25
+        assert [(item["amount"], item["quantity"]) for item in line_items] == [(2900, 1), (150, 3), (100, 4)]
+        assert subtotal == Decimal("31.50")
+
+
+@pytest.mark.asyncio
+class TestBillSubscriptions:
+    """Test bulk invoicing and period advance"""
+
+    async def _seed(self, db, plan, **subscription_kwargs):
+        tenant = Tenant(
+            id=uuid.uuid4(), name="Engine Co", slug=f"engine-{uuid.uuid4().hex[:8]}",
+            email="engine@example.com", schema_name=f"tenant_{uuid.uuid4().hex[:8]}",
+        )
+        start = datetime(2026, 9, 1)
+        subscription = Subscription(
+            id=uuid.uuid4(), tenant_id=tenant.id, plan_id=plan.id, status=SubscriptionStatus.ACTIVE,
+            current_period_start=start, current_period_end=datetime(2026, 10, 1), **subscription_kwargs,
+        )
+        db.add_all([tenant, plan, subscription])
+        await db.commit()
+        return tenant, subscription
+
+    async def test_invoices_and_advances_period(self, async_db_session):
+        db = async_db_session
+        plan = _plan()
+        tenant, subscription = await self._seed(db, plan)
+        db.add_all([
+            UsageMetric(
+                tenant_id=tenant.id, metric_type=MetricType.API_CALLS, metric_name="api_calls",
+                value=value, unit="calls", period_start=when, period_end=when,
+            )
+            for value, when in ((900, datetime(2026, 9, 10)), (1200, datetime(2026, 9, 20)), (5000, datetime(2026, 10, 2)))
+        ])
+        await db.commit()
+
+        stats = await invoice_engine.bill_subscriptions(db, [(subscription, plan)], datetime(2026, 10, 1, 1))
+        await db.commit()
+        assert (stats.generated, stats.existing) == (1, 0)
+
+        invoice = (await db.execute(select(Invoice))).scalar_one()
+        assert invoice.invoice_number == invoice_engine.invoice_number(subscription.id, datetime(2026, 9, 1))
+        assert invoice.period_start.replace(tzinfo=None) == datetime(2026, 9, 1)
+        # October usage is not billed in the September period: 1,100 extra calls -> 2 blocks
+        assert invoice.total == Decimal("30.00")
+
+        await db.refresh(subscription)
+        assert subscription.current_period_start.replace(tzinfo=None) == datetime(2026, 10, 1)
+        assert subscription.current_period_end.replace(tzinfo=None) == datetime(2026, 11, 1)
+
+    async def test_rerun_same_period_is_idempotent(self, async_db_session):
+        db = async_db_session
+        plan = _plan()
+        _, subscription = await self._seed(db, plan)
+        snapshot = (subscription, plan)
+        await invoice_engine.bill_subscriptions(db, [snapshot], datetime(2026, 10, 1, 1))
+        await db.commit()
+
+        # A retried task still holding the old period state
+        stale = Subscription(
+            id=subscription.id, tenant_id=subscription.tenant_id, plan_id=plan.id,
+            status=SubscriptionStatus.ACTIVE, cancel_at_period_end=False,
+            current_period_start=datetime(2026, 9, 1), current_period_end=datetime(2026, 10, 1),
+        )
+        stats = await invoice_engine.bill_subscriptions(db, [(stale, plan)], datetime(2026, 10, 1, 1))
+        await db.commit()
+        assert (stats.generated, stats.existing) == (0, 1)
+        assert len((await db.execute(select(Invoice))).scalars().all()) == 1
+
+        await db.refresh(subscription)
+        assert subscription.current_period_end.replace(tzinfo=None) == datetime(2026, 11, 1)
+
+    async def test_cancel_at_period_end_and_yearly(self, async_db_session):
+        db = async_db_session
+        yearly = _plan(billing_interval=BillingInterval.YEARLY, price=Decimal("290.00"))
+        _, renewing = await self._seed(db, yearly)
+        _, ending = await self._seed(db, _plan(), cancel_at_period_end=True)
+        ending_plan = (await db.execute(select(Plan).where(Plan.id == ending.plan_id))).scalar_one()
+
+        stats = await invoice_engine.bill_subscriptions(
+            db, [(renewing, yearly), (ending, ending_plan)], datetime(2026, 10, 1, 1)
+        )
+        await db.commit()
+        assert stats.generated == 2 and stats.ended == 1
+        assert stats.amount == Decimal("319.00")
+
+        await db.refresh(renewing)
+        await db.refresh(ending)
+        assert renewing.current_period_end.replace(tzinfo=None) == datetime(2027, 10, 1)
+        assert ending.status == SubscriptionStatus.CANCELED
+        assert ending.ended_at.replace(tzinfo=None) == datetime(2026, 10, 1)
+
+    async def test_period_usage_includes_archived_months(self, async_db_session, tmp_path, monkeypatch):
+        """Test a yearly period reaching past the archive cutoff still bills the archived usage once"""
+        monkeypatch.setattr(settings, "USAGE_ARCHIVE_DIR", str(tmp_path))
+        db = async_db_session
+        plan = _plan(billing_interval=BillingInterval.YEARLY)
+        tenant, subscription = await self._seed(db, plan)
+        subscription.current_period_start = datetime(2025, 10, 1)
+        usage = [
+            (MetricType.API_CALLS, 800, datetime(2025, 11, 5)),
+            (MetricType.STORAGE, 9, datetime(2025, 12, 1)),
+            (MetricType.API_CALLS, 50, datetime(2025, 9, 20)),  # before the period
+            (MetricType.API_CALLS, 700, datetime(2026, 9, 10)),  # stays live
+        ]
+        db.add_all([
+            UsageMetric(
+                tenant_id=tenant.id, metric_type=metric_type, metric_name=metric_type.value,
+                value=value, unit="calls", period_start=when, period_end=when,
+            )
+            for metric_type, value, when in usage
+        ])
+        await db.commit()
+        await usage_archive.archive_closed_months(db, now=datetime(2026, 6, 10), months=3)
+
+        # Archived, but the archiver died before deleting it from the live table
+        pending = UsageMetric(
+            id=uuid.uuid4(), tenant_id=tenant.id, metric_type=MetricType.API_CALLS, metric_name="api_calls",
+            value=100, unit="calls", period_start=datetime(2025, 12, 20), period_end=datetime(2025, 12, 20),
+        )
+        db.add(pending)
+        await db.commit()
+        usage_archive.write_month(tenant.id, "2025-12", [(
+            pending.id, pending.period_start, pending.period_end, MetricType.API_CALLS,
+            "api_calls", "calls", 100, None,
+        )])
+
+        loaded = await invoice_engine.load_period_usage(db, [subscription.id])
+        assert loaded[subscription.id] == PeriodUsage(api_calls=1600, storage_gb=9)
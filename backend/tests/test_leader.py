@@ -0,0 +1,129 @@
+"""Tests for periodic task leader leases"""
+import time
+
+import pytest
+import redis
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core import database
+from app.tasks import leader
+from app.tasks.leader import RedisLease, leader_only
+
+
+class FakeRedis:
+    """Evaluates the three lease scripts against a dict, with PX expiry"""
+
+    def __init__(self):
+        self.values = {}
+        self.expires = {}
+
+    def _get(self, key):
+        if key in self.expires and self.expires[key] <= time.monotonic():
+            self.values.pop(key, None)
+            self.expires.pop(key, None)
+        return self.values.get(key)
+
+    def eval(self, script, numkeys, *args):
+        keys, argv = args[:numkeys], args[numkeys:]
+        if script is leader.ACQUIRE_SCRIPT:
+            if self._get(keys[0]) is not None:
+                return None
+            self.values[keys[0]] = argv[0]
+            self.expires[keys[0]] = time.monotonic() + argv[1] / 1000
+            self.values[keys[1]] = self.values.get(keys[1], 0) + 1
+            return self.values[keys[1]]
+        if self._get(keys[0]) != argv[0]:
+            return 0
+        if script is leader.RENEW_SCRIPT:
+            self.expires[keys[0]] = time.monotonic() + argv[1] / 1000
+        else:
+            del self.values[keys[0]]
+        return 1
+
+
+class DownRedis:
+    def eval(self, *args):
+        raise redis.ConnectionError("connection refused")
+
+
+@pytest.fixture
+def sqlite_bind():
+    database.AsyncSessionLocal.configure(bind=create_async_engine("sqlite+aiosqlite:///:memory:"))
+    yield
+    database.AsyncSessionLocal.configure(bind=database.engine)
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    client = FakeRedis()
+    monkeypatch.setattr(leader, "get_redis", lambda: client)
+    return client
+
+
+class TestRedisLease:
+    """Test lease acquisition, fencing and heartbeat"""
+
+    def test_second_holder_is_refused_until_release(self, fake_redis):
+        first = RedisLease(fake_redis, "job", 10)
+        assert first.acquire()
+        assert not RedisLease(fake_redis, "job", 10).acquire()
+
+        first.release()
+        second = RedisLease(fake_redis, "job", 10)
+        assert second.acquire()
+        assert second.token == first.token + 1
+        second.release()
+
+    def test_heartbeat_keeps_lease_alive(self, fake_redis):
+        lease = RedisLease(fake_redis, "job", 0.15)
+        assert lease.acquire()
+        time.sleep(0.4)
+        assert not lease.lost.is_set()
+        assert not RedisLease(fake_redis, "job", 0.15).acquire()
+        lease.release()
+
+    def test_expired_holder_cannot_release_new_lease(self, fake_redis):
+        stale = RedisLease(fake_redis, "job", 10)
+        assert stale.acquire()
+        stale._stop.set()
+        fake_redis.expires["lease:job"] = 0  # TTL ran out during a long pause
+
+        fresh = RedisLease(fake_redis, "job", 10)
+        assert fresh.acquire()
+        stale.release()
+        assert fake_redis.values["lease:job"] == fresh._owner
+        stale.lost.set()
+        with pytest.raises(leader.LeaseLost):
+            stale.ensure_held()
+        fresh.release()
+
+
+class TestLeaderOnly:
+    """Test the periodic task decorator"""
+
+    def test_skips_while_another_run_holds_the_lease(self, fake_redis):
+        calls = []
+
+        @leader_only("nightly")
+        def job():
+            calls.append("outer")
+            # A duplicate trigger while the first run is still going
+            assert nested() is None
+            return "done"
+
+        @leader_only("nightly")
+        def nested():
+            calls.append("inner")
+
+        assert job() == "done"
+        assert calls == ["outer"]
+        assert job() == "done"
+
+    def test_runs_unguarded_without_redis_on_sqlite(self, monkeypatch, sqlite_bind):
+        monkeypatch.setattr(leader, "get_redis", lambda: DownRedis())
+
+        @leader_only("nightly")
+        def job():
+            return "ran"
+
+        assert job() == "ran"
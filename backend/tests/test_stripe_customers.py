@@ -0,0 +1,69 @@
+"""Tests for on-demand Stripe customer creation"""
+import pytest
+import stripe
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.models.tenant import Tenant
+from app.services.stripe_customers import ensure_stripe_customer
+from app.services.stripe_service import StripeService
+from app.tasks import billing
+from tests.test_billing_tasks import _seed_subscriptions
+
+
+@pytest.fixture
+def customers(monkeypatch):
+    created = []
+
+    async def create_customer(tenant):
+        created.append(tenant.id)
+        return {"id": f"cus_{len(created)}"}
+
+    monkeypatch.setattr(StripeService, "create_customer", create_customer)
+    return created
+
+
+@pytest.mark.asyncio
+class TestEnsureStripeCustomer:
+    """Test lazy creation of a tenant's Stripe customer"""
+
+    async def test_creates_once_and_stores_the_id(self, async_db_session, customers):
+        db = async_db_session
+        tenant, _, _ = await _seed_subscriptions(db, 0)
+
+        assert await ensure_stripe_customer(db, tenant) == "cus_1"
+        assert await ensure_stripe_customer(db, tenant) == "cus_1"
+        assert customers == [tenant.id]
+        await db.refresh(tenant)
+        assert tenant.stripe_customer_id == "cus_1"
+
+    async def test_stale_object_sees_customer_created_elsewhere(self, async_db_session, customers):
+        db = async_db_session
+        tenant, _, _ = await _seed_subscriptions(db, 0)
+        await db.execute(
+            Tenant.__table__.update().where(Tenant.id == tenant.id).values(stripe_customer_id="cus_other")
+        )
+        await db.commit()
+        set_committed_value(tenant, "stripe_customer_id", None)  # As loaded before the other writer committed
+
+        assert await ensure_stripe_customer(db, tenant) == "cus_other"
+        assert customers == []
+
+    async def test_failure_leaves_tenant_without_customer(self, async_db_session, monkeypatch):
+        db = async_db_session
+        tenant, _, _ = await _seed_subscriptions(db, 0)
+
+        async def create_customer(*args, **kwargs):
+            raise stripe.error.APIConnectionError("reset")
+
+        monkeypatch.setattr(StripeService, "create_customer", create_customer)
+        with pytest.raises(stripe.error.APIConnectionError):
+            await ensure_stripe_customer(db, tenant)
+        await db.refresh(tenant)
+        assert tenant.stripe_customer_id is None
+
+    async def test_signup_task_creates_the_customer(self, task_db, customers):
+        tenant, _, _ = await _seed_subscriptions(task_db, 0)
+
+        assert await billing._create_stripe_customer_async(tenant.id) == "cus_1"
+        await task_db.refresh(tenant)
+        assert tenant.stripe_customer_id == "cus_1"
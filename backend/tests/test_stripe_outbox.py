@@ -0,0 +1,351 @@
+"""Tests for the Stripe transactional outbox"""
+import asyncio
+from datetime import datetime, timedelta
+from decimal import Decimal
+import uuid
+
+import pytest
+import stripe
+from fastapi import status
+from sqlalchemy import delete, select
+
+from app.core import database
+from app.core.config import settings
+from app.models.plan import Plan, PlanTier
+from app.models.stripe_operation import OperationStatus, StripeOperation
+from app.models.subscription import Subscription, SubscriptionStatus
+from app.services import stripe_outbox
+from app.services.stripe_outbox import (
+    CANCEL_SUBSCRIPTION,
+    CREATE_SUBSCRIPTION,
+    UPDATE_SUBSCRIPTION,
+    change_locally,
+    drain_outbox,
+    enqueue_operation,
+)
+from app.services.stripe_resilience import idempotency_key
+from app.services.stripe_service import StripeService
+from app.tasks.billing import drain_stripe_outbox
+from tests.test_billing_tasks import _seed_subscriptions
+from tests.test_usage import _auth_headers
+
+NOW = datetime(2026, 10, 19, 12, 0)
+
+
+def _remote(subscription_id, status="active", **extra):
+    return {
+        "id": subscription_id,
+        "customer": "cus_outbox",
+        "status": status,
+        "current_period_start": 1_790_000_000,
+        "current_period_end": 1_792_592_000,
+        "items": {"data": [{"id": "si_outbox", "price": {"id": "price_pro"}}]},
+        **extra,
+    }
+
+
+@pytest.fixture
+def fake_stripe(monkeypatch):
+    """Records Stripe calls; `fail` holds exceptions to raise, in order"""
+    calls, fail = [], []
+
+    def record(name, kwargs):
+        calls.append((name, kwargs))
+        if fail:
+            raise fail.pop(0)
+
+    async def create_customer(tenant):
+        record("customer", {"tenant": tenant.id})
+        return {"id": "cus_outbox"}
+
+    async def create_subscription(customer_id, price_id, **kwargs):
+        record("create", {"customer_id": customer_id, "price_id": price_id, **kwargs})
+        return _remote("sub_outbox")
+
+    async def update_subscription(subscription_id, **kwargs):
+        record("update", {"subscription_id": subscription_id, **kwargs})
+        return _remote(subscription_id)
+
+    async def cancel_subscription(subscription_id, **kwargs):
+        record("cancel", {"subscription_id": subscription_id, **kwargs})
+        return _remote(subscription_id, status="canceled")
+
+    for name, fn in [
+        ("create_customer", create_customer),
+        ("create_subscription", create_subscription),
+        ("update_subscription", update_subscription),
+        ("cancel_subscription", cancel_subscription),
+    ]:
+        monkeypatch.setattr(StripeService, name, fn)
+    return calls, fail
+
+
+async def _pending_subscription(db, stripe_id=None):
+    tenant, _, (subscription,) = await _seed_subscriptions(db, 1, ended=False, status=SubscriptionStatus.INCOMPLETE)
+    subscription.stripe_subscription_id = stripe_id
+    await db.commit()
+    return tenant, subscription
+
+
+async def _operation(db, op_id):
+    result = await db.execute(
+        select(StripeOperation).where(StripeOperation.id == op_id).execution_options(populate_existing=True)
+    )
+    return result.scalar_one()
+
+
+@pytest.mark.asyncio
+class TestOutboxDrain:
+    """Test claiming, delivery and retries"""
+
+    async def test_create_is_sent_and_applied(self, task_db, fake_stripe):
+        db = task_db
+        calls, _ = fake_stripe
+        tenant, subscription = await _pending_subscription(db)
+        op = enqueue_operation(db, tenant.id, CREATE_SUBSCRIPTION, {"price_id": "price_pro"}, NOW, subscription.id)
+        await db.commit()
+
+        stats = await drain_outbox(database.AsyncSessionLocal, NOW, 10)
+
+        assert stats == {"claimed": 1, "succeeded": 1, "retried": 0, "failed": 0}
+        assert [name for name, _ in calls] == ["customer", "create"]
+        assert calls[1][1]["idempotency_key"] == idempotency_key(CREATE_SUBSCRIPTION, op.id)
+
+        op = await _operation(db, op.id)
+        assert op.status == OperationStatus.SUCCEEDED
+        assert op.result == {"stripe_subscription_id": "sub_outbox", "status": "active"}
+        await db.refresh(subscription)
+        await db.refresh(tenant)
+        assert subscription.status == SubscriptionStatus.ACTIVE
+        assert subscription.stripe_subscription_id == "sub_outbox"
+        assert subscription.stripe_subscription_item_id == "si_outbox"
+        assert tenant.stripe_customer_id == "cus_outbox"
+
+    async def test_operations_on_one_subscription_apply_in_order(self, task_db, fake_stripe):
+        db = task_db
+        calls, _ = fake_stripe
+        tenant, subscription = await _pending_subscription(db)
+        enqueue_operation(db, tenant.id, CREATE_SUBSCRIPTION, {"price_id": "price_pro"}, NOW, subscription.id)
+        enqueue_operation(
+            db, tenant.id, UPDATE_SUBSCRIPTION, {"cancel_at_period_end": True},
+            NOW + timedelta(seconds=1), subscription.id,
+        )
+        await db.commit()
+
+        first = await drain_outbox(database.AsyncSessionLocal, NOW + timedelta(seconds=2), 10)
+        second = await drain_outbox(database.AsyncSessionLocal, NOW + timedelta(seconds=2), 10)
+
+        assert first["claimed"] == 1 and second["claimed"] == 1
+        assert [name for name, _ in calls] == ["customer", "create", "update"]
+        # The update saw the Stripe id and item id stored by the create
+        assert calls[2][1]["subscription_id"] == "sub_outbox"
+        assert calls[2][1]["item_id"] == "si_outbox"
+
+    async def test_unavailable_stripe_is_retried_with_backoff(self, task_db, fake_stripe):
+        db = task_db
+        _, fail = fake_stripe
+        tenant, subscription = await _pending_subscription(db, stripe_id="sub_live")
+        op = enqueue_operation(db, tenant.id, CANCEL_SUBSCRIPTION, {"immediately": False}, NOW, subscription.id)
+        await db.commit()
+
+        fail.append(stripe.error.APIConnectionError("reset"))
+        stats = await drain_outbox(database.AsyncSessionLocal, NOW, 10)
+        assert stats["retried"] == 1
+        op = await _operation(db, op.id)
+        assert op.status == OperationStatus.PENDING
+        assert op.attempts == 1
+        assert op.next_attempt_at == NOW + timedelta(seconds=settings.OUTBOX_RETRY_BASE_SECONDS)
+
+        # Not due yet
+        assert (await drain_outbox(database.AsyncSessionLocal, NOW, 10))["claimed"] == 0
+        stats = await drain_outbox(database.AsyncSessionLocal, op.next_attempt_at, 10)
+        assert stats["succeeded"] == 1
+        op = await _operation(db, op.id)
+        assert op.status == OperationStatus.SUCCEEDED
+        assert op.attempts == 2
+
+    async def test_rejected_create_fails_the_subscription(self, task_db, fake_stripe):
+        db = task_db
+        _, fail = fake_stripe
+        tenant, subscription = await _pending_subscription(db)
+        tenant.stripe_customer_id = "cus_existing"
+        op = enqueue_operation(db, tenant.id, CREATE_SUBSCRIPTION, {"price_id": "price_gone"}, NOW, subscription.id)
+        await db.commit()
+
+        fail.append(stripe.error.InvalidRequestError("No such price", "price", http_status=400))
+        stats = await drain_outbox(database.AsyncSessionLocal, NOW, 10)
+
+        assert stats["failed"] == 1
+        op = await _operation(db, op.id)
+        assert op.status == OperationStatus.FAILED
+        assert "No such price" in op.last_error
+        await db.refresh(subscription)
+        assert subscription.status == SubscriptionStatus.INCOMPLETE_EXPIRED
+
+    async def test_failed_update_restores_the_local_change(self, task_db, fake_stripe):
+        db = task_db
+        _, fail = fake_stripe
+        tenant, plan, (subscription,) = await _seed_subscriptions(db, 1, ended=False)
+        subscription.stripe_subscription_id = "sub_live"
+        other = Plan(id=uuid.uuid4(), name="Enterprise", slug=f"ent-{uuid.uuid4().hex[:8]}",
+                     tier=PlanTier.ENTERPRISE, price=Decimal("99.00"))
+        db.add(other)
+        payload = {"price_id": "price_ent", "cancel_at_period_end": True}
+        change_locally(subscription, payload, plan_id=other.id, cancel_at_period_end=True)
+        op = enqueue_operation(db, tenant.id, UPDATE_SUBSCRIPTION, payload, NOW, subscription.id)
+        await db.commit()
+
+        fail.append(stripe.error.InvalidRequestError("No such price", "price", http_status=400))
+        assert (await drain_outbox(database.AsyncSessionLocal, NOW, 10))["failed"] == 1
+
+        assert (await _operation(db, op.id)).status == OperationStatus.FAILED
+        await db.refresh(subscription)
+        assert subscription.plan_id == plan.id
+        assert subscription.cancel_at_period_end is False
+
+    async def test_failed_cancel_restores_the_subscription(self, task_db, fake_stripe):
+        db = task_db
+        _, fail = fake_stripe
+        tenant, subscription = await _pending_subscription(db, stripe_id="sub_live")
+        subscription.status = SubscriptionStatus.ACTIVE
+        payload = {"immediately": True}
+        change_locally(
+            subscription, payload, status=SubscriptionStatus.CANCELED, ended_at=NOW, canceled_at=NOW,
+        )
+        enqueue_operation(db, tenant.id, CANCEL_SUBSCRIPTION, payload, NOW, subscription.id)
+        await db.commit()
+        # A later request changed the cancel time again: that one is kept
+        subscription.canceled_at = NOW + timedelta(minutes=5)
+        await db.commit()
+
+        fail.append(stripe.error.InvalidRequestError("No such subscription", "id", http_status=404))
+        assert (await drain_outbox(database.AsyncSessionLocal, NOW, 10))["failed"] == 1
+
+        await db.refresh(subscription)
+        assert subscription.status == SubscriptionStatus.ACTIVE
+        assert subscription.ended_at is None
+        assert subscription.canceled_at.replace(tzinfo=None) == NOW + timedelta(minutes=5)
+
+    async def test_expired_lease_is_claimed_again(self, task_db, fake_stripe):
+        db = task_db
+        tenant, subscription = await _pending_subscription(db, stripe_id="sub_live")
+        op = enqueue_operation(db, tenant.id, CANCEL_SUBSCRIPTION, {}, NOW, subscription.id)
+        op.status = OperationStatus.PROCESSING
+        op.attempts = 1
+        op.next_attempt_at = NOW + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+        await db.commit()
+
+        assert (await drain_outbox(database.AsyncSessionLocal, NOW, 10))["claimed"] == 0
+        later = NOW + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+        assert (await drain_outbox(database.AsyncSessionLocal, later, 10))["succeeded"] == 1
+
+    async def test_apply_error_fails_the_operation_without_stopping_the_batch(self, task_db, fake_stripe, monkeypatch):
+        db = task_db
+        calls, _ = fake_stripe
+        # The test engine has one connection: interleaved transactions would share it
+        monkeypatch.setattr(settings, "OUTBOX_CONCURRENCY", 1)
+        tenant, _, (gone, kept) = await _seed_subscriptions(db, 2, ended=False, status=SubscriptionStatus.INCOMPLETE)
+        tenant.stripe_customer_id = "cus_existing"
+        ops = [
+            enqueue_operation(db, tenant.id, CREATE_SUBSCRIPTION, {"price_id": "price_pro"}, NOW, subscription.id)
+            for subscription in (gone, kept)
+        ]
+        await db.commit()
+        load = stripe_outbox._load
+
+        async def load_then_delete(session_factory, op):
+            loaded = await load(session_factory, op)
+            if op.subscription_id == gone.id:
+                # Deleted while Stripe was being called
+                async with session_factory() as other:
+                    await other.execute(delete(Subscription).where(Subscription.id == gone.id))
+                    await other.commit()
+            return loaded
+
+        monkeypatch.setattr(stripe_outbox, "_load", load_then_delete)
+        stats = await drain_outbox(database.AsyncSessionLocal, NOW, 10)
+
+        assert stats == {"claimed": 2, "succeeded": 1, "retried": 0, "failed": 1}
+        failed, succeeded = [await _operation(db, op.id) for op in ops]
+        assert failed.status == OperationStatus.FAILED
+        assert failed.completed_at is not None and failed.last_error
+        assert succeeded.status == OperationStatus.SUCCEEDED
+        # Not claimed or sent again
+        assert (await drain_outbox(database.AsyncSessionLocal, NOW + timedelta(hours=1), 10))["claimed"] == 0
+        assert [name for name, _ in calls] == ["create", "create"]
+
+    async def test_lease_expiring_on_the_last_attempt_fails_the_operation(self, task_db, fake_stripe):
+        db = task_db
+        calls, _ = fake_stripe
+        tenant, subscription = await _pending_subscription(db, stripe_id="sub_live")
+        op = enqueue_operation(db, tenant.id, CANCEL_SUBSCRIPTION, {}, NOW, subscription.id)
+        op.status = OperationStatus.PROCESSING
+        op.attempts = settings.OUTBOX_MAX_ATTEMPTS
+        op.next_attempt_at = NOW
+        later = enqueue_operation(db, tenant.id, UPDATE_SUBSCRIPTION, {"cancel_at_period_end": True},
+                                  NOW + timedelta(seconds=1), subscription.id)
+        await db.commit()
+
+        assert (await drain_outbox(database.AsyncSessionLocal, NOW + timedelta(seconds=1), 10))["claimed"] == 0
+        op = await _operation(db, op.id)
+        assert op.status == OperationStatus.FAILED
+        assert not calls
+        # No longer blocks the subscription's later operations
+        assert (await drain_outbox(database.AsyncSessionLocal, NOW + timedelta(seconds=1), 10))["succeeded"] == 1
+        assert (await _operation(db, later.id)).status == OperationStatus.SUCCEEDED
+
+    async def test_concurrency_is_limited(self, task_db, monkeypatch):
+        db = task_db
+        monkeypatch.setattr(settings, "OUTBOX_CONCURRENCY", 2)
+        in_flight, peak = 0, 0
+
+        async def cancel_subscription(subscription_id, **kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return _remote(subscription_id, status="canceled")
+
+        monkeypatch.setattr(StripeService, "cancel_subscription", cancel_subscription)
+        tenant, _, subscriptions = await _seed_subscriptions(db, 5, ended=False)
+        for i, subscription in enumerate(subscriptions):
+            subscription.stripe_subscription_id = f"sub_{i}"
+            enqueue_operation(db, tenant.id, CANCEL_SUBSCRIPTION, {}, NOW, subscription.id)
+        await db.commit()
+
+        stats = await drain_outbox(database.AsyncSessionLocal, NOW, 10)
+        assert stats["succeeded"] == 5
+        assert peak == 2
+
+
+@pytest.mark.asyncio
+class TestAsyncModeEndpoints:
+    """Test 202 responses and operation polling"""
+
+    async def test_async_cancel_returns_operation_to_poll(self, client, test_user_data, fake_stripe, published_tasks):
+        calls, _ = fake_stripe
+        headers = await _auth_headers(client, test_user_data)
+        subscriptions = (await client.get("/api/v1/subscriptions", headers=headers)).json()
+        assert subscriptions, "registration creates a starter subscription"
+        subscription_id = subscriptions[0]["id"]
+
+        response = await client.delete(f"/api/v1/subscriptions/{subscription_id}?async=true", headers=headers)
+
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        body = response.json()
+        assert body["operation"] == CANCEL_SUBSCRIPTION
+        assert body["status"] == "pending"
+        assert body["subscription_id"] == subscription_id
+        # Local state changed in the same transaction; Stripe is left to the drainer
+        assert not calls
+        assert published_tasks[-1] == (drain_stripe_outbox.name, None, {"retry": False})
+
+        polled = await client.get(f"/api/v1/subscriptions/operations/{body['id']}", headers=headers)
+        assert polled.status_code == status.HTTP_200_OK
+        assert polled.json()["id"] == body["id"]
+
+    async def test_unknown_operation_is_404(self, client, test_user_data):
+        headers = await _auth_headers(client, test_user_data)
+        response = await client.get(f"/api/v1/subscriptions/operations/{uuid.uuid4()}", headers=headers)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
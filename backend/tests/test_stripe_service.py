@@ -0,0 +1,271 @@
+"""Tests for the non-blocking Stripe service"""
+import asyncio
+import time
+
+import pytest
+import stripe
+
+from app.models.tenant import Tenant
+from app.services import stripe_resilience, stripe_service
+from app.services.stripe_resilience import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    call_stripe,
+    idempotency_key,
+)
+from app.services.stripe_service import StripeService
+
+
+class ManualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def policy(monkeypatch):
+    """Fresh counters and a breaker on a manual clock"""
+    clock = ManualClock()
+    breaker = CircuitBreaker(window=30, min_calls=4, error_rate=0.5, cooldown=10, clock=clock)
+    monkeypatch.setattr(stripe_resilience, "breaker", breaker)
+    monkeypatch.setattr(stripe_resilience, "metrics", stripe_resilience.Counter())
+    monkeypatch.setattr(stripe_resilience.settings, "STRIPE_MAX_RETRIES", 3)
+    return breaker, clock
+
+
+def _server_error():
+    return stripe.error.APIError("Internal error", http_status=500)
+
+
+@pytest.mark.asyncio
+class TestStripeOffload:
+    """Test that SDK calls run off the event loop"""
+
+    async def test_slow_call_does_not_block_the_loop(self, monkeypatch):
+        def slow_create(**kwargs):
+            time.sleep(0.3)
+            return {"id": "cus_slow", **kwargs}
+        monkeypatch.setattr(stripe.Customer, "create", slow_create)
+
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticking = asyncio.create_task(ticker())
+        customer = await StripeService.create_customer(Tenant(name="Co", email="co@example.com"))
+        ticking.cancel()
+
+        assert customer["id"] == "cus_slow"
+        assert ticks >= 10
+
+    async def test_errors_propagate(self, monkeypatch):
+        def failing_pay(invoice_id, idempotency_key=None):
+            raise stripe.error.CardError("declined", None, "card_declined")
+        monkeypatch.setattr(stripe.Invoice, "pay", failing_pay)
+
+        with pytest.raises(stripe.error.CardError):
+            await StripeService.pay_invoice("in_1")
+
+
+def test_http_client_has_connect_and_read_timeouts():
+    settings = stripe_service.settings
+    assert stripe.default_http_client._timeout == (
+        settings.STRIPE_CONNECT_TIMEOUT_SECONDS,
+        settings.STRIPE_READ_TIMEOUT_SECONDS,
+    )
+    assert stripe_service._executor._max_workers == settings.STRIPE_MAX_CONCURRENCY
+
+
+def test_idempotency_keys_follow_our_ids():
+    assert idempotency_key("subscription.create", "abc") == idempotency_key("subscription.create", "abc")
+    assert idempotency_key("subscription.create", "abc") != idempotency_key("subscription.create", "abd")
+    assert idempotency_key("invoice.pay", "abc", 1) != idempotency_key("invoice.pay", "abc", 2)
+
+
+@pytest.mark.asyncio
+class TestCallPolicy:
+    """Test retries, idempotency keys and the circuit breaker"""
+
+    async def test_transient_errors_are_retried_with_one_key(self, policy):
+        keys = []
+
+        async def send(**kwargs):
+            keys.append(kwargs["idempotency_key"])
+            if len(keys) < 3:
+                raise _server_error()
+            return "ok"
+
+        assert await call_stripe("op", send, idempotency_key="key-1") == "ok"
+        assert keys == ["key-1"] * 3
+        assert stripe_resilience.metrics[("op", "retries")] == 2
+
+    async def test_generated_key_is_reused_across_retries(self, policy):
+        keys = []
+
+        async def send(**kwargs):
+            keys.append(kwargs["idempotency_key"])
+            if len(keys) < 2:
+                raise stripe.error.APIConnectionError("reset")
+            return "ok"
+
+        await call_stripe("op", send)
+        assert len(keys) == 2 and keys[0] == keys[1]
+
+    async def test_reads_carry_no_key(self, policy):
+        async def send(*args, **kwargs):
+            return kwargs
+
+        assert await call_stripe("op", send, mutating=False) == {}
+
+    async def test_declines_are_not_retried(self, policy):
+        calls = []
+
+        async def send(**kwargs):
+            calls.append(kwargs)
+            raise stripe.error.CardError("declined", None, "card_declined", http_status=402)
+
+        with pytest.raises(stripe.error.CardError):
+            await call_stripe("op", send)
+        assert len(calls) == 1
+        assert stripe_resilience.metrics[("op", "failures")] == 1
+
+    async def test_should_retry_header_wins(self, policy):
+        calls = []
+
+        async def send(**kwargs):
+            calls.append(kwargs)
+            raise stripe.error.APIError("no", http_status=500, headers={"stripe-should-retry": "false"})
+
+        with pytest.raises(stripe.error.APIError):
+            await call_stripe("op", send)
+        assert len(calls) == 1
+
+    async def test_retries_stop_at_max_and_deadline(self, policy, monkeypatch):
+        breaker, _ = policy
+        calls = []
+
+        async def send(**kwargs):
+            calls.append(kwargs)
+            raise stripe.error.RateLimitError("slow down", http_status=429)
+
+        with pytest.raises(stripe.error.RateLimitError):
+            await call_stripe("op", send)
+        assert len(calls) == 4
+
+        calls.clear()
+        breaker.state = CLOSED
+        monkeypatch.setattr(stripe_resilience.settings, "STRIPE_RETRY_DEADLINE_SECONDS", 0.0)
+        monkeypatch.setattr(stripe_resilience, "backoff_delay", lambda attempt: 0.01)
+        with pytest.raises(stripe.error.RateLimitError):
+            await call_stripe("other", send)
+        assert len(calls) == 1
+
+    async def test_breaker_opens_fails_fast_and_recovers(self, policy):
+        breaker, clock = policy
+        healthy = False
+        calls = []
+
+        async def send(**kwargs):
+            calls.append(kwargs)
+            if not healthy:
+                raise _server_error()
+            return "ok"
+
+        with pytest.raises(stripe.error.APIError):
+            await call_stripe("op", send)
+        assert breaker.state == OPEN
+        assert len(calls) == 4
+
+        with pytest.raises(CircuitOpenError):
+            await call_stripe("op", send)
+        assert len(calls) == 4
+        assert stripe_resilience.metrics[("op", "short_circuited")] == 1
+
+        # After the cooldown one probe goes through; a failure reopens
+        clock.now += 10
+        with pytest.raises(CircuitOpenError):
+            await call_stripe("op", send)
+        assert len(calls) == 5 and breaker.state == OPEN
+
+        clock.now += 10
+        healthy = True
+        assert await call_stripe("op", send) == "ok"
+        assert breaker.state == CLOSED
+        assert stripe_resilience.stripe_stats()["breaker"] == {"state": CLOSED, "times_opened": 2}
+
+    async def test_declines_do_not_trip_the_breaker(self, policy):
+        breaker, _ = policy
+
+        async def send(**kwargs):
+            raise stripe.error.CardError("declined", None, "card_declined", http_status=402)
+
+        for _ in range(10):
+            with pytest.raises(stripe.error.CardError):
+                await call_stripe("op", send)
+        assert breaker.state == CLOSED
+
+    async def test_half_open_lets_one_probe_through(self, policy):
+        breaker, clock = policy
+        for _ in range(4):
+            breaker.record(False)
+        assert breaker.state == OPEN
+        clock.now += 10
+        assert breaker.allow() is True
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow() is False
+
+
+def _stripe_subscription(subscription_id, item_id, price_id):
+    return {"id": subscription_id, "items": {"data": [{"id": item_id, "price": {"id": price_id}}]}}
+
+
+@pytest.mark.asyncio
+class TestPlanChangeItemIds:
+    """Test that plan changes modify the stored subscription item directly"""
+
+    @pytest.fixture
+    def calls(self, monkeypatch):
+        calls = []
+
+        def retrieve(subscription_id):
+            calls.append(("retrieve", subscription_id))
+            return _stripe_subscription(subscription_id, "si_legacy", "price_old")
+
+        def modify(subscription_id, **params):
+            calls.append(("modify", subscription_id, params.get("items")))
+            item = (params.get("items") or [{"id": "si_legacy", "price": "price_old"}])[0]
+            return _stripe_subscription(subscription_id, item["id"], item["price"])
+
+        monkeypatch.setattr(stripe.Subscription, "retrieve", retrieve)
+        monkeypatch.setattr(stripe.Subscription, "modify", modify)
+        monkeypatch.setattr(stripe_service, "_item_ids", stripe_service.OrderedDict())
+        return calls
+
+    async def test_stored_item_id_needs_one_call(self, calls):
+        await StripeService.update_subscription("sub_1", price_id="price_new", item_id="si_1")
+        assert calls == [("modify", "sub_1", [{"id": "si_1", "price": "price_new"}])]
+
+    async def test_legacy_rows_retrieve_once_then_hit_the_cache(self, calls):
+        await StripeService.update_subscription("sub_2", price_id="price_new")
+        await StripeService.update_subscription("sub_2", price_id="price_newer")
+        assert [c[0] for c in calls] == ["retrieve", "modify", "modify"]
+        assert calls[-1][2] == [{"id": "si_legacy", "price": "price_newer"}]
+
+    async def test_cache_is_bounded(self, calls, monkeypatch):
+        monkeypatch.setattr(stripe_service.settings, "STRIPE_ITEM_CACHE_SIZE", 2)
+        for n in range(3):
+            stripe_service.remember_item(_stripe_subscription(f"sub_{n}", f"si_{n}", "price"))
+        assert list(stripe_service._item_ids) == ["sub_1", "sub_2"]
+
+    async def test_subscription_item_reads_ids(self, calls):
+        assert stripe_service.subscription_item(_stripe_subscription("sub", "si", "price")) == ("si", "price")
+        assert stripe_service.subscription_item({"id": "sub"}) == (None, None)
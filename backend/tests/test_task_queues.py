@@ -0,0 +1,104 @@
+"""Tests for Celery queue routing and queue metrics"""
+from types import SimpleNamespace
+
+import pytest
+
+from app.tasks import monitoring
+from app.tasks.celery_app import celery_app
+
+
+class FakeBrokerRedis:
+    """Lists only, with pipelines executed immediately"""
+
+    def __init__(self):
+        self.lists = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def lpush(self, key, value):
+        self.lists.setdefault(key, []).insert(0, str(value))
+
+    def ltrim(self, key, start, end):
+        self.lists[key] = self.lists.get(key, [])[start:end + 1]
+
+    def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    def lrange(self, key, start, end):
+        items = self.lists.get(key, [])
+        return items[start:] if end == -1 else items[start:end + 1]
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+    def execute(self):
+        return [getattr(self.client, name)(*args) for name, args in self.calls]
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    client = FakeBrokerRedis()
+    monkeypatch.setattr(monitoring, "_client", client)
+    return client
+
+
+class TestRouting:
+    """Test task routing into dedicated queues"""
+
+    @pytest.mark.parametrize("task, queue, priority", [
+        ("app.tasks.billing.renew_due_subscriptions", "billing", 0),
+        ("app.tasks.billing.generate_invoice_chunk", "billing", 6),
+        ("app.tasks.notifications.send_payment_failure_email", "notifications", 0),
+        ("app.tasks.notifications.send_invoice_email", "notifications", 6),
+        ("app.tasks.webhooks.process_webhook_events", "webhooks", 0),
+    ])
+    def test_routes(self, task, queue, priority):
+        route = celery_app.amqp.router.route({}, task)
+        assert route["queue"].name == queue
+        assert route["priority"] == priority
+
+
+class TestQueueMetrics:
+    """Test wait/runtime sampling and backlog"""
+
+    def _task(self, queue, published_at):
+        request = SimpleNamespace(delivery_info={"routing_key": queue}, published_at=published_at)
+        return SimpleNamespace(request=request)
+
+    def test_publish_stamps_header(self):
+        headers = {}
+        monitoring._stamp_published(headers=headers)
+        assert isinstance(headers[monitoring.PUBLISHED_HEADER], float)
+
+    def test_records_wait_and_runtime(self, broker):
+        task = self._task("notifications", published_at=0)
+        monitoring._record_wait(task_id="t1", task=task)
+        monitoring._record_runtime(task_id="t1")
+
+        stats = monitoring.queue_stats(celery_app)["notifications"]
+        assert stats["samples"] == 1
+        assert stats["wait_ms"]["max"] > 0
+        assert stats["runtime_ms"]["max"] >= 0
+
+    def test_eager_calls_are_not_sampled(self, broker):
+        task = SimpleNamespace(request=SimpleNamespace(delivery_info=None))
+        monitoring._record_wait(task_id="t2", task=task)
+        monitoring._record_runtime(task_id="t2")
+        assert broker.lists == {}
+
+    def test_backlog_counts_every_priority_list(self, broker):
+        broker.lists["billing"] = ["a", "b"]
+        broker.lists["billing:6"] = ["c"]
+        broker.lists["webhooks:9"] = ["d"]
+
+        stats = monitoring.queue_stats(celery_app)
+        assert stats["billing"]["backlog"] == 3
+        assert stats["webhooks"]["backlog"] == 1
+        assert stats["notifications"]["backlog"] == 0
@@ -0,0 +1,50 @@
+"""Tests for the Celery worker asyncio runtime"""
+import asyncio
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core import database
+from app.tasks.runtime import WorkerRuntime
+
+
+@pytest.fixture
+def runtime():
+    runtime = WorkerRuntime(engine_factory=lambda: create_async_engine("sqlite+aiosqlite:///:memory:"))
+    yield runtime
+    runtime.shutdown()
+
+
+class TestWorkerRuntime:
+    """Test the long-lived loop and engine lifecycle"""
+
+    def test_reuses_one_loop(self, runtime):
+        async def current_loop():
+            return asyncio.get_running_loop()
+
+        first = runtime.run(current_loop())
+        second = runtime.run(current_loop())
+        assert first is second is runtime.loop
+
+    def test_binds_session_factory_to_worker_engine(self, runtime):
+        async def query():
+            async with database.AsyncSessionLocal() as db:
+                return (await db.execute(text("SELECT 1"))).scalar()
+
+        assert runtime.run(query()) == 1
+        assert database.AsyncSessionLocal.kw["bind"] is runtime.engine
+
+    def test_propagates_exceptions(self, runtime):
+        async def fail():
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError, match="boom"):
+            runtime.run(fail())
+        # Loop keeps serving tasks after a failure
+        assert runtime.run(asyncio.sleep(0, result="ok")) == "ok"
+
+    def test_shutdown_restores_default_engine(self, runtime):
+        runtime.start()
+        runtime.shutdown()
+        assert not runtime.running
+        assert database.AsyncSessionLocal.kw["bind"] is database.engine
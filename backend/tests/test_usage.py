@@ -0,0 +1,161 @@
+"""Tests for usage recording and metadata filters"""
+import pytest
+from fastapi import status
+from datetime import datetime, timedelta
+import json
+
+from app.core.config import settings
+from app.services import usage_archive
+
+
+async def _auth_headers(client, test_user_data):
+    await client.post("/api/v1/auth/register", json=test_user_data)
+    login_response = await client.post("/api/v1/auth/login", json={
+        "email": test_user_data["email"],
+        "password": test_user_data["password"]
+    })
+    token = login_response.json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def _record(client, headers, value, metadata, now=None):
+    now = now or datetime.utcnow()
+    response = await client.post(
+        "/api/v1/usage",
+        json={
+            "metric_type": "api_calls",
+            "metric_name": "api_calls",
+            "value": value,
+            "unit": "calls",
+            "period_start": (now - timedelta(hours=1)).isoformat(),
+            "period_end": now.isoformat(),
+            "metric_metadata": metadata,
+        },
+        headers=headers,
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    return response.json()
+
+
+@pytest.mark.asyncio
+class TestUsageMetadata:
+    """Test JSON metadata storage and containment filters"""
+
+    async def test_record_usage_stores_metadata(self, client, test_user_data):
+        """Test metadata is persisted as a JSON object"""
+        headers = await _auth_headers(client, test_user_data)
+        data = await _record(client, headers, 10, {"region": "eu", "endpoint": "/orders"})
+        assert data["metric_metadata"] == {"region": "eu", "endpoint": "/orders"}
+
+    async def test_filter_metrics_by_metadata(self, client, test_user_data):
+        """Test ?metadata= returns only matching rows"""
+        headers = await _auth_headers(client, test_user_data)
+        await _record(client, headers, 10, {"region": "eu", "endpoint": "/orders"})
+        await _record(client, headers, 20, {"region": "us", "endpoint": "/orders"})
+        await _record(client, headers, 5, {"region": "eu", "endpoint": "/users", "retries": 2})
+
+        response = await client.get(
+            "/api/v1/usage/metrics",
+            params={"metadata": json.dumps({"region": "eu"})},
+            headers=headers,
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert sorted(m["value"] for m in response.json()) == [5, 10]
+
+        response = await client.get(
+            "/api/v1/usage/metrics",
+            params={"metadata": json.dumps({"region": "eu", "retries": 2})},
+            headers=headers,
+        )
+        assert [m["value"] for m in response.json()] == [5]
+
+    async def test_invalid_metadata_filter(self, client, test_user_data):
+        """Test malformed filters are rejected"""
+        headers = await _auth_headers(client, test_user_data)
+        response = await client.get(
+            "/api/v1/usage/metrics",
+            params={"metadata": "[1, 2]"},
+            headers=headers,
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    async def test_breakdown_by_dimension(self, client, test_user_data):
+        """Test per-dimension totals"""
+        headers = await _auth_headers(client, test_user_data)
+        await _record(client, headers, 10, {"region": "eu"})
+        await _record(client, headers, 20, {"region": "us"})
+        await _record(client, headers, 5, {"region": "eu"})
+
+        response = await client.get(
+            "/api/v1/usage/breakdown",
+            params={"dimension": "region"},
+            headers=headers,
+        )
+        assert response.status_code == status.HTTP_200_OK
+        totals = {row["value"]: row["total_usage"] for row in response.json()}
+        assert totals == {"us": 20, "eu": 15}
+
+        response = await client.get(
+            "/api/v1/usage/summary",
+            params={"metadata": json.dumps({"region": "eu"})},
+            headers=headers,
+        )
+        assert response.json()[0]["total_usage"] == 15
+
+    async def test_breakdown_values_are_text(self, client, test_user_data):
+        """Test non-string dimension values come back as text on every dialect"""
+        headers = await _auth_headers(client, test_user_data)
+        await _record(client, headers, 10, {"retries": 2})
+        await _record(client, headers, 20, {"retries": True})
+        await _record(client, headers, 5, {"region": "eu"})
+
+        response = await client.get(
+            "/api/v1/usage/breakdown",
+            params={"dimension": "retries"},
+            headers=headers,
+        )
+        totals = {row["value"]: row["total_usage"] for row in response.json()}
+        assert totals == {"true": 20, "2": 10, None: 5}
+
+    async def test_null_filter_matches_only_explicit_null(self, client, test_user_data):
+        """Test {"key": null} does not match rows without the key, as with JSONB @>"""
+        headers = await _auth_headers(client, test_user_data)
+        await _record(client, headers, 10, {"region": None})
+        await _record(client, headers, 20, {"endpoint": "/orders"})
+
+        response = await client.get(
+            "/api/v1/usage/metrics",
+            params={"metadata": json.dumps({"region": None})},
+            headers=headers,
+        )
+        assert [m["value"] for m in response.json()] == [10]
+
+    async def test_archived_usage_keeps_metadata(
+        self, client, test_user_data, async_db_session, tmp_path, monkeypatch
+    ):
+        """Test breakdowns and metadata filters include closed months from the archive"""
+        monkeypatch.setattr(settings, "USAGE_ARCHIVE_DIR", str(tmp_path))
+        headers = await _auth_headers(client, test_user_data)
+        old = datetime.utcnow() - timedelta(days=100)
+        await _record(client, headers, 10, {"region": "eu"}, now=old)
+        await _record(client, headers, 20, {"region": "us"}, now=old)
+        await _record(client, headers, 5, {"region": "eu"})
+
+        stats = await usage_archive.archive_closed_months(async_db_session, months=1)
+        assert stats["rows"] == 2
+
+        params = {"days": 365}
+        response = await client.get(
+            "/api/v1/usage/breakdown",
+            params={**params, "dimension": "region"},
+            headers=headers,
+        )
+        totals = {row["value"]: row["total_usage"] for row in response.json()}
+        assert totals == {"us": 20, "eu": 15}
+
+        filtered = {**params, "metadata": json.dumps({"region": "eu"})}
+        response = await client.get("/api/v1/usage/summary", params=filtered, headers=headers)
+        assert response.json()[0]["total_usage"] == 15
+
+        response = await client.get("/api/v1/usage/stats", params=filtered, headers=headers)
+        assert response.json()["api_calls"] == 15
@@ -0,0 +1,151 @@
+"""Tests for the columnar usage archive"""
+import pytest
+from datetime import datetime
+from sqlalchemy import select, func
+import numpy as np
+import uuid
+
+from app.core.config import settings
+from app.models.tenant import Tenant
+from app.models.usage_metric import UsageMetric, MetricType
+from app.services import usage_archive
+
+
+@pytest.fixture
+def archive_dir(tmp_path, monkeypatch):
+    """Point the archive at a temporary directory"""
+    monkeypatch.setattr(settings, "USAGE_ARCHIVE_DIR", str(tmp_path))
+    return tmp_path
+
+
+async def _create_tenant(db):
+    tenant = Tenant(
+        id=uuid.uuid4(),
+        name="Archive Co",
+        slug="archive-co",
+        email="archive@example.com",
+        schema_name="tenant_archive_co",
+    )
+    db.add(tenant)
+    await db.commit()
+    return tenant
+
+
+def _usage(tenant, when, metric_type=MetricType.API_CALLS, value=10, unit="calls"):
+    return UsageMetric(
+        id=uuid.uuid4(),
+        tenant_id=tenant.id,
+        metric_type=metric_type,
+        metric_name=metric_type.value,
+        value=value,
+        unit=unit,
+        period_start=when,
+        period_end=when,
+    )
+
+
+class TestArchiveHelpers:
+    """Test partitioning helpers"""
+
+    def test_archive_cutoff_is_first_day_of_month(self):
+        cutoff = usage_archive.archive_cutoff(datetime(2026, 2, 17, 12, 30), months=3)
+        assert cutoff == datetime(2025, 11, 1)
+
+    def test_month_key(self):
+        assert usage_archive.month_key(datetime(2025, 1, 31, 23, 59)) == "2025-01"
+
+
+@pytest.mark.asyncio
+class TestUsageArchive:
+    """Test exporting closed months and reading them back"""
+
+    async def test_archive_moves_closed_months(self, async_db_session, archive_dir):
+        db = async_db_session
+        tenant = await _create_tenant(db)
+        db.add_all([
+            _usage(tenant, datetime(2026, 1, 5), value=10),
+            _usage(tenant, datetime(2026, 1, 20), value=15),
+            _usage(tenant, datetime(2026, 2, 3), MetricType.STORAGE, value=3, unit="GB"),
+            _usage(tenant, datetime(2026, 6, 1), value=99),  # still live
+        ])
+        await db.commit()
+
+        stats = await usage_archive.archive_closed_months(db, now=datetime(2026, 6, 10), months=3)
+
+        assert stats == {"tenants": 1, "months": 2, "rows": 3}
+        remaining = await db.execute(select(func.count(UsageMetric.id)))
+        assert remaining.scalar() == 1
+        assert (archive_dir / str(tenant.id) / "2026-01" / "value.npy").exists()
+
+        months = list(usage_archive.iter_months(tenant.id))
+        assert [m.month for m in months] == ["2026-01", "2026-02"]
+        assert isinstance(months[0].columns["value"], np.memmap)
+        assert len(months[0]) == 2
+
+    async def test_archived_totals_filter_by_range_and_type(self, async_db_session, archive_dir):
+        db = async_db_session
+        tenant = await _create_tenant(db)
+        db.add_all([
+            _usage(tenant, datetime(2026, 1, 5), value=10),
+            _usage(tenant, datetime(2026, 1, 20), value=15),
+            _usage(tenant, datetime(2026, 1, 21), MetricType.STORAGE, value=3, unit="GB"),
+        ])
+        await db.commit()
+        await usage_archive.archive_closed_months(db, now=datetime(2026, 6, 10), months=3)
+
+        totals = usage_archive.archived_totals(tenant.id)
+        assert totals == {(MetricType.API_CALLS, "calls"): 25, (MetricType.STORAGE, "GB"): 3}
+
+        totals = usage_archive.archived_totals(tenant.id, start=datetime(2026, 1, 10))
+        assert totals[(MetricType.API_CALLS, "calls")] == 15
+
+        totals = usage_archive.archived_totals(tenant.id, metric_type=MetricType.STORAGE)
+        assert totals == {(MetricType.STORAGE, "GB"): 3}
+
+    async def test_late_rows_extend_existing_month(self, async_db_session, archive_dir):
+        db = async_db_session
+        tenant = await _create_tenant(db)
+        db.add(_usage(tenant, datetime(2026, 1, 5), value=10))
+        await db.commit()
+        await usage_archive.archive_closed_months(db, now=datetime(2026, 6, 10), months=3)
+
+        db.add(_usage(tenant, datetime(2026, 1, 2), value=5))
+        await db.commit()
+        await usage_archive.archive_closed_months(db, now=datetime(2026, 6, 10), months=3)
+
+        month = next(usage_archive.iter_months(tenant.id))
+        assert len(month) == 2
+        assert [row[6] for row in month.rows()] == [5, 10]
+
+    async def test_rerun_after_failed_commit_does_not_double_count(
+        self, async_db_session, archive_dir, monkeypatch
+    ):
+        """Test rows written to the archive but not deleted are merged by id, not appended"""
+        db = async_db_session
+        tenant = await _create_tenant(db)
+        db.add_all([
+            _usage(tenant, datetime(2026, 1, 5), value=10),
+            _usage(tenant, datetime(2026, 1, 9), value=7),
+        ])
+        await db.commit()
+        tenant_id = tenant.id
+
+        commit = db.commit
+
+        async def failing_commit():
+            raise RuntimeError("connection lost")
+
+        monkeypatch.setattr(db, "commit", failing_commit)
+        with pytest.raises(RuntimeError):
+            await usage_archive.archive_closed_months(db, now=datetime(2026, 6, 10), months=3)
+        await db.rollback()
+        monkeypatch.setattr(db, "commit", commit)
+
+        remaining = await db.execute(select(func.count(UsageMetric.id)))
+        assert remaining.scalar() == 2
+
+        await usage_archive.archive_closed_months(db, now=datetime(2026, 6, 10), months=3)
+
+        month = next(usage_archive.iter_months(tenant_id))
+        assert len(month) == 2
+        assert usage_archive.archived_totals(tenant_id) == {(MetricType.API_CALLS, "calls"): 17}
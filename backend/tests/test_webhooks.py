@@ -1,7 +1,34 @@
 """Tests for Stripe webhook handling"""
+from datetime import datetime, timedelta
+import json
+import time
+import uuid
+
 import pytest
+import stripe
 from fastapi import status
-import json
+from sqlalchemy import event as sa_event, select
+
+from app.core import database
+from app.core.config import settings
+from app.models.dunning_attempt import DunningAttempt
+from app.models.invoice import InvoiceStatus
+from app.models.subscription import SubscriptionStatus
+from app.models.webhook_event import WebhookEvent, WebhookEventStatus
+from app.services import stripe_webhooks
+from app.core.profiling import QueryCounter
+from app.services.stripe_webhooks import (
+    apply_events,
+    claim_events,
+    event_header,
+    process_events,
+    record_event,
+    verify_signature,
+)
+from app.tasks.webhooks import process_webhook_events
+from scripts.fake_stripe import FakeStripe
+from tests.test_billing_tasks import _seed_subscriptions
+from tests.test_dunning import _failed_invoices
 
 
 @pytest.mark.asyncio
@@ -210,3 +237,324 @@ class TestStripeWebhooks:
         )
         # May return 400 (bad request) or 422 (unprocessable entity)
         assert response.status_code in [status.HTTP_400_BAD_REQUEST, status.HTTP_422_UNPROCESSABLE_ENTITY]
+
+
+SECRET = "whsec_ingestion_test"
+NOW = datetime(2026, 10, 19, 12, 0)
+
+
+def _event(event_type, obj, created=1_790_000_000):
+    return {
+        "id": f"evt_{uuid.uuid4().hex[:16]}",
+        "object": "event",
+        "type": event_type,
+        "created": created,
+        "data": {"object": obj},
+    }
+
+
+def _subscription_object(stripe_id, status="active", **extra):
+    return {
+        "id": stripe_id,
+        "object": "subscription",
+        "status": status,
+        "current_period_start": 1_790_000_000,
+        "current_period_end": 1_792_592_000,
+        **extra,
+    }
+
+
+async def _queue(db, *events):
+    for event in events:
+        payload = json.dumps(event).encode()
+        assert await record_event(db, event_header(payload), payload, NOW)
+    await db.commit()
+    result = await db.execute(select(WebhookEvent).where(WebhookEvent.stripe_event_id.in_([e["id"] for e in events])))
+    rows = {row.stripe_event_id: row for row in result.scalars()}
+    return [rows[event["id"]] for event in events]
+
+
+async def _row(db, row_id):
+    result = await db.execute(
+        select(WebhookEvent).where(WebhookEvent.id == row_id).execution_options(populate_existing=True)
+    )
+    return result.scalar_one()
+
+
+class TestSignatureVerification:
+    """Test the raw-body signature check and header extraction"""
+
+    def _signed(self, timestamp=1_792_000_000):
+        payload = json.dumps(_event("invoice.paid", {"id": "in_sig", "object": "invoice", "subscription": "sub_sig"})).encode()
+        return payload, FakeStripe(webhook_secret=SECRET).sign(payload, timestamp), timestamp
+
+    def test_valid_signature_passes(self):
+        payload, header, timestamp = self._signed()
+        verify_signature(payload, header, SECRET, now=timestamp + 10)
+        # Same verdict as the SDK
+        assert stripe.Webhook.construct_event(payload, header, SECRET, tolerance=None)
+
+    @pytest.mark.parametrize("mutate", [
+        lambda payload, header: (payload + b" ", header),
+        lambda payload, header: (payload, header.replace("v1=", "v1=0")),
+        lambda payload, header: (payload, header.split(",")[0]),
+        lambda payload, header: (payload, "t=abc," + header.split(",")[1]),
+        lambda payload, header: (payload, "garbage"),
+        lambda payload, header: (payload, header + "\u00e9"),
+    ])
+    def test_tampered_or_malformed_is_rejected(self, mutate):
+        payload, header, timestamp = self._signed()
+        payload, header = mutate(payload, header)
+        with pytest.raises(ValueError):
+            verify_signature(payload, header, SECRET, now=timestamp)
+
+    def test_any_v1_signature_may_match(self):
+        payload, header, timestamp = self._signed()
+        # During a secret roll Stripe signs with both secrets
+        rolled = header.replace("v1=", f"v1={'0' * 64},v1=")
+        verify_signature(payload, rolled, SECRET, now=timestamp)
+        with pytest.raises(ValueError):
+            verify_signature(payload, header, "whsec_other", now=timestamp)
+
+    def test_stale_timestamp_is_rejected(self):
+        payload, header, timestamp = self._signed()
+        verify_signature(payload, header, SECRET, tolerance=300, now=timestamp + 300)
+        with pytest.raises(ValueError, match="tolerance"):
+            verify_signature(payload, header, SECRET, tolerance=300, now=timestamp + 301)
+        verify_signature(payload, header, SECRET, tolerance=0, now=timestamp + 86400)
+
+    def test_header_holds_routing_fields_only(self):
+        event = _event("invoice.paid", {"id": "in_sig", "object": "invoice", "subscription": "sub_sig"})
+        header = event_header(json.dumps(event).encode())
+        assert header == (event["id"], "invoice.paid", event["created"], "sub_sig")
+        for payload in (b"{", b"[]", b'{"id": "evt_1"}'):
+            with pytest.raises(ValueError, match="Invalid payload"):
+                event_header(payload)
+
+
+@pytest.mark.asyncio
+class TestWebhookIngestion:
+    """Test storing events on receipt and applying them in the consumers"""
+
+    async def test_verified_event_is_stored_and_acknowledged(self, client, async_db_session, monkeypatch, published_tasks):
+        monkeypatch.setattr(settings, "STRIPE_WEBHOOK_SECRET", SECRET)
+        event = _event("customer.subscription.updated", _subscription_object("sub_ingest"))
+        payload, headers = FakeStripe(webhook_secret=SECRET).signed(event)
+
+        response = await client.post("/api/v1/webhooks/stripe", content=payload, headers=headers)
+
+        assert response.status_code == status.HTTP_200_OK
+        row = (await async_db_session.execute(select(WebhookEvent))).scalar_one()
+        assert row.stripe_event_id == event["id"]
+        assert row.ordering_key == "sub_ingest"
+        assert row.status == WebhookEventStatus.PENDING
+        assert row.payload == payload.decode()
+        assert published_tasks == [(process_webhook_events.name, None, {"retry": False})]
+
+    async def test_replayed_delivery_is_rejected(self, client, async_db_session, monkeypatch):
+        monkeypatch.setattr(settings, "STRIPE_WEBHOOK_SECRET", SECRET)
+        fake = FakeStripe(webhook_secret=SECRET)
+        payload = json.dumps(_event("customer.subscription.updated", _subscription_object("sub_replay"))).encode()
+        stale = int(time.time()) - settings.STRIPE_WEBHOOK_TOLERANCE_SECONDS - 60
+
+        response = await client.post(
+            "/api/v1/webhooks/stripe", content=payload, headers={"Stripe-Signature": fake.sign(payload, stale)},
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert (await async_db_session.execute(select(WebhookEvent))).first() is None
+
+    async def test_unhandled_event_is_acknowledged_without_storing(self, client, async_db_session, monkeypatch):
+        monkeypatch.setattr(settings, "STRIPE_WEBHOOK_SECRET", SECRET)
+        payload, headers = FakeStripe(webhook_secret=SECRET).signed(_event("customer.created", {"id": "cus_1"}))
+
+        response = await client.post("/api/v1/webhooks/stripe", content=payload, headers=headers)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert (await async_db_session.execute(select(WebhookEvent))).first() is None
+
+    async def test_batch_applies_the_newest_event_per_row(self, task_db):
+        db = task_db
+        _, _, (first, second) = await _seed_subscriptions(db, 2, ended=False)
+        first.stripe_subscription_id, second.stripe_subscription_id = "sub_first", "sub_second"
+        await db.commit()
+        # Received out of order: Stripe's created decides
+        await _queue(
+            db,
+            _event("customer.subscription.deleted", _subscription_object("sub_first", "canceled"), created=1_790_000_002),
+            _event("customer.subscription.updated", _subscription_object("sub_first", "past_due"),
+                   created=1_790_000_001),
+            _event("customer.subscription.updated", _subscription_object("sub_second", "past_due")),
+            _event("customer.subscription.updated", _subscription_object("sub_unknown")),
+        )
+
+        stats = await process_events(database.AsyncSessionLocal, NOW, 10)
+
+        assert stats["claimed"] == 4
+        assert stats["processed"] == 4
+        assert stats["superseded"] == 1
+        await db.refresh(first)
+        await db.refresh(second)
+        assert first.status == SubscriptionStatus.CANCELED
+        assert second.status == SubscriptionStatus.PAST_DUE
+        rows = (await db.execute(select(WebhookEvent).execution_options(populate_existing=True))).scalars().all()
+        assert {row.status for row in rows} == {WebhookEventStatus.PROCESSED}
+
+    async def test_interleaved_claims_do_not_split_a_subscription(self, task_db):
+        db = task_db
+        first, second = await _queue(
+            db,
+            _event("customer.subscription.updated", _subscription_object("sub_split", "past_due"), created=1_790_000_001),
+            _event("customer.subscription.updated", _subscription_object("sub_split"), created=1_790_000_002),
+        )
+
+        # Consumer A locks the first event but has not committed its claim
+        async with database.AsyncSessionLocal() as a, database.AsyncSessionLocal() as b:
+            assert [row.id for row in await claim_events(a, NOW, 1)] == [first.id]
+
+            # SQLite has no row locks: hide A's row from B's FOR UPDATE scan, as SKIP LOCKED would
+            @sa_event.listens_for(b.sync_session, "do_orm_execute")
+            def skip_locked(state):
+                if state.is_select and state.statement._for_update_arg is not None:
+                    state.statement = state.statement.where(WebhookEvent.id != first.id)
+
+            assert await claim_events(b, NOW, 10) == []
+            await a.commit()
+
+        assert (await process_events(database.AsyncSessionLocal, NOW, 10))["claimed"] == 0
+        assert (await _row(db, second.id)).status == WebhookEventStatus.PENDING
+
+    async def test_periods_are_stored_in_utc_whatever_the_server_zone(self, task_db, monkeypatch):
+        db = task_db
+        monkeypatch.setenv("TZ", "Asia/Kolkata")
+        time.tzset()
+        try:
+            _, _, (local,) = await _seed_subscriptions(db, 1, ended=False)
+            local.stripe_subscription_id = "sub_zone"
+            await db.commit()
+            await _queue(db, _event("customer.subscription.updated", _subscription_object("sub_zone")))
+
+            await process_events(database.AsyncSessionLocal, NOW, 10)
+        finally:
+            monkeypatch.undo()
+            time.tzset()
+
+        await db.refresh(local)
+        # Same values the outbox and reconciliation store (stripe_service.from_timestamp)
+        assert local.current_period_start == datetime(2026, 9, 21, 14, 13, 20)
+        assert local.current_period_end == datetime(2026, 10, 21, 14, 13, 20)
+
+    async def test_batch_loads_targets_with_one_query_per_model(self, task_db):
+        db = task_db
+        _, _, subscriptions = await _seed_subscriptions(db, 20, ended=False)
+        events = []
+        for i, subscription in enumerate(subscriptions):
+            subscription.stripe_subscription_id = f"sub_many_{i}"
+            events += [
+                _event("customer.subscription.updated", _subscription_object(subscription.stripe_subscription_id),
+                       created=1_790_000_000 + n)
+                for n in range(5)
+            ]
+        await db.commit()
+        await _queue(db, *events)
+
+        counter = QueryCounter()
+        async with database.AsyncSessionLocal() as session:
+            rows = await claim_events(session, NOW, 200)
+            await session.commit()
+            async with counter.watch(session):
+                superseded = await apply_events(session, rows)
+                await session.flush()
+            await session.commit()
+
+        assert superseded == 80
+        # One SELECT of the 20 subscriptions, one executemany UPDATE of them
+        assert counter.count == 2
+
+    async def test_failing_event_is_retried_then_dead_lettered(self, task_db, monkeypatch):
+        db = task_db
+        monkeypatch.setattr(settings, "WEBHOOK_MAX_ATTEMPTS", 2)
+        broken, later = await _queue(
+            db,
+            # Unknown status: the handler raises every time
+            _event("customer.subscription.updated", _subscription_object("sub_broken", "paused_forever")),
+            _event("invoice.paid", {"id": "in_1", "object": "invoice", "subscription": "sub_broken"},
+                   created=1_790_000_001),
+        )
+        _, _, (local,) = await _seed_subscriptions(db, 1, ended=False)
+        local.stripe_subscription_id = "sub_broken"
+        await db.commit()
+
+        stats = await process_events(database.AsyncSessionLocal, NOW, 10)
+        assert stats["retried"] == 1
+        # The later event waits behind it without using up an attempt
+        assert stats["deferred"] == 1
+        row = await _row(db, broken.id)
+        retry_at = NOW + timedelta(seconds=settings.WEBHOOK_RETRY_BASE_SECONDS)
+        assert row.status == WebhookEventStatus.PENDING
+        assert row.next_attempt_at == retry_at
+        assert "paused_forever" in row.last_error
+        assert (await _row(db, later.id)).attempts == 0
+        assert (await process_events(database.AsyncSessionLocal, NOW, 10))["claimed"] == 0
+
+        stats = await process_events(database.AsyncSessionLocal, retry_at, 10)
+        # Dead-lettered events stop blocking the subscription
+        assert stats["dead"] == 1
+        assert stats["processed"] == 1
+        assert (await _row(db, broken.id)).status == WebhookEventStatus.DEAD_LETTER
+        assert (await _row(db, later.id)).status == WebhookEventStatus.PROCESSED
+
+
+@pytest.mark.asyncio
+class TestWebhookDeduplication:
+    """Test redelivered and out-of-order events"""
+
+    async def test_redelivery_is_stored_once(self, client, async_db_session, monkeypatch, published_tasks):
+        monkeypatch.setattr(settings, "STRIPE_WEBHOOK_SECRET", SECRET)
+        payload, headers = FakeStripe(webhook_secret=SECRET).signed(
+            _event("invoice.paid", {"id": "in_dup", "object": "invoice"})
+        )
+
+        statuses = [(await client.post("/api/v1/webhooks/stripe", content=payload, headers=headers)).json()["status"]]
+        # Seen in this process
+        statuses.append((await client.post("/api/v1/webhooks/stripe", content=payload, headers=headers)).json()["status"])
+        # Another process: the unique event id catches it
+        stripe_webhooks._seen_events.clear()
+        statuses.append((await client.post("/api/v1/webhooks/stripe", content=payload, headers=headers)).json()["status"])
+
+        assert statuses == ["received", "skipped", "skipped"]
+        assert len((await async_db_session.execute(select(WebhookEvent))).all()) == 1
+        assert len(published_tasks) == 1
+
+    async def test_older_subscription_event_is_a_no_op(self, task_db):
+        db = task_db
+        _, _, (local,) = await _seed_subscriptions(db, 1, ended=False)
+        local.stripe_subscription_id = "sub_late"
+        await db.commit()
+        await _queue(db, _event("customer.subscription.updated", _subscription_object("sub_late", "past_due"),
+                                created=1_790_000_010))
+        await process_events(database.AsyncSessionLocal, NOW, 10)
+
+        # Delivered late: Stripe created it before the one already applied
+        await _queue(db, _event("customer.subscription.updated", _subscription_object("sub_late", "active"),
+                                created=1_790_000_000))
+        assert (await process_events(database.AsyncSessionLocal, NOW, 10))["processed"] == 1
+
+        await db.refresh(local)
+        assert local.status == SubscriptionStatus.PAST_DUE
+        assert local.last_event_created == datetime.utcfromtimestamp(1_790_000_010)
+
+    async def test_older_payment_failure_does_not_reopen_a_paid_invoice(self, task_db):
+        db = task_db
+        _, (invoice,) = await _failed_invoices(db, 1)
+        await _queue(db, _event("invoice.paid", {"id": invoice.stripe_invoice_id, "object": "invoice"},
+                                created=1_790_000_010))
+        await process_events(database.AsyncSessionLocal, NOW, 10)
+
+        await _queue(db, _event("invoice.payment_failed", {"id": invoice.stripe_invoice_id, "object": "invoice"},
+                                created=1_790_000_000))
+        await process_events(database.AsyncSessionLocal, NOW, 10)
+
+        await db.refresh(invoice)
+        assert invoice.status == InvoiceStatus.PAID
+        assert (await db.execute(select(DunningAttempt))).first() is None